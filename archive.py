@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+### Codebench Dataset Extractor by Marcos Lima (marcos.lima@icomp.ufam.edu.br)
+### Universidade Federal do Amazonas - UFAM
+### Instituto de Computação - IComp
+
+import io
+import json
+import os
+import tarfile
+import util
+
+# Suffix of the sidecar file holding the member index of a dataset tarball
+INDEX_FILE_SUFFIX = '.idx'
+
+# Version of the index file layout, bumped whenever the layout changes
+INDEX_FORMAT_VERSION = 1
+
+
+def member_parts(name: str):
+    """
+    Splits a tar member name into its path components.
+
+    Parameters:
+        name (str): The member name as stored in the archive (e.g. './2016-1/10/users/1234/user.data').
+
+    Returns:
+        list: The non-empty path components, without any leading './'.
+    """
+    return [part for part in name.split('/') if part and part != '.']
+
+
+def index_path(path: str):
+    """Returns the path of the sidecar index file of a dataset tarball."""
+    return path + INDEX_FILE_SUFFIX
+
+
+def archive_fingerprint(path: str):
+    """
+    Returns the size and modification time of a dataset tarball.
+
+    The fingerprint is stored in the index file, so an index built for a different
+    version of the archive is never used.
+    """
+    stat = os.stat(path)
+    return {'version': INDEX_FORMAT_VERSION, 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+
+def load_index(path: str):
+    """
+    Loads the sidecar index of a dataset tarball.
+
+    Each index line holds the header offset, the data offset and the size of a regular file member,
+    followed by its name. Offsets are relative to the uncompressed tar stream.
+
+    Parameters:
+        path (str): The path to the dataset tarball.
+
+    Returns:
+        list: A list of (offset, offset_data, size, name) tuples in archive order, or None when
+            there is no index or it was built for another version of the archive.
+    """
+    try:
+        with open(index_path(path), mode='r', encoding=util.DEFAULT_FILE_ENCODING) as f:
+            if json.loads(f.readline()) != archive_fingerprint(path):
+                util.Logger.warn(f'Ignoring outdated archive index: {index_path(path)}')
+                return None
+            entries = []
+            for line in f:
+                offset, offset_data, size, name = line.rstrip('\n').split('\t', 3)
+                entries.append((int(offset), int(offset_data), int(size), name))
+            return entries
+    except FileNotFoundError:
+        return None
+
+
+def save_index(path: str, entries):
+    """
+    Saves the sidecar index of a dataset tarball.
+
+    The index is written to a temporary file first and then renamed, so an interrupted
+    run never leaves a truncated index behind.
+
+    Parameters:
+        path (str): The path to the dataset tarball.
+        entries (list): The (offset, offset_data, size, name) tuples of the regular file members.
+    """
+    temp_path = index_path(path) + '.tmp'
+    try:
+        with open(temp_path, mode='w', encoding=util.DEFAULT_FILE_ENCODING) as f:
+            f.write(json.dumps(archive_fingerprint(path)) + '\n')
+            for offset, offset_data, size, name in entries:
+                f.write(f'{offset}\t{offset_data}\t{size}\t{name}\n')
+        os.replace(temp_path, index_path(path))
+        util.Logger.info(f'Archive index saved: {index_path(path)}')
+    except OSError as err:
+        util.Logger.warn(f'Could not save archive index {index_path(path)}: {err}')
+
+
+def iter_members(path: str, select=None, use_index=True):
+    """
+    Iterates over the regular file members of a dataset tarball in archive order.
+
+    When the archive has an up-to-date sidecar index, only the selected members are visited and
+    their content is read by seeking straight to it. Otherwise the archive is read sequentially in
+    stream mode and the index is built along the way, to be reused by the next runs.
+    Nothing is extracted to disk in either case.
+
+    Parameters:
+        path (str): The path to the dataset tarball (plain or compressed).
+        select (function, optional): Receives the member path components and returns whether
+            the member is needed. All members are visited when not provided.
+        use_index (bool): Whether to read and build the sidecar index.
+
+    Yields:
+        tuple: The member path components and a function that returns the member content
+            as an in-memory binary buffer. The function must be called before moving to the next member.
+    """
+    entries = load_index(path) if use_index else None
+    if entries is None:
+        yield from _iter_streamed_members(path, select, use_index)
+    else:
+        util.Logger.info(f'Using archive index: {index_path(path)}')
+        yield from _iter_indexed_members(path, entries, select)
+
+
+def iter_member_sizes(path: str, use_index=True):
+    """
+    Iterates over the regular file members of a dataset tarball in archive order, without reading their content.
+
+    The sizes are taken from the sidecar index when it is up to date; otherwise the member headers are
+    read in stream mode, skipping the content, and the index is built along the way.
+
+    Parameters:
+        path (str): The path to the dataset tarball (plain or compressed).
+        use_index (bool): Whether to read and build the sidecar index.
+
+    Yields:
+        tuple: The member path components and the member size in bytes.
+    """
+    entries = load_index(path) if use_index else None
+    if entries is None:
+        entries = []
+        with tarfile.open(path, mode='r|*') as tar:
+            for member in tar:
+                if member.isfile():
+                    entries.append((member.offset, member.offset_data, member.size, member.name))
+                    yield member_parts(member.name), member.size
+        if use_index:
+            save_index(path, entries)
+    else:
+        util.Logger.info(f'Using archive index: {index_path(path)}')
+        for offset, offset_data, size, name in entries:
+            yield member_parts(name), size
+
+
+def _iter_streamed_members(path, select, build_index):
+    entries = []
+    with tarfile.open(path, mode='r|*') as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            entries.append((member.offset, member.offset_data, member.size, member.name))
+            parts = member_parts(member.name)
+            if select is None or select(parts):
+                yield parts, lambda member=member: io.BytesIO(tar.extractfile(member).read())
+    if build_index:
+        save_index(path, entries)
+
+
+def _iter_indexed_members(path, entries, select):
+    # In random access mode the tar file object is the decompressed stream, so the
+    # offsets recorded in the index can be used directly.
+    with tarfile.open(path, mode='r:*') as tar:
+        fileobj = tar.fileobj
+        for offset, offset_data, size, name in entries:
+            parts = member_parts(name)
+            if select is None or select(parts):
+                def read_member(offset_data=offset_data, size=size):
+                    fileobj.seek(offset_data)
+                    return io.BytesIO(fileobj.read(size))
+                yield parts, read_member
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+### Codebench Dataset Extractor by Marcos Lima (marcos.lima@icomp.ufam.edu.br)
+### Universidade Federal do Amazonas - UFAM
+### Instituto de Computação - IComp
+
+import inventory
+import io
+import json
+import math
+import os
+import pipeline
+import platform
+import time
+import tracemalloc
+import util
+
+from datetime import datetime
+
+# Version of the tuning file layout, bumped whenever the layout or the meaning of a setting changes
+TUNE_FILE_VERSION = 1
+
+# Kinds of files timed by the calibration: the ones that dominate the extraction time
+TUNE_KINDS = ['executions', 'codes', 'codemirror']
+
+# Number of files of each kind read and extracted by the calibration
+TUNE_SAMPLE_SIZE = 50
+
+# Memory the buffered rows of one output dataset may take, in bytes; it bounds the batch size
+BATCH_MEMORY_BUDGET = 32 * 1024 * 1024
+
+# Bounds of the tuned settings
+MIN_BATCH_SIZE = 100
+MAX_BATCH_SIZE = 100000
+MAX_IO_THREADS = 32
+MIN_QUEUE_SIZE = 16
+MAX_QUEUE_SIZE = 1024
+
+# Command-line options set by the tuning (argparse destinations)
+TUNED_OPTIONS = ['workers', 'io_threads', 'parse_threads', 'metrics_processes', 'queue_size', 'batch_size']
+
+
+def machine():
+    """Returns what identifies the machine the settings were tuned on: its name and number of CPUs."""
+    return {'node': platform.node(), 'cpu_count': os.cpu_count() or 1}
+
+
+def calibrate(dataset_path: str, dataset_filter, use_index: bool = True, sample_size: int = TUNE_SAMPLE_SIZE):
+    """
+    Reads and extracts a sample of the executions, solutions and CodeMirror logs of a dataset, measuring the costs the settings depend on.
+
+    The files are timed without the metrics cache. The memory of the extracted rows is measured in a second
+    pass with tracemalloc, so tracing does not slow down the timed pass.
+
+    Parameters:
+        dataset_path (str): The dataset directory or tarball.
+        dataset_filter (DatasetFilter): Selects the semesters, courses and users to sample from.
+        use_index (bool): Whether to use the sidecar member index of a tarball.
+        sample_size (int): The number of files of each kind to extract.
+
+    Returns:
+        dict: For each kind, the number of files, bytes and records of the sample, the time spent reading
+            them (io), parsing them (parse, CPU time) and computing their code metrics (metrics, CPU time)
+            in seconds, and the memory of the extracted rows (row_bytes).
+    """
+    if os.path.isdir(dataset_path):
+        dataset_inventory = inventory.Inventory.from_directory(dataset_path, dataset_filter, sample_size)
+    else:
+        dataset_inventory = inventory.Inventory.from_archive(dataset_path, dataset_filter, use_index, sample_size)
+    start = time.perf_counter()
+    # The extraction closes the buffers, so each pass reads the content again from the bytes
+    samples = [(kind, args, path, content.getvalue()) for kind, args, path, content in inventory.read_samples(dataset_inventory, dataset_path, use_index, TUNE_KINDS)]
+    io_time = time.perf_counter() - start
+    total_bytes = sum(len(content) for kind, args, path, content in samples) or 1
+
+    measurements = {kind: {'files': 0, 'bytes': 0, 'records': 0, 'io': 0.0, 'parse': 0.0, 'metrics': 0.0, 'row_bytes': 0} for kind in TUNE_KINDS}
+    metrics_time = [0.0]
+
+    def extract_metrics(obj, code):
+        start = time.process_time()
+        util.apply_code_metrics(obj, util.compute_code_metrics(code))
+        metrics_time[0] += time.process_time() - start
+
+    for kind, args, path, content in samples:
+        size = len(content)
+        task = pipeline.Task(None, inventory.FILE_KINDS[kind][0], path, path, args)
+        metrics_time[0] = 0.0
+        start = time.process_time()
+        try:
+            rows = [obj.as_list() for obj in pipeline.PARSERS[task.key](task, io.BytesIO(content), extract_metrics)]
+        except Exception as err:
+            util.Logger.warn(f'Calibration failed on {path}: {err}')
+            continue
+        elapsed = time.process_time() - start
+        measurement = measurements[kind]
+        measurement['files'] += 1
+        measurement['bytes'] += size
+        measurement['records'] += len(rows)
+        # The reads are timed together, so each file takes its share by size
+        measurement['io'] += io_time * size / total_bytes
+        measurement['parse'] += elapsed - metrics_time[0]
+        measurement['metrics'] += metrics_time[0]
+
+    tracemalloc.start()
+    try:
+        for kind, args, path, content in samples:
+            task = pipeline.Task(None, inventory.FILE_KINDS[kind][0], path, path, args)
+            before = tracemalloc.get_traced_memory()[0]
+            try:
+                rows = [obj.as_list() for obj in pipeline.PARSERS[task.key](task, io.BytesIO(content), extract_metrics)]
+            except Exception:
+                continue
+            measurements[kind]['row_bytes'] += tracemalloc.get_traced_memory()[0] - before
+            del rows
+    finally:
+        tracemalloc.stop()
+    return measurements
+
+
+def choose_settings(measurements: dict, cpu_count: int):
+    """
+    Chooses the worker, thread and batch settings from the calibration measurements.
+
+    - workers / metrics_processes: one process per CPU, leaving one for the main process that walks the
+      dataset and writes the rows.
+    - io_threads: enough reads in flight to feed the worker processes, from the read and CPU times.
+    - parse_threads: parsing holds the GIL, so a second thread only helps when parsing takes a large share.
+    - batch_size: as many rows as fit in BATCH_MEMORY_BUDGET, given the average memory of a row.
+    - queue_size: a few tasks per thread or process of the busiest pipeline stage.
+
+    Parameters:
+        measurements (dict): The measurements by kind, as returned by calibrate.
+        cpu_count (int): The number of CPUs of the machine.
+
+    Returns:
+        dict: The setting of each option in TUNED_OPTIONS.
+    """
+    io_time = sum(measurement['io'] for measurement in measurements.values())
+    parse_time = sum(measurement['parse'] for measurement in measurements.values())
+    metrics_time = sum(measurement['metrics'] for measurement in measurements.values())
+    cpu_time = parse_time + metrics_time
+    records = sum(measurement['records'] for measurement in measurements.values())
+    row_bytes = sum(measurement['row_bytes'] for measurement in measurements.values())
+
+    workers = max(cpu_count - 1, 1) if cpu_count > 2 else cpu_count
+    io_threads = 1 if cpu_time <= 0 else min(max(math.ceil(workers * io_time / cpu_time), 1), MAX_IO_THREADS)
+    parse_threads = 2 if cpu_time > 0 and parse_time / cpu_time > 0.5 else 1
+    bytes_per_record = row_bytes / records if records else 0
+    if bytes_per_record > 0:
+        batch_size = min(max(int(BATCH_MEMORY_BUDGET / bytes_per_record) // MIN_BATCH_SIZE * MIN_BATCH_SIZE, MIN_BATCH_SIZE), MAX_BATCH_SIZE)
+    else:
+        batch_size = util.CSV_BATCH_SIZE
+    queue_size = min(max(4 * max(io_threads, workers), MIN_QUEUE_SIZE), MAX_QUEUE_SIZE)
+    return {
+        'workers': workers,
+        'io_threads': io_threads,
+        'parse_threads': parse_threads,
+        'metrics_processes': workers,
+        'queue_size': queue_size,
+        'batch_size': batch_size
+    }
+
+
+def save_settings(path: str, settings: dict, measurements: dict):
+    """
+    Saves the tuned settings, along with the machine and the measurements they were chosen from.
+
+    The file is written to a temporary file first and then renamed, so an interrupted run never
+    leaves a truncated file behind.
+    """
+    content = {
+        'version': TUNE_FILE_VERSION,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'machine': machine(),
+        'settings': settings,
+        'measurements': measurements
+    }
+    temp_path = path + '.tmp'
+    with open(temp_path, mode='w', encoding=util.DEFAULT_FILE_ENCODING) as f:
+        json.dump(content, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def load_settings(path: str):
+    """
+    Loads the settings saved by a calibration run.
+
+    Parameters:
+        path (str): The tuning file.
+
+    Returns:
+        tuple: The settings, or None if there is no file or it was saved by another version or on
+            another machine, and the reason they were not loaded (None when they were).
+    """
+    try:
+        with open(path, mode='r', encoding=util.DEFAULT_FILE_ENCODING) as f:
+            content = json.load(f)
+    except FileNotFoundError:
+        return None, None
+    except (OSError, ValueError) as err:
+        return None, f'could not read {path}: {err}'
+    if content.get('version') != TUNE_FILE_VERSION:
+        return None, f'{path} was saved by another version, run --auto-tune again'
+    if content.get('machine') != machine():
+        return None, f'{path} was tuned on another machine ({content.get("machine")}), run --auto-tune again'
+    return {option: value for option, value in content.get('settings', {}).items() if option in TUNED_OPTIONS}, None
+
+
+def format_settings(settings: dict):
+    """Returns the settings as command-line options (e.g. '--workers 7 --batch-size 5000')."""
+    return ' '.join(f'--{option.replace("_", "-")} {value}' for option, value in settings.items())
@@ -0,0 +1,510 @@
+# -*- coding: utf-8 -*-
+"""
+Codebench Dataset Extractor Benchmarks
+
+Times each extraction function over a fixed dataset (a small synthetic dataset written from a fixed
+seed, see synthetic.py), along with the code metrics, save_to_csv and a full run of main.py, and
+records their throughput and peak memory. The results can be saved as a JSON baseline, and later runs
+compared against it, failing when a benchmark got slower than the baseline by more than a threshold.
+
+Example:
+    python3 benchmark.py --save benchmark.json
+    python3 benchmark.py --baseline benchmark.json --threshold 0.2
+"""
+import argparse
+import autotune
+import inventory
+import io
+import json
+import logging
+import os
+import pandas as pd
+import report
+import subprocess
+import sys
+import synthetic
+import tempfile
+import time
+import tracemalloc
+import types
+import util
+
+from collections import defaultdict
+from datetime import datetime
+
+try:
+    import pyarrow # pandas keeps its string columns in Arrow buffers when it is installed
+except ImportError:
+    pyarrow = None
+
+# Version of the benchmark file layout, bumped whenever a benchmark changes what it measures
+BENCHMARK_FILE_VERSION = 1
+
+# Number of timed runs of each benchmark; the fastest one is kept
+BENCHMARK_REPEAT = 3
+
+# Minimum seconds of a timed run; faster benchmarks are run several times in a row and averaged
+BENCHMARK_MIN_TIME = 0.2
+
+# Fraction a benchmark may be slower than its baseline before the comparison fails
+BENCHMARK_THRESHOLD = 0.2
+
+# Volume and seed of the synthetic dataset the benchmarks run on
+BENCHMARK_DATASET = {
+    'seed': 20240101,
+    'semesters': 1,
+    'courses': 2,
+    'users': 5,
+    'assignments': 3,
+    'problems': 3,
+    'attempts': 4,
+    'code_lines': 20,
+    'test_cases': 3,
+    'events': 100,
+    'logins': 30,
+    'error_rate': 0.1
+}
+
+# Extraction options of the full run
+BENCHMARK_RUN_OPTIONS = ['--executions', '--solutions', '--logins', '--grades', '--codemirror']
+
+
+def load_fixture(dataset_path: str):
+    """
+    Reads every file of a dataset directory into memory, so the benchmarks time the parsing and not the disk.
+
+    Parameters:
+        dataset_path (str): The dataset directory.
+
+    Returns:
+        dict: A (extraction arguments, path, content) tuple for each file, in a list by kind: the kinds of
+            inventory.FILE_KINDS and 'assignments'.
+    """
+    fixture = defaultdict(list)
+    dataset_inventory = inventory.Inventory.from_directory(dataset_path, util.DatasetFilter(), sys.maxsize)
+    for kind, args, path, content in inventory.read_samples(dataset_inventory, dataset_path):
+        fixture[kind].append((args, path, content.getvalue()))
+    for semester_entry in util.scan_directory(dataset_path):
+        for course_entry in util.scan_directory(semester_entry.path):
+            for assignment_entry in util.scan_directory(os.path.join(course_entry.path, 'assessments')):
+                with open(assignment_entry.path, mode='rb') as f:
+                    fixture['assignments'].append(((semester_entry.name, course_entry.name), assignment_entry.path, f.read()))
+    for files in fixture.values():
+        files.sort(key=lambda file: file[1])
+    return fixture
+
+
+def file_benchmark(fixture, kind: str, extract):
+    """
+    Returns a benchmark that extracts every file of a kind.
+
+    Parameters:
+        fixture (dict): The files of the dataset, as returned by load_fixture.
+        kind (str): The kind of files to extract.
+        extract (function): Called with the extraction arguments, the path and the content stream of a
+            file; returns the objects extracted.
+    """
+    files = fixture[kind]
+
+    def run():
+        return sum(len(extract(args, path, io.BytesIO(content))) for args, path, content in files)
+    return run, sum(len(content) for args, path, content in files)
+
+
+def code_benchmark(codes, extract):
+    """Returns a benchmark that calls a code metrics function on every code."""
+    def run():
+        for code in codes:
+            extract(types.SimpleNamespace(), code)
+        return len(codes)
+    return run, sum(len(code.encode(util.DEFAULT_FILE_ENCODING)) for code in codes)
+
+
+def save_benchmark(fixture, work_dir: str):
+    """Returns a benchmark that saves the rows extracted from every file with save_to_csv, each run in a new directory."""
+    data_dict = defaultdict(list)
+    logging.disable(logging.ERROR)
+    for kind, files in fixture.items():
+        key = util.CODE_ASSIGNMENT if kind == 'assignments' else inventory.FILE_KINDS[kind][0]
+        for args, path, content in files:
+            data_dict[key].extend(obj.as_list() for obj in PARSERS[kind](args, path, io.BytesIO(content)))
+    logging.disable(logging.NOTSET)
+    runs = [0]
+
+    def run():
+        runs[0] += 1
+        output_dir = util.CSV_FILE_OUTPUT_DIR
+        util.CSV_FILE_OUTPUT_DIR = os.path.join(work_dir, f'save-{runs[0]}')
+        try:
+            util.save_to_csv(data_dict)
+        finally:
+            util.CSV_FILE_OUTPUT_DIR = output_dir
+        return sum(len(rows) for rows in data_dict.values())
+    return run
+
+
+def run_main(dataset_path: str, work_dir: str):
+    """
+    Runs main.py on a dataset with every extraction option, extracting the users one by one with process_directories.
+
+    Returns:
+        dict: The run report of the run.
+    """
+    report_file = os.path.join(work_dir, 'report.json')
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py'), '-ds', os.path.abspath(dataset_path)]
+    command += BENCHMARK_RUN_OPTIONS + ['--workers', '1', '--schedule', 'users', '--file-messages', 'none', '--report', '--report-file', report_file]
+    subprocess.run(command, cwd=work_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    with open(report_file, mode='r', encoding=util.DEFAULT_FILE_ENCODING) as f:
+        return json.load(f)
+
+
+def measure(run, repeat: int, min_time: float = BENCHMARK_MIN_TIME):
+    """
+    Times a benchmark, keeping the fastest of its runs, and measures its peak memory with tracemalloc in an extra run.
+
+    A benchmark faster than min_time is run several times in a row in each timed run, as timeit does, so
+    the short ones are not dominated by the clock resolution and the noise. The errors logged by the
+    extraction (the broken codes of the dataset) are expected, so logging is turned off meanwhile.
+
+    Returns:
+        tuple: The number of records, the seconds of the fastest run and the peak memory in bytes.
+    """
+    logging.disable(logging.ERROR)
+    try:
+        loops = 1
+        while True:
+            start = time.perf_counter()
+            for i in range(loops):
+                records = run()
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+            loops *= 2
+        seconds = elapsed / loops
+        for i in range(repeat - 1):
+            start = time.perf_counter()
+            for j in range(loops):
+                run()
+            seconds = min(seconds, (time.perf_counter() - start) / loops)
+        tracemalloc.start()
+        try:
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    finally:
+        logging.disable(logging.NOTSET)
+    return records, seconds, peak
+
+
+def result(records: int, n_bytes: int, seconds: float, peak: int, memory: str):
+    """Returns the result of a benchmark as a JSON-serializable dict."""
+    return {
+        'records': records,
+        'bytes': n_bytes,
+        'seconds': seconds,
+        'records_per_second': records / seconds if seconds else None,
+        'mb_per_second': n_bytes / seconds / 1e6 if seconds and n_bytes else None,
+        'peak_memory': peak,
+        'memory': memory
+    }
+
+
+# Extraction function of each kind of file, called with the extraction arguments, the path and the content stream
+PARSERS = {
+    'assignments': lambda args, path, file: [util.extract_assignment(*args, path, file)],
+    'user': lambda args, path, file: [util.extract_user(*args, path, file)],
+    'executions': lambda args, path, file: list(util.extract_executions(*args, path, file)),
+    'codes': lambda args, path, file: [util.extract_solution(*args, path, file)],
+    'logins': lambda args, path, file: util.extract_user_logins(*args, path, file),
+    'grades': lambda args, path, file: [util.extract_grade(*args, path, file)],
+    'codemirror': lambda args, path, file: util.extract_codemirror_events(*args, path, file)
+}
+
+# Benchmarked extraction function of each kind of file
+FILE_BENCHMARKS = {
+    'extract_assignment': 'assignments',
+    'extract_user': 'user',
+    'extract_executions': 'executions',
+    'extract_solution': 'codes',
+    'extract_user_logins': 'logins',
+    'extract_grade': 'grades',
+    'extract_codemirror_events': 'codemirror'
+}
+
+# Benchmarked code metrics functions, each called on its own as extract_code_metrics calls them
+CODE_BENCHMARKS = {
+    'extract_code_metrics': lambda obj, code: util.apply_code_metrics(obj, util.compute_code_metrics(code)),
+    'extract_complexity_metrics': util.extract_complexity_metrics,
+    'extract_size_metrics': util.extract_size_metrics,
+    'extract_halstead_metrics': util.extract_halstead_metrics,
+    'extract_token_metrics': util.extract_token_metrics
+}
+
+# Every benchmark, in the order they run
+BENCHMARKS = list(FILE_BENCHMARKS) + list(CODE_BENCHMARKS) + ['save_to_csv', 'process_directories']
+
+
+def run_benchmarks(dataset_path: str, names, repeat: int = BENCHMARK_REPEAT):
+    """
+    Runs benchmarks over a dataset directory, without the metrics cache so every code is analyzed.
+
+    Parameters:
+        dataset_path (str): The dataset directory.
+        names (list): The benchmarks to run, from BENCHMARKS.
+        repeat (int): The number of timed runs of each benchmark.
+
+    Returns:
+        dict: The result of each benchmark, by name.
+    """
+    util.MetricsCache.configure(None, 0)
+    fixture = load_fixture(dataset_path)
+    codes = [content.decode(util.DEFAULT_FILE_ENCODING) for args, path, content in fixture['codes']]
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='benchmark-') as work_dir:
+        for name in names:
+            if name in FILE_BENCHMARKS:
+                run, n_bytes = file_benchmark(fixture, FILE_BENCHMARKS[name], PARSERS[FILE_BENCHMARKS[name]])
+            elif name in CODE_BENCHMARKS:
+                run, n_bytes = code_benchmark(codes, CODE_BENCHMARKS[name])
+            elif name == 'save_to_csv':
+                run, n_bytes = save_benchmark(fixture, work_dir), None
+            else:
+                seconds, content = None, None
+                for i in range(repeat):
+                    run_dir = os.path.join(work_dir, f'run-{i}')
+                    os.makedirs(run_dir)
+                    content = run_main(dataset_path, run_dir)
+                    elapsed = content['timings']['extraction']
+                    seconds = elapsed if seconds is None else min(seconds, elapsed)
+                results[name] = result(sum(content['counts']['rows'].values()), content['dataset']['bytes'], seconds, content['peak_memory']['main'], 'rss')
+                util.Logger.info(f'Benchmark {name}: {format_result(results[name])}')
+                continue
+            records, seconds, peak = measure(run, repeat)
+            if name == 'save_to_csv':
+                # The throughput of save_to_csv is taken from the bytes it writes
+                n_bytes = report.output_size(os.path.join(work_dir, 'save-1'))
+            results[name] = result(records, n_bytes, seconds, peak, 'tracemalloc')
+            util.Logger.info(f'Benchmark {name}: {format_result(results[name])}')
+    return results
+
+
+def memory_benchmark(dataset_path: str):
+    """
+    Measures with tracemalloc where the memory of the extraction goes, for each kind of file, without the
+    metrics cache so its entries are not counted.
+
+    The stages are measured one after the other on every file of the kind, as the extraction goes:
+    - parse: the model objects returned by the extraction function (extract_executions, extract_codemirror_events, ...);
+    - as_list: the row lists copied from the objects, while the objects are still alive;
+    - rows: the row lists once the objects are freed, as kept in data_lists or in a writer batch;
+    - dataframe: the pandas DataFrame built from the rows by save_to_csv;
+    - to_csv: the writing of the DataFrame by save_to_csv, which only has a peak.
+
+    The Arrow buffers of the string columns of pandas are not seen by tracemalloc, so the bytes allocated
+    by Arrow are added to the retained memory; their peak is not measured. Every stage runs once on a
+    file of each kind before measuring, so the caches and imports of the first call are not counted.
+
+    Parameters:
+        dataset_path (str): The dataset directory.
+
+    Returns:
+        dict: For each kind, its model class, number of records and input bytes, and the memory retained
+            and the peak of each stage in bytes, with the bytes per record.
+    """
+    util.MetricsCache.configure(None, 0)
+    fixture = load_fixture(dataset_path)
+    memory = {}
+
+    def allocated():
+        return tracemalloc.get_traced_memory()[0] + (pyarrow.total_allocated_bytes() if pyarrow is not None else 0)
+
+    def stage(before, n_records):
+        current, peak = allocated(), tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        return {'retained': current - before, 'peak': peak - before, 'bytes_per_record': (current - before) / n_records if n_records else None}
+
+    def extract(kind, files, work_dir, measure=False):
+        key = util.CODE_ASSIGNMENT if kind == 'assignments' else inventory.FILE_KINDS[kind][0]
+        stages = {}
+        tracemalloc.reset_peak()
+        before = allocated()
+        objects = [obj for args, path, content in files for obj in PARSERS[kind](args, path, io.BytesIO(content))]
+        n_records = len(objects)
+        stages['parse'] = stage(before, n_records)
+        model_class = type(objects[0]).__name__ if objects else None
+        middle = allocated()
+        rows = [obj.as_list() for obj in objects]
+        stages['as_list'] = stage(middle, n_records)
+        del objects
+        stages['rows'] = stage(before, n_records)
+        middle = allocated()
+        # The DataFrame is built and written as save_to_csv does it
+        df = pd.DataFrame(rows, columns=util.CSV_HEADERS[key]())
+        stages['dataframe'] = stage(middle, n_records)
+        middle = allocated()
+        df.to_csv(os.path.join(work_dir, util.CSV_FILENAMES[key]), sep=',', index=False, encoding='utf-8', quoting=2)
+        stages['to_csv'] = stage(middle, n_records)
+        stages['to_csv']['retained'] = stages['to_csv']['bytes_per_record'] = None
+        return {'model': model_class, 'records': n_records, 'bytes': sum(len(content) for args, path, content in files), 'stages': stages}
+
+    logging.disable(logging.ERROR)
+    try:
+        with tempfile.TemporaryDirectory(prefix='benchmark-') as work_dir:
+            for kind, files in sorted(fixture.items()):
+                extract(kind, files[:1], work_dir)
+            tracemalloc.start()
+            for kind, files in sorted(fixture.items()):
+                memory[kind] = extract(kind, files, work_dir)
+    finally:
+        tracemalloc.stop()
+        logging.disable(logging.NOTSET)
+    return memory
+
+
+def format_memory(kind: str, measurement: dict):
+    """Returns the memory measured for a kind of file as text."""
+    stages = measurement['stages']
+    parts = [f'{measurement["records"]} {measurement["model"]} records from {inventory.format_size(measurement["bytes"])}']
+    for name in ['parse', 'as_list', 'rows', 'dataframe']:
+        bytes_per_record = stages[name]['bytes_per_record']
+        per_record = f' ({bytes_per_record:.0f} B/record)' if bytes_per_record is not None else ''
+        parts.append(f'{name} {inventory.format_size(stages[name]["retained"])}{per_record}, peak {inventory.format_size(stages[name]["peak"])}')
+    parts.append(f'to_csv peak {inventory.format_size(stages["to_csv"]["peak"])}')
+    return f'Memory {kind}: ' + '; '.join(parts)
+
+
+def format_result(result: dict):
+    """Returns the result of a benchmark as text."""
+    mb_per_second = f', {result["mb_per_second"]:.2f} MB/s' if result['mb_per_second'] is not None else ''
+    return (f'{result["seconds"]:.4f}s, {result["records"]} records ({result["records_per_second"]:.0f}/s){mb_per_second}, '
+            f'peak memory {inventory.format_size(result["peak_memory"])} ({result["memory"]})')
+
+
+def compare(results: dict, baseline: dict, threshold: float = BENCHMARK_THRESHOLD):
+    """
+    Compares benchmark results against a baseline.
+
+    Parameters:
+        results (dict): The result of each benchmark, as returned by run_benchmarks.
+        baseline (dict): The results of the baseline, by benchmark name.
+        threshold (float): The fraction a benchmark may be slower than its baseline.
+
+    Returns:
+        list: A (name, seconds, baseline seconds) tuple for each benchmark slower than the threshold allows.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None or not previous['seconds']:
+            continue
+        ratio = current['seconds'] / previous['seconds']
+        util.Logger.info(f'Benchmark {name}: {current["seconds"]:.4f}s, baseline {previous["seconds"]:.4f}s ({100 * (ratio - 1):+.1f}%)')
+        if ratio > 1 + threshold:
+            regressions.append((name, current['seconds'], previous['seconds']))
+    return regressions
+
+
+def compare_memory(memory: dict, baseline: dict, threshold: float = BENCHMARK_THRESHOLD):
+    """
+    Compares the memory of each stage against a baseline.
+
+    Parameters:
+        memory (dict): The memory of each kind of file, as returned by memory_benchmark.
+        baseline (dict): The memory of the baseline, by kind of file.
+        threshold (float): The fraction the peak of a stage may exceed its baseline.
+
+    Returns:
+        list: A (kind, stage, peak, baseline peak) tuple for each stage whose peak exceeds the threshold.
+    """
+    regressions = []
+    for kind, measurement in memory.items():
+        for name, current in measurement['stages'].items():
+            previous = baseline.get(kind, {}).get('stages', {}).get(name)
+            if previous is not None and previous['peak'] > 0 and current['peak'] > previous['peak'] * (1 + threshold):
+                regressions.append((kind, name, current['peak'], previous['peak']))
+    return regressions
+
+
+def save_results(path: str, dataset: dict, repeat: int, results: dict, memory: dict = None):
+    """Saves benchmark results as a baseline, along with the machine and the dataset they were measured on."""
+    content = {
+        'version': BENCHMARK_FILE_VERSION,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'machine': autotune.machine(),
+        'dataset': dataset,
+        'repeat': repeat,
+        'results': results,
+        'memory': memory
+    }
+    temp_path = path + '.tmp'
+    with open(temp_path, mode='w', encoding=util.DEFAULT_FILE_ENCODING) as f:
+        json.dump(content, f, indent=2)
+    os.replace(temp_path, path)
+
+
+# Main execution starts here
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the extraction functions over a fixed synthetic dataset")
+    parser.add_argument('--benchmarks', help="Benchmarks to run (default: all)", nargs='+', choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument('--repeat', help="Number of timed runs of each benchmark; the fastest one is kept", type=int, default=BENCHMARK_REPEAT)
+    parser.add_argument('--dataset', help="Dataset directory to run on instead of the synthetic dataset", type=str, default=None)
+    parser.add_argument('--save', help="Save the results as a JSON baseline to this file", type=str, default=None)
+    parser.add_argument('--baseline', help="JSON baseline to compare the results against", type=str, default=None)
+    parser.add_argument('--threshold', help="Fraction a benchmark may be slower (or, with --memory, a stage may take more memory) than the baseline before the comparison fails (e.g. 0.2 for 20%%)", type=float, default=BENCHMARK_THRESHOLD)
+    parser.add_argument('--memory', dest='memory', action='store_true', help="Measure the memory taken by each extraction stage and the bytes per record of each model class, instead of the timings")
+    parser.add_argument('--no-memory', dest='memory', action='store_false', help="Measure the timings")
+    parser.set_defaults(memory=False)
+    args = parser.parse_args()
+
+    util.Logger.configure('none')
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, mode='r', encoding=util.DEFAULT_FILE_ENCODING) as f:
+            baseline = json.load(f)
+        if baseline.get('version') != BENCHMARK_FILE_VERSION:
+            util.Logger.error(f'{args.baseline} was saved by another version of the benchmarks, save a new baseline. Exiting...')
+            exit(1)
+        if baseline.get('machine') != autotune.machine():
+            util.Logger.warn(f'{args.baseline} was measured on another machine ({baseline.get("machine")}), the timings may not be comparable')
+
+    with tempfile.TemporaryDirectory(prefix='benchmark-dataset-') as dataset_dir:
+        if args.dataset:
+            dataset_path = args.dataset
+            dataset = report.dataset_fingerprint(dataset_path)
+        else:
+            dataset_path = os.path.join(dataset_dir, 'dataset')
+            synthetic.SyntheticDataset(**BENCHMARK_DATASET).write_directory(dataset_path)
+            dataset = dict(report.dataset_fingerprint(dataset_path), synthetic=BENCHMARK_DATASET)
+        if baseline is not None and baseline.get('dataset', {}).get('sha256') != dataset['sha256']:
+            util.Logger.error(f'{args.baseline} was measured on another dataset, save a new baseline. Exiting...')
+            exit(1)
+        results, memory = None, None
+        if args.memory:
+            util.Logger.info(f'Measuring the memory of the extraction stages on {args.dataset or "the synthetic dataset"}: {dataset["files"]} files, {inventory.format_size(dataset["bytes"])}')
+            memory = memory_benchmark(dataset_path)
+            for kind, measurement in memory.items():
+                util.Logger.info(format_memory(kind, measurement))
+            rows_bytes = sum(measurement['stages']['rows']['retained'] for measurement in memory.values())
+            util.Logger.info(f'Memory: the rows of every dataset take {rows_bytes / dataset["bytes"]:.2f} bytes per byte of the dataset')
+        else:
+            util.Logger.info(f'Running {len(args.benchmarks)} benchmarks on {args.dataset or "the synthetic dataset"}: {dataset["files"]} files, {inventory.format_size(dataset["bytes"])}')
+            results = run_benchmarks(dataset_path, args.benchmarks, args.repeat)
+
+    if args.save:
+        save_results(args.save, dataset, args.repeat, results, memory)
+        util.Logger.info(f'Benchmark results saved to {args.save}')
+    if baseline is not None and memory is not None:
+        regressions = compare_memory(memory, baseline.get('memory') or {}, args.threshold)
+        for kind, name, peak, previous in regressions:
+            util.Logger.error(f'Memory of {name} on {kind} is above the baseline: peak {inventory.format_size(peak)}, baseline {inventory.format_size(previous)} (threshold {100 * args.threshold:.0f}%)')
+        if regressions:
+            exit(1)
+        util.Logger.info(f'No stage takes more memory than the baseline by more than {100 * args.threshold:.0f}%')
+    elif baseline is not None:
+        regressions = compare(results, baseline.get('results') or {}, args.threshold)
+        for name, seconds, previous in regressions:
+            util.Logger.error(f'Benchmark {name} is slower than the baseline: {seconds:.4f}s, baseline {previous:.4f}s (threshold {100 * args.threshold:.0f}%)')
+        if regressions:
+            exit(1)
+        util.Logger.info(f'No benchmark is slower than the baseline by more than {100 * args.threshold:.0f}%')
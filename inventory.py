@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+### Codebench Dataset Extractor by Marcos Lima (marcos.lima@icomp.ufam.edu.br)
+### Universidade Federal do Amazonas - UFAM
+### Instituto de Computação - IComp
+
+import archive
+import io
+import os
+import pipeline
+import random
+import time
+import util
+
+from collections import Counter, defaultdict
+
+# Kinds of files found in a user directory, with the dataset they are extracted to and the extraction
+# option that enables them (the user data files are always extracted)
+FILE_KINDS = {
+    'user': (util.CODE_USER, None),
+    'executions': (util.CODE_EXECUTION, 'extract_executions'),
+    'codes': (util.CODE_SOLUTION, 'extract_solutions'),
+    'codemirror': (util.CODE_CODEMIRROR, 'extract_codemirror'),
+    'logins': (util.CODE_LOGIN, 'extract_logins'),
+    'grades': (util.CODE_GRADE, 'extract_grades')
+}
+
+# Command-line flag of each extraction option, as shown in the plan
+OPTION_FLAGS = {
+    'extract_executions': '--executions',
+    'extract_solutions': '--solutions',
+    'extract_codemirror': '--codemirror',
+    'extract_logins': '--logins',
+    'extract_grades': '--grades'
+}
+
+# Number of files of each kind whose extraction is timed to calibrate the estimates
+CALIBRATION_SAMPLE_SIZE = 10
+
+
+def file_kind(entry):
+    """
+    Returns the kind of a file of a user directory, or None if it is not extracted.
+
+    Parameters:
+        entry (list): The file path components inside the user directory (e.g. ['codes', '1234_5678.py']).
+    """
+    if entry == [util.USER_DATA_FILENAME]:
+        return 'user'
+    if entry == ['logins.log']:
+        return 'logins'
+    if len(entry) != 2 or entry[0] not in FILE_KINDS:
+        return None
+    if entry[0] == 'grades' and entry[1].startswith('final_grade'):
+        return None
+    return entry[0]
+
+
+def extraction_args(semester: str, course: str, user: str, kind: str, name: str):
+    """Returns the leading arguments of the extraction function of a file, as given by the extraction."""
+    if kind == 'user':
+        return (semester, course)
+    if kind == 'logins':
+        return (semester, course, user)
+    if kind == 'grades':
+        return (semester, course, name[:-4], user)
+    assignment, problem = os.path.splitext(name)[0].split('_')[:2]
+    return (semester, course, assignment, user, problem)
+
+
+class Inventory:
+    """
+    The files of a dataset, listed from the directory entries or the tar headers without reading any content.
+
+    For every course the inventory counts the users and the number and total size of each kind of file,
+    and keeps a small random sample of each kind to calibrate the run time estimates. The filters on
+    semesters, courses and users are applied; the assignment dates are not, since they are only known
+    by reading the assignments.
+
+    The directory listings taken by from_directory are kept, so the file scheduler can walk the dataset
+    from them (see scan) instead of reading the directories again.
+
+    Attributes:
+        users (Counter): The number of users of each (semester, course).
+        files (dict): The number of files of each kind, in a Counter by (semester, course).
+        sizes (dict): The total size of the files of each kind in bytes, in a Counter by (semester, course).
+        samples (dict): Up to sample_size (semester, course, user, name, path) tuples by kind.
+        sample_size (int): The number of files of each kind kept in the sample.
+        elapsed (float): The time taken to list the dataset, in seconds.
+    """
+
+    def __init__(self, sample_size: int = CALIBRATION_SAMPLE_SIZE):
+        self.sample_size = sample_size
+        self.users = Counter()
+        self.files = defaultdict(Counter)
+        self.sizes = defaultdict(Counter)
+        self.samples = defaultdict(list)
+        self.elapsed = 0.0
+        self.__listings = {}
+        self.__seen = Counter() # Files of each kind seen, for the reservoir sampling
+        self.__random = random.Random(0)
+
+    @classmethod
+    def from_directory(cls, dataset_path: str, dataset_filter, sample_size: int = CALIBRATION_SAMPLE_SIZE):
+        """
+        Lists a dataset directory with os.scandir, taking the file sizes from the directory entries.
+
+        Parameters:
+            dataset_path (str): The dataset directory.
+            dataset_filter (DatasetFilter): Selects the semesters, courses and users to list.
+            sample_size (int): The number of files of each kind kept in the sample.
+
+        Returns:
+            Inventory: The inventory of the dataset.
+        """
+        inventory = cls(sample_size)
+        start = time.perf_counter()
+        for semester_entry in inventory.__list(dataset_path):
+            if not semester_entry.is_dir or not dataset_filter.select_semester(semester_entry.name):
+                continue
+            semester = util.extract_semester(semester_entry.path).desc
+            for course_entry in inventory.__list(semester_entry.path):
+                if not course_entry.is_dir or not dataset_filter.select_course(semester, course_entry.name):
+                    continue
+                inventory.__list(os.path.join(course_entry.path, 'assessments'))
+                for user_entry in inventory.__list(os.path.join(course_entry.path, 'users')):
+                    if user_entry.is_dir and dataset_filter.select_user(semester, course_entry.name, user_entry.name):
+                        inventory.__add_user_directory(semester, course_entry.name, user_entry)
+        inventory.elapsed = time.perf_counter() - start
+        return inventory
+
+    @classmethod
+    def from_archive(cls, path: str, dataset_filter, use_index: bool = True, sample_size: int = CALIBRATION_SAMPLE_SIZE):
+        """
+        Lists a dataset tarball from its member headers, or from its index when there is one.
+
+        Parameters:
+            path (str): The dataset tarball.
+            dataset_filter (DatasetFilter): Selects the semesters, courses and users to list.
+            use_index (bool): Whether to read and build the sidecar member index.
+            sample_size (int): The number of files of each kind kept in the sample.
+
+        Returns:
+            Inventory: The inventory of the dataset.
+        """
+        inventory = cls(sample_size)
+        start = time.perf_counter()
+        users = set()
+        for parts, size in archive.iter_member_sizes(path, use_index):
+            if len(parts) < 5 or parts[2] != 'users':
+                continue
+            semester, course, user = parts[0], parts[1], parts[3]
+            if not dataset_filter.select_semester(semester) or not dataset_filter.select_course(semester, course):
+                continue
+            if not dataset_filter.select_user(semester, course, user):
+                continue
+            if (semester, course, user) not in users:
+                users.add((semester, course, user))
+                inventory.users[(semester, course)] += 1
+            kind = file_kind(parts[4:])
+            if kind is not None:
+                inventory.add(semester, course, user, kind, parts[-1], '/'.join(parts), size)
+        inventory.elapsed = time.perf_counter() - start
+        return inventory
+
+    def add(self, semester: str, course: str, user: str, kind: str, name: str, path: str, size: int):
+        """Counts a file of a user directory and offers it to the calibration sample of its kind."""
+        self.files[(semester, course)][kind] += 1
+        self.sizes[(semester, course)][kind] += size
+        self.__seen[kind] += 1
+        sample = self.samples[kind]
+        if len(sample) < self.sample_size:
+            sample.append((semester, course, user, name, path))
+        else:
+            # Reservoir sampling: every file of the kind has the same chance of being in the sample
+            slot = self.__random.randrange(self.__seen[kind])
+            if slot < self.sample_size:
+                sample[slot] = (semester, course, user, name, path)
+
+    def scan(self, path: str):
+        """Lists a directory from the inventory, like pipeline.scan_entries; directories not listed are read from disk."""
+        entries = self.__listings.get(path)
+        return pipeline.scan_entries(path) if entries is None else entries
+
+    def totals(self):
+        """Returns the number of users, and the number and total size of each kind of file, over all the courses."""
+        files, sizes = Counter(), Counter()
+        for key in self.files:
+            files.update(self.files[key])
+            sizes.update(self.sizes[key])
+        return sum(self.users.values()), files, sizes
+
+    def __list(self, path):
+        try:
+            entries = self.__listings[path] = pipeline.scan_entries(path)
+        except (FileNotFoundError, NotADirectoryError):
+            return []
+        return entries
+
+    def __add_user_directory(self, semester, course, user_entry):
+        self.users[(semester, course)] += 1
+        for entry in self.__list(user_entry.path):
+            if entry.is_dir:
+                for file_entry in self.__list(entry.path):
+                    kind = file_kind([entry.name, file_entry.name])
+                    if kind is not None:
+                        self.add(semester, course, user_entry.name, kind, file_entry.name, file_entry.path, file_entry.size)
+            else:
+                kind = file_kind([entry.name])
+                if kind is not None:
+                    self.add(semester, course, user_entry.name, kind, entry.name, entry.path, entry.size)
+
+
+def read_samples(inventory: Inventory, dataset_path: str, use_index: bool = True, kinds=None):
+    """
+    Reads the calibration sample of an inventory.
+
+    Parameters:
+        inventory (Inventory): The inventory, from a dataset directory or tarball.
+        dataset_path (str): The dataset directory or tarball.
+        use_index (bool): Whether to use the sidecar member index of a tarball.
+        kinds (list, optional): The kinds of files to read. All the kinds are read when not provided.
+
+    Returns:
+        list: A (kind, extraction arguments, path, content) tuple for each sampled file, with the
+            content as an in-memory binary buffer.
+    """
+    samples = {}
+    for kind, sample in inventory.samples.items():
+        if kinds is not None and kind not in kinds:
+            continue
+        for semester, course, user, name, path in sample:
+            # A user is extracted from its directory path, the other files from their own path
+            extract_path = os.path.dirname(path) if kind == 'user' else path
+            samples[path] = (kind, extraction_args(semester, course, user, kind, os.path.basename(name)), extract_path)
+    contents = []
+    if os.path.isdir(dataset_path):
+        for path, (kind, args, extract_path) in samples.items():
+            with open(path, mode='rb') as f:
+                contents.append((kind, args, extract_path, io.BytesIO(f.read())))
+    else:
+        for parts, read_member in archive.iter_members(dataset_path, lambda parts: '/'.join(parts) in samples, use_index):
+            kind, args, extract_path = samples['/'.join(parts)]
+            contents.append((kind, args, extract_path, read_member()))
+    return contents
+
+
+def calibrate(samples):
+    """
+    Times the extraction of sampled files, computing the code metrics without the metrics cache.
+
+    Parameters:
+        samples (list): The (kind, extraction arguments, path, content) tuples, as returned by read_samples.
+
+    Returns:
+        dict: The number of files, total bytes and time spent in seconds, in a list by kind.
+    """
+    def extract_metrics(obj, code):
+        util.apply_code_metrics(obj, util.compute_code_metrics(code))
+
+    timings = defaultdict(lambda: [0, 0, 0.0])
+    for kind, args, path, content in samples:
+        task = pipeline.Task(None, FILE_KINDS[kind][0], path, path, args)
+        size = len(content.getbuffer())
+        start = time.perf_counter()
+        try:
+            [obj.as_list() for obj in pipeline.PARSERS[task.key](task, content, extract_metrics)]
+        except Exception as err:
+            util.Logger.warn(f'Calibration failed on {path}: {err}')
+            continue
+        timing = timings[kind]
+        timing[0] += 1
+        timing[1] += size
+        timing[2] += time.perf_counter() - start
+    return dict(timings)
+
+
+def estimate(inventory: Inventory, timings: dict):
+    """
+    Estimates the time to extract each kind of file of an inventory, from the calibration timings.
+
+    The time per byte of the sample is applied to the total size of the kind, or the time per file
+    when the sampled files are empty.
+
+    Returns:
+        dict: The estimated time in seconds by kind, or None for the kinds without timings.
+    """
+    users, files, sizes = inventory.totals()
+    estimates = {}
+    for kind in FILE_KINDS:
+        sample_files, sample_bytes, seconds = timings.get(kind, (0, 0, 0.0))
+        if files[kind] == 0:
+            estimates[kind] = 0.0
+        elif sample_files == 0:
+            estimates[kind] = None
+        elif sample_bytes > 0:
+            estimates[kind] = seconds * sizes[kind] / sample_bytes
+        else:
+            estimates[kind] = seconds * files[kind] / sample_files
+    return estimates
+
+
+def format_size(size: int):
+    """Returns a size in bytes as text with a binary unit (e.g. '1.5 MiB')."""
+    for unit in ['B', 'KiB', 'MiB', 'GiB']:
+        if size < 1024:
+            return f'{size:.0f} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+        size /= 1024
+    return f'{size:.1f} TiB'
+
+
+def format_duration(seconds: float):
+    """Returns a duration in seconds as text (e.g. '2h05m', '3m20s', '4.2s')."""
+    if seconds is None:
+        return 'unknown'
+    if seconds < 60:
+        return f'{seconds:.1f}s'
+    minutes, seconds = divmod(int(seconds), 60)
+    if minutes < 60:
+        return f'{minutes}m{seconds:02d}s'
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours}h{minutes:02d}m'
+
+
+def report(inventory: Inventory, estimates: dict, workers: int = 1):
+    """
+    Returns the plan of a run as text lines: the inventory of each course and the estimated time of each extraction flag.
+
+    Parameters:
+        inventory (Inventory): The inventory of the dataset.
+        estimates (dict): The estimated time in seconds by kind, as returned by estimate.
+        workers (int): The number of worker processes, by which the total time is divided.
+    """
+    lines = []
+    for semester, course in sorted(inventory.users):
+        files, sizes = inventory.files[(semester, course)], inventory.sizes[(semester, course)]
+        kinds = ', '.join(f'{kind} {files[kind]} ({format_size(sizes[kind])})' for kind in FILE_KINDS)
+        lines.append(f'Plan {semester}/{course}: {inventory.users[(semester, course)]} users, {kinds}')
+    users, files, sizes = inventory.totals()
+    lines.append(f'Plan total: {len(inventory.users)} courses, {users} users, {sum(files.values())} files '
+                 f'({format_size(sum(sizes.values()))}), listed in {inventory.elapsed:.2f}s')
+    total = 0.0
+    for kind, (code, option) in FILE_KINDS.items():
+        flag = OPTION_FLAGS.get(option, 'always')
+        lines.append(f'Plan estimate {flag}: {files[kind]} {kind} files ({format_size(sizes[kind])}), {format_duration(estimates[kind])}')
+        total += estimates[kind] or 0.0
+    lines.append(f'Plan estimate with every flag: {format_duration(total)} in one process, '
+                 f'{format_duration(total / max(workers, 1))} with {max(workers, 1)} workers')
+    return lines
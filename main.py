@@ -6,14 +6,42 @@ Organization: Universidade Federal do Amazonas - UFAM, Instituto de Computação
 
 This script extracts educational data from a specified dataset path, processing semester, course, user, and various log information. It supports enabling or disabling specific data extraction features through command-line arguments.
 """
+import archive
 import argparse
+import autotune
+import inventory
+import io
+import manifest
+import model
 import os
+import pipeline
+import progress
+import report
+import scheduler
 import time
 import util
 import tarfile 
 
-from collections import Counter, defaultdict
+from collections import Counter, defaultdict, deque, namedtuple
 from datetime import datetime
+from functools import partial
+
+def iso_date(value):
+    """Argument type of the date options: an ISO date (YYYY-MM-DD)."""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date().isoformat()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date '{value}', expected YYYY-MM-DD")
+
+def fraction(value):
+    """Argument type of the sampling fraction: a number in (0, 1]."""
+    try:
+        number = float(value)
+    except ValueError:
+        number = None
+    if number is None or not 0 < number <= 1:
+        raise argparse.ArgumentTypeError(f"invalid fraction '{value}', expected a number greater than 0 and up to 1")
+    return number
 
 # Command-line argument setup
 parser = argparse.ArgumentParser(description="Extracts educational data from a specified dataset path.")
@@ -33,8 +61,133 @@ parser.set_defaults(extract_grades=False)
 parser.add_argument('--codemirror', dest='extract_codemirror', action='store_true', help="Extract CodeMirror logs")
 parser.add_argument('--no-codemirror', dest='extract_codemirror', action='store_false', help="Do not extract CodeMirror logs")
 parser.set_defaults(extract_codemirror=False)
+parser.add_argument('--stream', dest='stream', action='store_true', help="Read a dataset tarball member by member, without extracting it to disk")
+parser.add_argument('--no-stream', dest='stream', action='store_false', help="Extract the dataset tarball into the 'data' directory before processing it")
+parser.set_defaults(stream=True)
+parser.add_argument('--index', dest='use_index', action='store_true', help="Build and reuse a sidecar member index to seek straight to the needed tarball members")
+parser.add_argument('--no-index', dest='use_index', action='store_false', help="Do not build or use the tarball member index")
+parser.set_defaults(use_index=True)
+parser.add_argument('--workers', help="Number of worker processes used to extract user directories", type=int, default=1)
+parser.add_argument('--format', dest='output_format', help="Output file format (parquet requires pyarrow)", choices=list(util.OUTPUT_FORMATS), default='csv')
+parser.add_argument('--pipeline', dest='pipeline', action='store_true', help="Extract dataset directories with a staged pipeline (walk/read, parse, metrics, write) so I/O and CPU work overlap")
+parser.add_argument('--no-pipeline', dest='pipeline', action='store_false', help="Extract dataset directories one user at a time (see --workers)")
+parser.set_defaults(pipeline=False)
+parser.add_argument('--io-threads', help="Number of pipeline threads reading files", type=int, default=4)
+parser.add_argument('--parse-threads', help="Number of pipeline threads parsing files", type=int, default=2)
+parser.add_argument('--metrics-processes', help="Number of pipeline processes computing code metrics (0 computes them in the pipeline threads)", type=int, default=os.cpu_count() or 1)
+parser.add_argument('--queue-size', help="Capacity of the queues between pipeline stages", type=int, default=64)
+parser.add_argument('--schedule', help="How user files are spread over the --workers processes: 'users' extracts whole user directories, 'static' splits the files evenly in advance and 'size' runs the largest files first with work stealing", choices=['users'] + scheduler.SCHEDULES, default='users')
+parser.add_argument('--schedule-window', help="Number of tasks the 'static' and 'size' schedules take ahead of the first file whose rows are not written yet", type=int, default=scheduler.SCHEDULE_WINDOW)
+parser.add_argument('--schedule-buffer-rows', help="Number of rows waiting to be written in order from which the 'static' and 'size' schedules only run the file in turn", type=int, default=scheduler.SCHEDULE_BUFFER_ROWS)
+parser.add_argument('--plan', dest='plan', action='store_true', help="Inventory the dataset from its directory entries or tar headers and estimate the run time of each extraction flag, without extracting anything")
+parser.add_argument('--no-plan', dest='plan', action='store_false', help="Extract the dataset")
+parser.set_defaults(plan=False)
+parser.add_argument('--auto-tune', dest='auto_tune', action='store_true', help="Calibrate on a sample of the dataset files, choose the worker, thread and batch settings and save them to --tune-file for the next runs")
+parser.add_argument('--no-auto-tune', dest='auto_tune', action='store_false', help="Use the settings saved in --tune-file, if any, or the defaults")
+parser.set_defaults(auto_tune=False)
+parser.add_argument('--tune-file', help="File with the settings chosen by --auto-tune; options given on the command line take precedence", type=str, default='autotune.json')
+parser.add_argument('--file-messages', help="Per-file log messages (new user, execution file, ... found): 'all', at most --file-messages-rate per second ('rate') or 'none'", choices=util.LOG_FILE_MESSAGES, default='all')
+parser.add_argument('--file-messages-rate', help="Number of per-file log messages per second with --file-messages rate", type=int, default=util.LOG_FILE_MESSAGES_RATE)
+parser.add_argument('--progress', dest='progress', action='store_true', help="Show a progress line with the rates of each kind of file, the metrics cache hit rate, the work done and the time left")
+parser.add_argument('--no-progress', dest='progress', action='store_false', help="Do not show the progress line")
+parser.set_defaults(progress=False)
+parser.add_argument('--status-file', help="JSON file rewritten with the progress of the run, to be polled by other programs", type=str, default=None)
+parser.add_argument('--progress-interval', help="Seconds between two progress reports", type=float, default=progress.PROGRESS_INTERVAL)
+parser.add_argument('--profile', dest='profile', action='store_true', help="Time each extract_* call, code metric group, code parsing and output batch, reporting per-stage percentiles and the slowest files and codes")
+parser.add_argument('--no-profile', dest='profile', action='store_false', help="Do not profile the run")
+parser.set_defaults(profile=False)
+parser.add_argument('--profile-dir', help="Directory of the profile report (profile.json) and the cProfile dumps", type=str, default='profile')
+parser.add_argument('--profile-top', help="Number of slowest files and codes reported by --profile", type=int, default=util.PROFILE_TOP)
+parser.add_argument('--cprofile', dest='cprofile', action='store_true', help="With --profile, also run each stage under cProfile and save one '<stage>.prof' file per stage")
+parser.add_argument('--no-cprofile', dest='cprofile', action='store_false', help="Do not run cProfile")
+parser.set_defaults(cprofile=False)
+parser.add_argument('--report', dest='report', action='store_true', help="Save a JSON report of the run: parameters, dataset fingerprint, entity counts, bytes read, timings, peak memory, code metrics errors and output sizes")
+parser.add_argument('--no-report', dest='report', action='store_false', help="Do not save the run report")
+parser.set_defaults(report=True)
+parser.add_argument('--report-file', help="Path of the run report (default: '<date>_report.json' in the logs directory)", type=str, default=None)
+parser.add_argument('--batch-size', help="Number of rows of each dataset buffered before they are written to disk", type=int, default=util.CSV_BATCH_SIZE)
+parser.add_argument('--metrics-cache', help="SQLite file that keeps the code metrics between runs", type=str, default=None)
+parser.add_argument('--manifest', help="SQLite file that records the processed files and their results, so unchanged user directories are not extracted again", type=str, default=None)
+parser.add_argument('--checkpoint', help="SQLite file where the results of each finished user directory are saved, so an interrupted run can be resumed", type=str, default=None)
+parser.add_argument('--resume', dest='resume', action='store_true', help="Resume an interrupted run from its checkpoint instead of starting over")
+parser.add_argument('--no-resume', dest='resume', action='store_false', help="Start a new run, discarding the checkpoint contents")
+parser.set_defaults(resume=False)
+parser.add_argument('--semesters', help="Extract only these semesters (e.g. 2017-1 2017-2)", nargs='+', default=None)
+parser.add_argument('--courses', help="Extract only these course codes", nargs='+', default=None)
+parser.add_argument('--users', help="Extract only these user ids", nargs='+', default=None)
+parser.add_argument('--users-file', help="File with the user ids to extract, one per line (added to --users)", type=str, default=None)
+parser.add_argument('--assignments-from', help="Extract only assignments opened on or after this date (YYYY-MM-DD)", type=iso_date, default=None)
+parser.add_argument('--assignments-until', help="Extract only assignments closed on or before this date (YYYY-MM-DD)", type=iso_date, default=None)
+parser.add_argument('--sample-fraction', help="Extract only this fraction of the users of each course (e.g. 0.01), picked by a stable hash", type=fraction, default=None)
+parser.add_argument('--sample-seed', help="Seed of the user sample: the same seed always picks the same users", type=int, default=0)
+parser.add_argument('--metrics-cache-size', help="Number of code metrics entries kept in memory", type=int, default=util.METRICS_CACHE_SIZE)
 args = parser.parse_args()
 
+# Settings chosen by an earlier --auto-tune run become the defaults, so options given on the command line still win
+tuned_settings, tuned_settings_error = (None, None) if args.auto_tune else autotune.load_settings(args.tune_file)
+if tuned_settings:
+    parser.set_defaults(**tuned_settings)
+    args = parser.parse_args()
+
+def read_users_file(path):
+    """Returns the user ids listed in a file, one per line, ignoring blank lines."""
+    with open(path, mode='r', encoding=util.DEFAULT_FILE_ENCODING) as f:
+        return [line.strip() for line in f if line.strip()]
+
+# Semesters, courses, users and assignments selected by the filter options
+dataset_filter = util.DatasetFilter(
+    args.semesters,
+    args.courses,
+    None if args.users is None and args.users_file is None else (args.users or []) + (read_users_file(args.users_file) if args.users_file else []),
+    args.assignments_from,
+    args.assignments_until,
+    args.sample_fraction,
+    args.sample_seed
+)
+
+# Minimal stand-in for the os.DirEntry of a user directory, which cannot be sent to worker processes
+UserEntry = namedtuple('UserEntry', ['name', 'path'])
+
+# Semester and course counters updated while processing a user directory
+USER_SEMESTER_COUNTERS = ['n_users', 'n_codes', 'n_executions', 'n_mirrors', 'n_grades']
+USER_COURSE_COUNTERS = ['n_users']
+
+# Process pool used to extract user directories when more than one worker is requested
+executor = None
+
+# Number of steps of the directory walk per worker process, mostly user directories, queued ahead of the one merged next
+USER_TASKS_PER_WORKER = 4
+
+# Steps of the directory walk waiting to be merged, in walk order: the user directories submitted to
+# the worker processes, and the rows of the courses and semesters, which wait for their users' counters
+pending_merges = deque()
+
+# Metrics cache hits and misses reported by the worker processes
+metrics_cache_stats = Counter()
+
+# Manifest of the processed user directories, when incremental extraction is enabled
+files_manifest = None
+
+# Checkpoint of the user directories finished by this run, when enabled
+checkpoint = None
+
+# Extraction options the results stored in the manifest and the checkpoint depend on
+MANIFEST_OPTIONS = ['extract_executions', 'extract_solutions', 'extract_logins', 'extract_grades', 'extract_codemirror', 'assignments_from', 'assignments_until']
+
+def new_data_lists():
+    """Returns an empty row list for each output dataset."""
+    return {name: [] for name in [
+        util.CODE_SEMESTER,
+        util.CODE_COURSE,
+        util.CODE_ASSIGNMENT,
+        util.CODE_USER,
+        util.CODE_EXECUTION,
+        util.CODE_SOLUTION,
+        util.CODE_LOGIN,
+        util.CODE_GRADE,
+        util.CODE_CODEMIRROR
+    ]}
+
 # Function to process directories and extract data based on command-line flags
 def process_directories(dataset_path, data_lists):
     """
@@ -43,11 +196,35 @@ def process_directories(dataset_path, data_lists):
     Args:
         dataset_path (str): Path to the dataset directory.
     """
-    for semester_entry in os.scandir(dataset_path):
+    for semester_entry in util.scan_directory(dataset_path):
+        if not dataset_filter.select_semester(semester_entry.name):
+            continue
         util.Logger.info(f'New semester found: {semester_entry.path}')
         new_semester = util.extract_semester(semester_entry.path)
         process_courses(semester_entry, new_semester, data_lists)
-        data_lists[util.CODE_SEMESTER].append(new_semester.as_list())
+        defer_merge(partial(append_row, data_lists[util.CODE_SEMESTER], new_semester))
+    while pending_merges:
+        pending_merges.popleft()()
+
+def defer_merge(step):
+    """
+    Queues a step of the directory walk to be run in walk order, once the user directories before it are merged.
+
+    With worker processes, up to USER_TASKS_PER_WORKER steps per worker are queued, so the workers are kept busy
+    across course boundaries while a bounded number of user results is held in memory; beyond that, the oldest
+    step is run, waiting for its user directory if needed. Without them, the step is run at once.
+
+    Args:
+        step (callable): The step, called without arguments.
+    """
+    pending_merges.append(step)
+    max_pending = 0 if executor is None else args.workers * USER_TASKS_PER_WORKER
+    while len(pending_merges) > max_pending:
+        pending_merges.popleft()()
+
+def append_row(rows, obj):
+    """Appends the row of a semester or course object to its dataset, once its counters are complete."""
+    rows.append(obj.as_list())
 
 def process_courses(semester_entry, semester_obj, data_lists):
     """
@@ -57,13 +234,15 @@ def process_courses(semester_entry, semester_obj, data_lists):
         semester_entry (os.DirEntry): The directory entry for the semester.
         semester_obj (Semester): The semester object.
     """
-    for course_entry in os.scandir(semester_entry.path):
+    for course_entry in util.scan_directory(semester_entry.path):
+        if not dataset_filter.select_course(semester_obj.desc, course_entry.name):
+            continue
         util.Logger.info(f'New course found: {course_entry.path}')
         semester_obj.n_courses += 1
         new_course = util.extract_course(semester_obj.desc, course_entry.name, course_entry.path)
-        process_assignments(course_entry, semester_obj, new_course, data_lists)
-        process_users(course_entry, semester_obj, new_course, data_lists)
-        data_lists[util.CODE_COURSE].append(new_course.as_list())
+        skipped_assignments = process_assignments(course_entry, semester_obj, new_course, data_lists)
+        process_users(course_entry, semester_obj, new_course, data_lists, skipped_assignments)
+        defer_merge(partial(append_row, data_lists[util.CODE_COURSE], new_course))
 
 
 def process_assignments(course_entry, semester_obj, course_obj, data_lists):
@@ -74,15 +253,21 @@ def process_assignments(course_entry, semester_obj, course_obj, data_lists):
         course_entry (os.DirEntry): The directory entry for the course.
         semester_obj (Semester): The semester object.
         course_obj (Course): The course object.
+
+    Returns:
+        frozenset: The codes of the assignments rejected by the date filter, whose user files are skipped.
     """
-    for assignment_entry in os.scandir(os.path.join(course_entry.path, 'assessments')):
-        util.Logger.info(f'New assignment found: {assignment_entry.path}')
+    for assignment_entry in util.scan_directory(os.path.join(course_entry.path, 'assessments')):
+        new_assignment = util.extract_assignment(semester_obj.desc, course_obj.code, assignment_entry.path)
+        if not dataset_filter.select_assignment(new_assignment):
+            continue
+        util.Logger.detail(f'New assignment found: {assignment_entry.path}')
         semester_obj.n_assignments += 1
         course_obj.n_assignments += 1
-        new_assignment = util.extract_assignment(semester_obj.desc, course_obj.code, assignment_entry.path)
         data_lists[util.CODE_ASSIGNMENT].append(new_assignment.as_list())
+    return frozenset(dataset_filter.skipped_assignments[(semester_obj.desc, course_obj.code)])
 
-def process_executions(user_entry, semester_obj, course_obj, data_lists):
+def process_executions(user_entry, semester_obj, course_obj, data_lists, skipped_assignments=frozenset()):
     """
     Processes executions data for a assignment problem.
 
@@ -90,15 +275,18 @@ def process_executions(user_entry, semester_obj, course_obj, data_lists):
         user_entry (os.DirEntry): The directory entry for the user.
         semester_obj (Semester): The semester object.
         course_obj (Course): The course object.
+        skipped_assignments (frozenset): The codes of the assignments whose files are skipped.
     """
-    for execution_entry in os.scandir(os.path.join(user_entry.path, 'executions')):
-        util.Logger.info(f'New execution file found: {execution_entry.path}')
+    for execution_entry in util.scan_directory(os.path.join(user_entry.path, 'executions')):
+        if util.DatasetFilter.file_assignment(execution_entry.name) in skipped_assignments:
+            continue
+        util.Logger.detail(f'New execution file found: {execution_entry.path}')
         semester_obj.n_executions += 1
         assignment, problem = os.path.splitext(execution_entry.name)[0].split('_')
         new_executions = util.extract_executions(semester_obj.desc, course_obj.code, assignment, user_entry.name, problem, execution_entry.path)
-        data_lists[util.CODE_EXECUTION].extend([execution.as_list() for execution in new_executions])
+        data_lists[util.CODE_EXECUTION].extend(execution.as_list() for execution in new_executions)
 
-def process_solutions(user_entry, semester_obj, course_obj, data_lists):
+def process_solutions(user_entry, semester_obj, course_obj, data_lists, skipped_assignments=frozenset()):
     """
     Processes solutions data for a assignment problem.
 
@@ -106,9 +294,12 @@ def process_solutions(user_entry, semester_obj, course_obj, data_lists):
         user_entry (os.DirEntry): The directory entry for the user.
         semester_obj (Semester): The semester object.
         course_obj (Course): The course object.
+        skipped_assignments (frozenset): The codes of the assignments whose files are skipped.
     """
-    for solution_entry in os.scandir(os.path.join(user_entry.path, 'codes')):
-        util.Logger.info(f'New solution code found: {solution_entry.path}')
+    for solution_entry in util.scan_directory(os.path.join(user_entry.path, 'codes')):
+        if util.DatasetFilter.file_assignment(solution_entry.name) in skipped_assignments:
+            continue
+        util.Logger.detail(f'New solution code found: {solution_entry.path}')
         semester_obj.n_codes += 1
         assignment, problem = os.path.splitext(solution_entry.name)[0].split('_')
         new_solution = util.extract_solution(semester_obj.desc, course_obj.code, assignment, user_entry.name, problem, solution_entry.path)
@@ -124,21 +315,23 @@ def process_logins(user_entry, semester_obj, course_obj, data_lists):
         course_obj (Course): The course object.
     """
     user_logins_path = os.path.join(user_entry.path, 'logins.log')
-    util.Logger.info(f'Novo arquivo de logins de usuário encontrado: {user_logins_path}')
+    util.Logger.detail(f'Novo arquivo de logins de usuário encontrado: {user_logins_path}')
     user_logins = util.extract_user_logins(semester_obj.desc, course_obj.code, user_entry.name, user_logins_path)
     data_lists[util.CODE_LOGIN].extend([logins.as_list() for logins in user_logins])
 
-def process_grades(user_entry, semester_obj, course_obj, data_lists):
-    for grade_entry in os.scandir(os.path.join(user_entry.path, 'grades')):
-        if not grade_entry.name.startswith('final_grade'):
-            util.Logger.info(f'New assignment grade file found: {grade_entry.path}')
+def process_grades(user_entry, semester_obj, course_obj, data_lists, skipped_assignments=frozenset()):
+    for grade_entry in util.scan_directory(os.path.join(user_entry.path, 'grades')):
+        if not grade_entry.name.startswith('final_grade') and util.DatasetFilter.file_assignment(grade_entry.name) not in skipped_assignments:
+            util.Logger.detail(f'New assignment grade file found: {grade_entry.path}')
             semester_obj.n_grades += 1
             new_grade = util.extract_grade(semester_obj.desc, course_obj.code, grade_entry.name[:-4], user_entry.name, grade_entry.path)
             data_lists[util.CODE_GRADE].append(new_grade.as_list())
 
-def process_codemirror(user_entry, semester_obj, course_obj, data_lists):
-    for mirror_entry in os.scandir(os.path.join(user_entry.path, 'codemirror')):
-        util.Logger.info(f'New code mirror event log file found: {mirror_entry.path}')
+def process_codemirror(user_entry, semester_obj, course_obj, data_lists, skipped_assignments=frozenset()):
+    for mirror_entry in util.scan_directory(os.path.join(user_entry.path, 'codemirror')):
+        if util.DatasetFilter.file_assignment(mirror_entry.name) in skipped_assignments:
+            continue
+        util.Logger.detail(f'New code mirror event log file found: {mirror_entry.path}')
         semester_obj.n_mirrors += 1
         temp = mirror_entry.name[:-4].split('_')
         cdm_logs = util.extract_codemirror_events(
@@ -151,59 +344,471 @@ def process_codemirror(user_entry, semester_obj, course_obj, data_lists):
         )
         data_lists[util.CODE_CODEMIRROR].extend([events.as_list() for events in cdm_logs])
 
-def process_users(course_entry, semester_obj, course_obj, data_lists):
-    for user_entry in os.scandir(os.path.join(course_entry.path, 'users')):
-        util.Logger.info(f'New user found: {user_entry.path}')
+def process_users(course_entry, semester_obj, course_obj, data_lists, skipped_assignments=frozenset()):
+    """
+    Processes the users of a course, fanning the user directories out to the worker processes when enabled.
+
+    Each user directory is submitted as soon as it is found and merged later by merge_user, through defer_merge,
+    so the worker processes go on with the next courses while the results are merged in directory order; the rows
+    and counters are the same whatever the number of workers. With a manifest, the stored results of unchanged
+    user directories are used instead of extracting them again; they are only loaded when their turn to be merged
+    comes. With a checkpoint, the results of each user directory are saved as soon as it is merged, and a resumed
+    run takes the results of the directories finished before the interruption.
+
+    Args:
+        course_entry (os.DirEntry): The directory entry for the course.
+        semester_obj (Semester): The semester object.
+        course_obj (Course): The course object.
+        skipped_assignments (frozenset): The codes of the assignments whose user files are skipped.
+    """
+    for user_entry in util.scan_directory(os.path.join(course_entry.path, 'users')):
+        if not dataset_filter.select_user(semester_obj.desc, course_obj.code, user_entry.name):
+            continue
+        user_path = user_entry.path
+        store, digest, files = None, None, None
+        if checkpoint is not None:
+            digest = checkpoint.lookup(manifest_key(user_path), skipped_assignments)
+            store = checkpoint if digest is not None else None
+        if digest is None and files_manifest is not None:
+            digest, files = files_manifest.lookup(manifest_key(user_path), user_path, skipped_assignments)
+            store = files_manifest if digest is not None else None
+        if store is not None:
+            results = partial(store.load, manifest_key(user_path), digest)
+        else:
+            # Directories not yet in the manifest are fingerprinted by the process that extracts them
+            user_args = (semester_obj.desc, course_obj.code, user_path, files_manifest is not None and files is None, skipped_assignments)
+            results = partial(process_user, *user_args) if executor is None else executor.submit(process_user, *user_args).result
+        defer_merge(partial(merge_user, user_path, results, store is not None, files, semester_obj, course_obj, data_lists, skipped_assignments))
+    if files_manifest is not None:
+        defer_merge(files_manifest.commit)
+
+def merge_user(user_path, results, stored, files, semester_obj, course_obj, data_lists, skipped_assignments=frozenset()):
+    """
+    Merges the results of a user directory into the datasets and the semester and course counters.
+
+    Args:
+        user_path (str): Path to the user directory.
+        results (callable): Returns the results of the directory: the stored ones, or those returned by process_user.
+        stored (bool): Whether the results are taken from the manifest or the checkpoint.
+        files (list): The directory fingerprint taken by the manifest lookup, or None if not taken.
+        semester_obj (Semester): The semester object.
+        course_obj (Course): The course object.
+        skipped_assignments (frozenset): The codes of the assignments whose user files are skipped.
+    """
+    if stored:
+        util.Logger.info(f'User directory already extracted, using the stored results: {user_path}')
+        user_data_lists, user_semester, user_course = results()
+    else:
+        user_data_lists, user_semester, user_course, user_cache_stats, user_files = results()
+        metrics_cache_stats.update(user_cache_stats)
+        user_results = (user_data_lists, user_semester, user_course)
+        if files_manifest is not None:
+            files_manifest.store(manifest_key(user_path), user_files or files, user_results, skipped_assignments)
+        if checkpoint is not None:
+            checkpoint.store(manifest_key(user_path), user_results, skipped_assignments)
+            if files_manifest is not None:
+                files_manifest.commit()
+    for key, rows in user_data_lists.items():
+        data_lists[key].extend(rows)
+    for counter in USER_SEMESTER_COUNTERS:
+        setattr(semester_obj, counter, getattr(semester_obj, counter) + getattr(user_semester, counter))
+    for counter in USER_COURSE_COUNTERS:
+        setattr(course_obj, counter, getattr(course_obj, counter) + getattr(user_course, counter))
+
+def manifest_key(user_path):
+    """Returns the manifest key of a user directory: its 'semester/course/users/user' path inside the dataset."""
+    return '/'.join(os.path.normpath(user_path).split(os.sep)[-4:])
+
+def process_user(semester_desc, course_code, user_path, take_fingerprint=False, skipped_assignments=frozenset()):
+    """
+    Extracts the data of a single user directory.
+
+    This function runs in the worker processes, so it works on empty semester and course
+    objects and returns their counters instead of updating the shared ones.
+
+    Args:
+        semester_desc (str): The semester description.
+        course_code (str): The course code.
+        user_path (str): Path to the user directory.
+        take_fingerprint (bool): Whether to fingerprint the directory files for the manifest before extracting them.
+        skipped_assignments (frozenset): The codes of the assignments whose user files are skipped.
+
+    Returns:
+        tuple: The extracted rows of each dataset, the semester and course objects holding the counter increments,
+            the metrics cache hits and misses, and the directory fingerprint (None if not taken).
+    """
+    files = manifest.fingerprint(user_path) if take_fingerprint else None
+    user_entry = UserEntry(os.path.basename(user_path), user_path)
+    semester_obj = util.extract_semester(semester_desc)
+    course_obj = model.Course(semester_desc, course_code, '')
+    data_lists = new_data_lists()
+
+    util.Logger.detail(f'New user found: {user_entry.path}')
+    semester_obj.n_users += 1
+    course_obj.n_users += 1
+    new_user = util.extract_user(semester_obj.desc, course_obj.code, user_entry.path)
+    data_lists[util.CODE_USER].append(new_user.as_list())
+
+    if args.extract_executions:
+        process_executions(user_entry, semester_obj, course_obj, data_lists, skipped_assignments)
+
+    if args.extract_solutions:
+        process_solutions(user_entry, semester_obj, course_obj, data_lists, skipped_assignments)
+
+    if args.extract_logins:
+        process_logins(user_entry, semester_obj, course_obj, data_lists)
+
+    if args.extract_grades:
+        process_grades(user_entry, semester_obj, course_obj, data_lists, skipped_assignments)
+    
+    if args.extract_codemirror:
+        process_codemirror(user_entry, semester_obj, course_obj, data_lists, skipped_assignments)
+
+    util.MetricsCache.flush()
+    return data_lists, semester_obj, course_obj, util.MetricsCache.pop_stats(), files
+
+def process_archive(dataset_path, data_lists):
+    """
+    Processes a dataset tarball without extracting it, sending each member to the matching extraction function.
+
+    Members are visited in archive order and read into in-memory buffers, so nothing is written to disk.
+    Semesters and courses are created the first time one of their members shows up and saved at the end.
+
+    Args:
+        dataset_path (str): Path to the dataset tarball.
+    """
+    if dataset_filter.has_date_window():
+        scan_archive_assignments(dataset_path)
+    semesters, courses = {}, {}
+    for parts, read_member in archive.iter_members(dataset_path, archive_member_needed, args.use_index):
+        if len(parts) < 4:
+            continue
+        member_path = '/'.join(parts)
+        semester_desc, course_code, section = parts[:3]
+
+        semester_obj = semesters.get(semester_desc)
+        if semester_obj is None:
+            util.Logger.info(f'New semester found: {semester_desc}')
+            semester_obj = semesters[semester_desc] = util.extract_semester(semester_desc)
+
+        course_obj = courses.get((semester_desc, course_code))
+        if course_obj is None:
+            util.Logger.info(f'New course found: {semester_desc}/{course_code}')
+            semester_obj.n_courses += 1
+            course_obj = courses[(semester_desc, course_code)] = model.Course(semester_desc, course_code, '')
+
+        if section == 'assessments' and len(parts) == 4:
+            content = read_member()
+            if member_path.endswith(util.DATA_FILE_EXTENSION):
+                course_obj.desc = util.extract_class_name(member_path, io.BytesIO(content.getvalue())) or course_obj.desc
+            new_assignment = util.extract_assignment(semester_obj.desc, course_obj.code, member_path, content)
+            if not dataset_filter.select_assignment(new_assignment):
+                continue
+            util.Logger.detail(f'New assignment found: {member_path}')
+            semester_obj.n_assignments += 1
+            course_obj.n_assignments += 1
+            data_lists[util.CODE_ASSIGNMENT].append(new_assignment.as_list())
+        elif section == 'users' and len(parts) >= 5:
+            process_archive_user_member(parts, read_member, semester_obj, course_obj, data_lists)
+
+    data_lists[util.CODE_COURSE].extend([course.as_list() for course in courses.values()])
+    data_lists[util.CODE_SEMESTER].extend([semester.as_list() for semester in semesters.values()])
+
+def scan_archive_assignments(dataset_path):
+    """
+    Reads the assignments of a dataset tarball ahead of the other members, to apply the date filter.
+
+    In the archive the user files may come before the assignments of their course, so the assignments
+    rejected by the date filter have to be known beforehand for their user files to be skipped.
+    With the archive index only the assignment members are read.
+
+    Args:
+        dataset_path (str): Path to the dataset tarball.
+    """
+    def assignment_needed(parts):
+        return (len(parts) == 4 and parts[2] == 'assessments' and
+                dataset_filter.select_semester(parts[0]) and dataset_filter.select_course(parts[0], parts[1]))
+
+    util.Logger.info(f'Reading the assignment dates: {dataset_path}')
+    for parts, read_member in archive.iter_members(dataset_path, assignment_needed, args.use_index):
+        dataset_filter.select_assignment(util.extract_assignment(parts[0], parts[1], '/'.join(parts), read_member()))
+
+def archive_member_needed(parts):
+    """
+    Tells whether a tar member has to be read, given the extraction flags and the filters.
+
+    Args:
+        parts (list): The member path components (semester/course/...).
+
+    Returns:
+        bool: True if the member feeds one of the enabled extractions.
+    """
+    if len(parts) < 4 or not dataset_filter.select_semester(parts[0]) or not dataset_filter.select_course(parts[0], parts[1]):
+        return False
+    if len(parts) == 4:
+        return parts[2] == 'assessments'
+    if len(parts) < 5 or parts[2] != 'users' or not dataset_filter.select_user(parts[0], parts[1], parts[3]):
+        return False
+    entry = parts[4:]
+    if len(entry) == 2 and util.DatasetFilter.file_assignment(entry[1]) in dataset_filter.skipped_assignments[(parts[0], parts[1])]:
+        return False
+    if entry == [util.USER_DATA_FILENAME]:
+        return True
+    if entry == ['logins.log']:
+        return args.extract_logins
+    if len(entry) != 2:
+        return False
+    return {
+        'executions': args.extract_executions,
+        'codes': args.extract_solutions,
+        'grades': args.extract_grades,
+        'codemirror': args.extract_codemirror
+    }.get(entry[0], False)
+
+def process_archive_user_member(parts, read_member, semester_obj, course_obj, data_lists):
+    """
+    Processes a tar member found inside a user directory, selected by archive_member_needed.
+
+    Args:
+        parts (list): The member path components (semester/course/users/<id>/...).
+        read_member (function): Returns the member content as an in-memory binary buffer.
+        semester_obj (Semester): The semester object.
+        course_obj (Course): The course object.
+    """
+    member_path = '/'.join(parts)
+    user_path, user, entry = '/'.join(parts[:4]), parts[3], parts[4:]
+
+    if entry == [util.USER_DATA_FILENAME]:
+        util.Logger.detail(f'New user found: {user_path}')
         semester_obj.n_users += 1
         course_obj.n_users += 1
-        new_user = util.extract_user(semester_obj.desc, course_obj.code, user_entry.path)
+        new_user = util.extract_user(semester_obj.desc, course_obj.code, user_path, read_member())
         data_lists[util.CODE_USER].append(new_user.as_list())
+    elif entry == ['logins.log']:
+        util.Logger.detail(f'Novo arquivo de logins de usuário encontrado: {member_path}')
+        user_logins = util.extract_user_logins(semester_obj.desc, course_obj.code, user, member_path, read_member())
+        data_lists[util.CODE_LOGIN].extend([logins.as_list() for logins in user_logins])
+    elif len(entry) != 2:
+        return
+    elif entry[0] == 'executions':
+        util.Logger.detail(f'New execution file found: {member_path}')
+        semester_obj.n_executions += 1
+        assignment, problem = os.path.splitext(entry[1])[0].split('_')
+        new_executions = util.extract_executions(semester_obj.desc, course_obj.code, assignment, user, problem, member_path, read_member())
+        data_lists[util.CODE_EXECUTION].extend(execution.as_list() for execution in new_executions)
+    elif entry[0] == 'codes':
+        util.Logger.detail(f'New solution code found: {member_path}')
+        semester_obj.n_codes += 1
+        assignment, problem = os.path.splitext(entry[1])[0].split('_')
+        new_solution = util.extract_solution(semester_obj.desc, course_obj.code, assignment, user, problem, member_path, read_member())
+        data_lists[util.CODE_SOLUTION].append(new_solution.as_list())
+    elif entry[0] == 'grades' and not entry[1].startswith('final_grade'):
+        util.Logger.detail(f'New assignment grade file found: {member_path}')
+        semester_obj.n_grades += 1
+        new_grade = util.extract_grade(semester_obj.desc, course_obj.code, entry[1][:-4], user, member_path, read_member())
+        data_lists[util.CODE_GRADE].append(new_grade.as_list())
+    elif entry[0] == 'codemirror':
+        util.Logger.detail(f'New code mirror event log file found: {member_path}')
+        semester_obj.n_mirrors += 1
+        temp = entry[1][:-4].split('_')
+        cdm_logs = util.extract_codemirror_events(semester_obj.desc, course_obj.code, temp[0], user, temp[1], member_path, read_member())
+        data_lists[util.CODE_CODEMIRROR].extend([events.as_list() for events in cdm_logs])
+
+def auto_tune(dataset_path):
+    """
+    Chooses the worker, thread and batch settings of this run from a calibration on a sample of the dataset files.
+
+    The settings are saved to the tuning file, to be reused by the next runs, and applied to the
+    options not given on the command line.
+
+    Args:
+        dataset_path (str): Path to the dataset directory or tarball.
+    """
+    util.Logger.info(f'Calibrating on a sample of {autotune.TUNE_SAMPLE_SIZE} files of each kind: {dataset_path}')
+    measurements = autotune.calibrate(dataset_path, dataset_filter, args.use_index)
+    for kind, measurement in measurements.items():
+        records = measurement['records'] or 1
+        util.Logger.info(f'Calibration {kind}: {measurement["files"]} files, {measurement["records"]} records, '
+                         f'read {measurement["io"]:.3f}s, parse {measurement["parse"]:.3f}s, metrics {measurement["metrics"]:.3f}s (CPU), '
+                         f'{measurement["row_bytes"] / records:.0f} bytes per record')
+    settings = autotune.choose_settings(measurements, autotune.machine()['cpu_count'])
+    autotune.save_settings(args.tune_file, settings, measurements)
+    util.Logger.info(f'Tuned settings saved to {args.tune_file}: {autotune.format_settings(settings)}')
+    for option, value in settings.items():
+        if getattr(args, option) == parser.get_default(option):
+            setattr(args, option, value)
+
+def log_profile(stages):
+    """
+    Logs the profile of the run: the timings of each stage and the slowest files and codes.
+
+    Args:
+        stages (dict): The profile of each stage, as returned by util.Profiler.report.
+    """
+    slowest_files, slowest_codes = [], []
+    for stage, profile in stages.items():
+        util.Logger.info(f'Profile {stage}: {profile["calls"]} calls, wall {profile["wall"]:.3f}s, CPU {profile["cpu"]:.3f}s, '
+                         f'p50 {1000 * profile["p50"]:.2f}ms, p95 {1000 * profile["p95"]:.2f}ms, p99 {1000 * profile["p99"]:.2f}ms, max {1000 * profile["max"]:.2f}ms')
+        for call in profile['slowest']:
+            (slowest_codes if profile['code'] else slowest_files).append((call['wall'], stage, call))
+    for wall, stage, call in sorted(slowest_files, key=lambda item: item[0], reverse=True)[:args.profile_top]:
+        util.Logger.info(f'Profile slowest file: {1000 * wall:.2f}ms {stage} {call["key"]}')
+    for wall, stage, call in sorted(slowest_codes, key=lambda item: item[0], reverse=True)[:args.profile_top]:
+        util.Logger.info(f'Profile slowest code: {1000 * wall:.2f}ms {stage} {call["file"] or "-"} {call["key"]!r}')
+    util.Logger.info(f'Profile saved to {os.path.join(args.profile_dir, "profile.json")}')
 
-        if args.extract_executions:
-            process_executions(user_entry, semester_obj, course_obj, data_lists)
+def progress_plan(dataset_path):
+    """
+    Returns the inventory the progress report takes the planned work from, or None if it would cost a pass over a tarball.
 
-        if args.extract_solutions:
-            process_solutions(user_entry, semester_obj, course_obj, data_lists)
+    Args:
+        dataset_path (str): Path to the dataset directory or tarball.
+    """
+    if os.path.isdir(dataset_path):
+        return inventory.Inventory.from_directory(dataset_path, dataset_filter)
+    if args.use_index and archive.load_index(dataset_path) is not None:
+        return inventory.Inventory.from_archive(dataset_path, dataset_filter)
+    util.Logger.info('The archive has no index yet, the progress is reported without the work left')
+    return None
+
+def plan_run(dataset_path):
+    """
+    Inventories a dataset directory or tarball and logs the estimated run time of each extraction flag.
 
-        if args.extract_logins:
-            process_logins(user_entry, semester_obj, course_obj, data_lists)
+    Nothing is extracted: the files are listed from the directory entries or the tar headers, and the
+    estimates are calibrated by timing the extraction of a small sample of each kind of file.
 
-        if args.extract_grades:
-            process_grades(user_entry, semester_obj, course_obj, data_lists)
-        
-        if args.extract_codemirror:
-            print(f'CODE ==> {args.extract_codemirror}')
-            process_codemirror(user_entry, semester_obj, course_obj, data_lists)
+    Args:
+        dataset_path (str): Path to the dataset directory or tarball.
+    """
+    if os.path.isdir(dataset_path):
+        dataset_inventory = inventory.Inventory.from_directory(dataset_path, dataset_filter)
+    else:
+        dataset_inventory = inventory.Inventory.from_archive(dataset_path, dataset_filter, args.use_index)
+    if dataset_filter.has_date_window():
+        util.Logger.warn('The assignment dates are not applied by the plan, the files of every assignment are counted')
+    timings = inventory.calibrate(inventory.read_samples(dataset_inventory, dataset_path, args.use_index))
+    for line in inventory.report(dataset_inventory, inventory.estimate(dataset_inventory, timings), args.workers):
+        util.Logger.info(line)
 
 # Main execution starts here
 if __name__ == "__main__":
-    util.Logger.configure() # Configure logging and record start time
-    if args.dataset:
-        # Initialize lists to hold extracted data
-        data_lists = {name: [] for name in [
-            util.CODE_SEMESTER,
-            util.CODE_COURSE,
-            util.CODE_ASSIGNMENT,
-            util.CODE_USER,
-            util.CODE_EXECUTION,
-            util.CODE_SOLUTION,
-            util.CODE_LOGIN,
-            util.CODE_GRADE,
-            util.CODE_CODEMIRROR
-        ]}
-        util.Logger.info(f'Extracting data from directory: {args.dataset}')
-        file = tarfile.open(args.dataset)
-        file.extractall('data')
-        file.close()
-
-        start_time = time.time()
-        util.Logger.info(f'Starting Data Collection: {time.ctime(start_time)}')
-        process_directories('data', data_lists)
-        end_time = time.time()
-        util.Logger.info(f'Task Completed: {time.ctime(end_time)}')
-        util.Logger.info(f'Duration: {end_time - start_time}s')
-
-        util.save_to_csv(data_lists)
+    util.Logger.configure(args.file_messages, args.file_messages_rate) # Configure logging and record start time
+    util.MetricsCache.configure(args.metrics_cache, args.metrics_cache_size)
+    if args.resume and not args.checkpoint:
+        util.Logger.error("A checkpoint file (--checkpoint) is required to resume a run. Exiting...")
+        exit(1)
+    if tuned_settings:
+        util.Logger.info(f'Using the settings tuned in {args.tune_file}: {autotune.format_settings(tuned_settings)}')
+    elif tuned_settings_error:
+        util.Logger.warn(f'Ignoring the tuned settings: {tuned_settings_error}')
+    if args.dataset and args.auto_tune:
+        auto_tune(args.dataset)
+    if args.dataset and args.plan:
+        plan_run(args.dataset)
+    elif args.dataset:
+        # Initialize the writers that save the extracted data in batches
+        data_lists = util.open_writers(args.batch_size, args.output_format)
+        dataset_dir = args.dataset
+        if not os.path.isdir(args.dataset) and not args.stream:
+            util.Logger.info(f'Extracting data from directory: {args.dataset}')
+            file = tarfile.open(args.dataset)
+            file.extractall('data')
+            file.close()
+            dataset_dir = 'data'
+
+        if args.profile:
+            util.Profiler.enable(args.profile_dir, args.profile_top, args.cprofile)
+        run_report = None
+        if args.report:
+            report_file = args.report_file or os.path.join(util.Logger.LOGS_DIR, f'{datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}_report.json')
+            run_report = report.RunReport(report_file, vars(args))
+            data_lists[util.CODE_SEMESTER].keep_rows()
+            util.Progress.enable() # The files and bytes read are taken from the progress counters
+        dataset_inventory = None
+        progress_reporter = None
+        if args.progress or args.status_file:
+            dataset_inventory = progress_plan(dataset_dir if os.path.isdir(dataset_dir) else args.dataset)
+            planned = None if dataset_inventory is None else progress.planned_work(dataset_inventory, args)
+            progress_reporter = progress.ProgressReporter(planned, args.progress, args.status_file, args.progress_interval)
+            progress_reporter.start()
+
+        run_state = 'failed'
+        try:
+            start_time = time.time()
+            util.Logger.info(f'Starting Data Collection: {time.ctime(start_time)}')
+            if os.path.isdir(dataset_dir) and args.pipeline:
+                if args.manifest or args.checkpoint:
+                    util.Logger.warn('The files manifest and the checkpoint are not used by the pipeline, extracting everything')
+                util.Logger.info(f'Extracting with the pipeline: {args.io_threads} read threads, {args.parse_threads} parse threads, {args.metrics_processes} metrics processes')
+                pipeline.Pipeline(args, dataset_filter, args.io_threads, args.parse_threads, args.metrics_processes, args.queue_size).run(dataset_dir, data_lists)
+            elif os.path.isdir(dataset_dir) and args.schedule != 'users':
+                if args.manifest or args.checkpoint:
+                    util.Logger.warn('The files manifest and the checkpoint are not used by the file scheduler, extracting everything')
+                # The task costs come from a single listing of the dataset, also logged as its inventory
+                dataset_inventory = dataset_inventory or inventory.Inventory.from_directory(dataset_dir, dataset_filter)
+                users, files, sizes = dataset_inventory.totals()
+                util.Logger.info(f'Dataset inventory: {users} users, {sum(files.values())} files ({inventory.format_size(sum(sizes.values()))}), listed in {dataset_inventory.elapsed:.2f}s')
+                util.Logger.info(f'Extracting user files with {args.workers} worker processes, {args.schedule} schedule')
+                task_scheduler = scheduler.Scheduler(args.workers, args.schedule, args.schedule_window, args.schedule_buffer_rows)
+                task_scheduler.run(pipeline.walk_dataset(dataset_dir, args, dataset_filter, dataset_inventory.scan), data_lists)
+                metrics_cache_stats.update(task_scheduler.cache_stats)
+            elif os.path.isdir(dataset_dir):
+                if args.checkpoint:
+                    util.Logger.info(f'{"Resuming from" if args.resume else "Saving"} checkpoint: {args.checkpoint}')
+                    checkpoint_options = {option: getattr(args, option) for option in MANIFEST_OPTIONS}
+                    checkpoint_options['dataset'] = os.path.abspath(dataset_dir)
+                    checkpoint = manifest.Checkpoint(args.checkpoint, checkpoint_options, args.resume)
+                if args.manifest:
+                    util.Logger.info(f'Using files manifest: {args.manifest}')
+                    files_manifest = manifest.Manifest(args.manifest, {option: getattr(args, option) for option in MANIFEST_OPTIONS})
+                if args.workers > 1:
+                    util.Logger.info(f'Extracting user directories with {args.workers} worker processes')
+                    executor = util.process_pool(args.workers)
+                process_directories(dataset_dir, data_lists)
+                if executor is not None:
+                    executor.shutdown()
+            else:
+                if args.manifest or args.checkpoint:
+                    util.Logger.warn('The files manifest and the checkpoint only apply to dataset directories (see --no-stream), extracting everything')
+                util.Logger.info(f'Streaming data from archive: {args.dataset}')
+                process_archive(args.dataset, data_lists)
+            end_time = time.time()
+            util.Logger.info(f'Task Completed: {time.ctime(end_time)}')
+            util.Logger.info(f'Duration: {end_time - start_time}s')
+            if run_report is not None:
+                run_report.timings['extraction'] = end_time - start_time
+            util.Logger.info(f'Filters: {dataset_filter.summary()}')
+
+            util.MetricsCache.flush()
+            metrics_cache_stats.update(util.MetricsCache.pop_stats())
+            if util.MetricsCache.enabled():
+                util.Logger.info(f'Metrics cache: {metrics_cache_stats["hits"]} hits, {metrics_cache_stats["misses"]} misses')
+            if files_manifest is not None:
+                util.Logger.info(f'Files manifest: {files_manifest.stats["reused"]} user directories unchanged, {files_manifest.stats["extracted"]} extracted')
+            if checkpoint is not None:
+                util.Logger.info(f'Checkpoint: {checkpoint.stats["reused"]} user directories resumed, {checkpoint.stats["extracted"]} extracted')
+            run_state = 'finished'
+        finally:
+            # Rows extracted so far are saved even if the run fails
+            close_start = time.time()
+            util.close_writers(data_lists)
+            close_end = time.time()
+            if progress_reporter is not None:
+                progress_reporter.stop(run_state)
+            stages = util.Profiler.report() if args.profile else None
+            if stages is not None:
+                log_profile(stages)
+            if files_manifest is not None:
+                files_manifest.close()
+            if checkpoint is not None:
+                checkpoint.close()
+            if run_report is not None:
+                run_report.timings['closing'] = close_end - close_start
+                # The errors logged by the worker processes are tallied once every queued message is written
+                util.Logger.drain()
+                run_report.save(run_state, args.dataset, data_lists, stages, metrics_cache_stats)
+                util.Logger.info(f'Run report saved to {run_report.path}')
     else:
         util.Logger.error("Dataset path was not provided. Exiting...")
         exit(1)
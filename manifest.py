@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+### Codebench Dataset Extractor by Marcos Lima (marcos.lima@icomp.ufam.edu.br)
+### Universidade Federal do Amazonas - UFAM
+### Instituto de Computação - IComp
+
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import zlib
+
+from collections import Counter
+
+# Version of the manifest contents, bumped whenever the stored results would differ for the same files
+# (a new column, a change in a metric, ...), so results saved by older versions are extracted again
+MANIFEST_VERSION = 1
+
+# Size of the chunks read when hashing a file
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_hash(path: str):
+    """Returns the SHA-256 hash of the content of a file."""
+    digest = hashlib.sha256()
+    with open(path, mode='rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def scan_files(path: str):
+    """
+    Lists the regular files under a directory.
+
+    Parameters:
+        path (str): The directory path.
+
+    Returns:
+        list: A (relative path, size, modification time in ns) tuple for each file, sorted by path.
+    """
+    files = []
+    pending = ['']
+    while pending:
+        relative_dir = pending.pop()
+        for entry in os.scandir(os.path.join(path, relative_dir)):
+            relative_path = os.path.join(relative_dir, entry.name)
+            if entry.is_dir():
+                pending.append(relative_path)
+            elif entry.is_file():
+                stat = entry.stat()
+                files.append((relative_path.replace(os.sep, '/'), stat.st_size, stat.st_mtime_ns))
+    return sorted(files)
+
+
+def fingerprint(path: str, known=None):
+    """
+    Returns the fingerprint of the files under a directory.
+
+    Only files that are new or whose size or modification time changed are read and hashed; the
+    hashes of the other files are taken from the known entries.
+
+    Parameters:
+        path (str): The directory path.
+        known (dict, optional): The (size, mtime, hash) tuples recorded for each relative path.
+
+    Returns:
+        list: A (relative path, size, mtime, hash) tuple for each file, sorted by path.
+    """
+    known = known or {}
+    files = []
+    for relative_path, size, mtime in scan_files(path):
+        entry = known.get(relative_path)
+        if entry is not None and entry[0] == size and entry[1] == mtime:
+            content_hash = entry[2]
+        else:
+            content_hash = file_hash(os.path.join(path, relative_path))
+        files.append((relative_path, size, mtime, content_hash))
+    return files
+
+
+class ResultStore:
+    """
+    Base class of the SQLite stores that keep the results extracted from each user directory.
+
+    Results are saved along with a digest of what they depend on, and are only taken back while
+    the digest still matches. The stores are only used by the main process.
+
+    Attributes:
+        path (str): The path of the SQLite file.
+        options (dict): The extraction options the stored results depend on.
+        stats (Counter): The number of 'reused' and 'extracted' directories in this run.
+    """
+
+    def __init__(self, path: str, options: dict):
+        self.path = path
+        self.options = options
+        self.stats = Counter(reused=0, extracted=0)
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS results (dir TEXT PRIMARY KEY, digest TEXT, value BLOB)')
+
+    def digest(self, files=(), skipped_assignments=frozenset()):
+        """
+        Returns the digest of the stored version, the extraction options, a directory fingerprint and the
+        assignments whose files are skipped, which the date filter derives from the assignment files of the
+        course rather than from the directory.
+        """
+        digest = hashlib.sha256(json.dumps([MANIFEST_VERSION, self.options, sorted(skipped_assignments)], sort_keys=True).encode())
+        for relative_path, size, mtime, content_hash in files:
+            digest.update(f'\0{relative_path}\0{content_hash}'.encode())
+        return digest.hexdigest()
+
+    def contains(self, key: str, digest: str):
+        """Tells whether results are stored for a directory under the given digest, without loading them."""
+        return self.connection.execute('SELECT 1 FROM results WHERE dir = ? AND digest = ?', (key, digest)).fetchone() is not None
+
+    def load(self, key: str, digest: str):
+        """Returns the results stored for a directory under the given digest, or None."""
+        row = self.connection.execute('SELECT value FROM results WHERE dir = ? AND digest = ?', (key, digest)).fetchone()
+        if row is None:
+            return None
+        self.stats['reused'] += 1
+        return pickle.loads(zlib.decompress(row[0]))
+
+    def save(self, key: str, digest: str, results):
+        """Stores the results extracted from a directory under the given digest."""
+        value = zlib.compress(pickle.dumps(results, pickle.HIGHEST_PROTOCOL))
+        self.connection.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?)', (key, digest, value))
+        self.stats['extracted'] += 1
+
+    def commit(self):
+        """Writes the stored entries to the SQLite file."""
+        self.connection.commit()
+
+    def close(self):
+        """Commits the pending entries and closes the SQLite file."""
+        self.commit()
+        self.connection.close()
+
+
+class Manifest(ResultStore):
+    """
+    A record of the source files processed by the extractor and of the results extracted from them.
+
+    For every user directory the manifest keeps the size, modification time and content hash of its
+    files, together with the rows and counters extracted from it. A later run takes the stored results
+    of the directories whose files did not change, so only new or changed directories are extracted
+    again. Files are only hashed when their size or modification time changed, and directories are
+    keyed by their path inside the dataset, so a new release extracted somewhere else is still matched
+    by content.
+    """
+
+    def __init__(self, path: str, options: dict):
+        super().__init__(path, options)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS files (dir TEXT, path TEXT, size INTEGER, mtime INTEGER, hash TEXT, PRIMARY KEY (dir, path))')
+
+    def known_files(self, key: str):
+        """Returns the (size, mtime, hash) tuples recorded for the files of a directory, by relative path."""
+        rows = self.connection.execute('SELECT path, size, mtime, hash FROM files WHERE dir = ?', (key,))
+        return {path: (size, mtime, content_hash) for path, size, mtime, content_hash in rows}
+
+    def lookup(self, key: str, path: str, skipped_assignments=frozenset()):
+        """
+        Tells whether results are stored for a directory and none of its files changed. The results are
+        not loaded, so they can be taken with load only when they are needed.
+
+        Parameters:
+            key (str): The directory path inside the dataset.
+            path (str): The directory path on disk.
+            skipped_assignments (frozenset): The codes of the assignments whose files are skipped.
+
+        Returns:
+            tuple: The digest to load the stored results with, or None if the directory has to be extracted,
+                and the directory fingerprint, or None if the directory is not in the manifest yet.
+        """
+        known = self.known_files(key)
+        if not known:
+            return None, None
+        files = fingerprint(path, known)
+        digest = self.digest(files, skipped_assignments)
+        if not self.contains(key, digest):
+            return None, files
+        if any(known.get(relative_path) != (size, mtime, content_hash) for relative_path, size, mtime, content_hash in files):
+            # Same contents with new modification times: record them to skip hashing next time
+            self.__save_files(key, files)
+        return digest, files
+
+    def store(self, key: str, files, results, skipped_assignments=frozenset()):
+        """
+        Stores the results extracted from a directory.
+
+        Parameters:
+            key (str): The directory path inside the dataset.
+            files (list): The directory fingerprint taken before its files were extracted.
+            results: The picklable results extracted from the directory.
+            skipped_assignments (frozenset): The codes of the assignments whose files were skipped.
+        """
+        self.__save_files(key, files)
+        self.save(key, self.digest(files, skipped_assignments), results)
+
+    def __save_files(self, key, files):
+        self.connection.execute('DELETE FROM files WHERE dir = ?', (key,))
+        self.connection.executemany('INSERT INTO files VALUES (?, ?, ?, ?, ?)', [(key, *entry) for entry in files])
+
+
+class Checkpoint(ResultStore):
+    """
+    The results of the user directories already extracted by a run, saved as soon as each one is done.
+
+    An interrupted run can be resumed from its checkpoint: the finished directories are taken from it
+    and only the remaining ones are extracted, giving the same output as an uninterrupted run. Unlike
+    the manifest, files are not checked, since resuming assumes the dataset did not change in between;
+    the results are only reused with the same dataset and extraction options.
+    """
+
+    def __init__(self, path: str, options: dict, resume: bool = False):
+        super().__init__(path, options)
+        if not resume:
+            # A new run starts a new checkpoint
+            self.connection.execute('DELETE FROM results')
+            self.commit()
+
+    def lookup(self, key: str, skipped_assignments=frozenset()):
+        """
+        Returns the digest to load the results saved for a directory by the checkpointed run with, or None if
+        it was not finished. The results are not loaded, so they can be taken with load only when they are needed.
+        """
+        digest = self.digest(skipped_assignments=skipped_assignments)
+        return digest if self.contains(key, digest) else None
+
+    def store(self, key: str, results, skipped_assignments=frozenset()):
+        """Saves the results extracted from a directory and commits them, so they survive a crash."""
+        self.save(key, self.digest(skipped_assignments=skipped_assignments), results)
+        self.commit()
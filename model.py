@@ -7,6 +7,9 @@
 class CodebenchObject:
     """General class that specifies model object base structure."""
 
+    # No per-instance dict is added by the base class, so subclasses that declare slots stay compact
+    __slots__ = ()
+
     def as_list(self):
         """Return a list with model object attributes values."""
         pass
@@ -879,6 +882,11 @@ class Execution(CodebenchObject):
             'identifiers_mean_len'
         ]
 
+    # Attributes are kept in fixed slots, in column order, instead of a per-instance dict:
+    # these records are created for every execution and solution and dominate memory use
+    # (their footprint per record is measured by 'benchmark.py --memory')
+    __slots__ = tuple(get_attr_names.__func__())
+
 
 class Login(CodebenchObject):
     """Model object that represents a Codebench User Login Event.
@@ -1609,6 +1617,11 @@ class SolutionMetrics(CodebenchObject):
             'identifiers_mean_len'
         ]
 
+    # Attributes are kept in fixed slots, in column order, instead of a per-instance dict:
+    # these records are created for every execution and solution and dominate memory use
+    # (their footprint per record is measured by 'benchmark.py --memory')
+    __slots__ = tuple(get_attr_names.__func__())
+
 
 class MouseEvent(CodebenchObject):
     """
@@ -0,0 +1,387 @@
+# -*- coding: utf-8 -*-
+### Codebench Dataset Extractor by Marcos Lima (marcos.lima@icomp.ufam.edu.br)
+### Universidade Federal do Amazonas - UFAM
+### Instituto de Computação - IComp
+
+import io
+import os
+import queue
+import threading
+import time
+import util
+
+from collections import namedtuple
+
+# Marks the end of the tasks of a queue
+STOP = object()
+
+# Functions that parse the content of each kind of file into model objects. Executions and solutions
+# receive a function that collects their codes, whose metrics are computed by the metrics stage.
+PARSERS = {
+    util.CODE_USER: lambda task, file, collect: [util.extract_user(*task.args, task.path, file)],
+    util.CODE_EXECUTION: lambda task, file, collect: list(util.extract_executions(*task.args, task.path, file, collect)),
+    util.CODE_SOLUTION: lambda task, file, collect: [util.extract_solution(*task.args, task.path, file, collect)],
+    util.CODE_LOGIN: lambda task, file, collect: util.extract_user_logins(*task.args, task.path, file),
+    util.CODE_GRADE: lambda task, file, collect: [util.extract_grade(*task.args, task.path, file)],
+    util.CODE_CODEMIRROR: lambda task, file, collect: util.extract_codemirror_events(*task.args, task.path, file)
+}
+
+
+# A directory entry seen by the walker: its name, path, size in bytes (0 for directories) and whether it is a directory
+Entry = namedtuple('Entry', ['name', 'path', 'size', 'is_dir'])
+
+
+class Task:
+    """
+    A unit of work flowing through the pipeline: a file to read and parse, or rows ready to be written.
+
+    Attributes:
+        seq (int): The position of the task in walk order; rows are written in this order.
+        key (int): The dataset code of the rows (CODE_USER, CODE_EXECUTION, ...).
+        path (str): The path given to the extraction function.
+        source (str): The path of the file to read, or None if there is nothing to read.
+        args (tuple): The leading arguments of the extraction function (semester, course, ...).
+        content (bytes): The file content, once read.
+        objects (list): The model objects parsed from the content.
+        codes (list): The (object, code) pairs whose metrics are still to be computed.
+        rows (list): The rows to write.
+        error (Exception): The error raised while handling the task, raised again by the writer.
+        cost (int): The estimated cost of the task: the size of the file to read, in bytes.
+    """
+
+    __slots__ = ('seq', 'key', 'path', 'source', 'args', 'content', 'objects', 'codes', 'rows', 'error', 'cost')
+
+    def __init__(self, seq: int, key: int, path: str = None, source: str = None, args: tuple = (), rows: list = None, cost: int = 0):
+        self.seq = seq
+        self.key = key
+        self.path = path
+        self.source = source
+        self.cost = cost
+        self.args = args
+        self.content = None
+        self.objects = None
+        self.codes = None
+        self.rows = rows
+        self.error = None
+
+
+class Stage:
+    """
+    A pipeline stage: worker threads that take tasks from an input queue, handle them and put them in the output queue.
+
+    Tasks that already failed, or that carry rows only, are passed on untouched. The stage records how many
+    tasks it handled, how long its workers were busy and how many tasks were waiting in its input queue.
+
+    Attributes:
+        name (str): The stage name, used in the report.
+        workers (int): The number of worker threads.
+        tasks (int): The number of tasks handled.
+        busy (float): The time spent handling tasks, summed over the workers, in seconds.
+        depth_max (int): The largest number of tasks found waiting in the input queue.
+    """
+
+    def __init__(self, name: str, handler, workers: int, input_queue: queue.Queue, output_queue: queue.Queue):
+        self.name = name
+        self.workers = workers
+        self.tasks = 0
+        self.busy = 0.0
+        self.depth_max = 0
+        self.__depth_sum = 0
+        self.__handler = handler
+        self.__input = input_queue
+        self.__output = output_queue
+        self.__lock = threading.Lock()
+        self.__running = workers
+
+    def start(self):
+        """Starts the worker threads."""
+        for i in range(self.workers):
+            threading.Thread(target=self.__run, name=f'{self.name}-{i}', daemon=True).start()
+
+    def record(self, depth: int, busy: float):
+        """Records a handled task, the input queue depth found before taking it and the time spent on it."""
+        with self.__lock:
+            self.tasks += 1
+            self.busy += busy
+            self.__depth_sum += depth
+            self.depth_max = max(self.depth_max, depth)
+
+    def __run(self):
+        while True:
+            depth = self.__input.qsize()
+            task = self.__input.get()
+            if task is STOP:
+                with self.__lock:
+                    self.__running -= 1
+                    last = self.__running == 0
+                # The last worker to stop tells the next stage; the others leave the mark to their siblings
+                (self.__output if last else self.__input).put(STOP)
+                return
+            start = time.perf_counter()
+            if task.error is None and task.source is not None:
+                try:
+                    self.__handler(task)
+                except Exception as err:
+                    task.error = err
+            self.record(depth, time.perf_counter() - start)
+            self.__output.put(task)
+
+    def report(self, elapsed: float):
+        """Returns the stage statistics as text."""
+        utilization = 100 * self.busy / (self.workers * elapsed) if elapsed > 0 else 0
+        depth_mean = self.__depth_sum / self.tasks if self.tasks else 0
+        return (f'Pipeline stage {self.name}: {self.workers} workers, {self.tasks} tasks, busy {self.busy:.2f}s ({utilization:.0f}%), '
+                f'input queue depth mean {depth_mean:.1f} max {self.depth_max}')
+
+
+class Pipeline:
+    """
+    Extracts a dataset directory with a staged producer/consumer pipeline, so disk I/O and CPU work overlap.
+
+    Stages are linked by bounded queues and each one has its own concurrency:
+        - walk: a thread that visits the directories, applies the filters, reads the semesters, courses and
+          assignments, and creates a task for every user file to extract;
+        - read: I/O threads that read the file contents;
+        - parse: threads that parse the contents with the util.extract_* functions;
+        - metrics: threads that take the code metrics from the MetricsCache or have worker processes compute them;
+        - write: the calling thread, which saves the rows in walk order.
+
+    Rows are written in the same order as the sequential extraction, so the output is the same. The number
+    of tasks between the walk and the write stages is bounded, which bounds the memory in use.
+
+    Attributes:
+        stages (list): The stages, in pipeline order, with their statistics.
+    """
+
+    def __init__(self, options, dataset_filter, io_threads: int = 4, parse_threads: int = 2, metrics_processes: int = 1, queue_size: int = 64):
+        """
+        Initialize the pipeline.
+
+        Parameters:
+            options (Namespace): The extraction options (extract_executions, extract_solutions, ...).
+            dataset_filter (DatasetFilter): Selects the semesters, courses, users and assignments to extract.
+            io_threads (int): Number of threads reading files.
+            parse_threads (int): Number of threads parsing files.
+            metrics_processes (int): Number of processes computing code metrics, or 0 to compute them in the metrics threads.
+            queue_size (int): Capacity of each queue between stages.
+        """
+        self.options = options
+        self.filter = dataset_filter
+        self.metrics_processes = metrics_processes
+        self.__queues = [queue.Queue(queue_size) for i in range(4)]
+        self.__walk = Stage('walk', None, 1, queue.Queue(), self.__queues[0])
+        self.__write = Stage('write', None, 1, self.__queues[3], None)
+        self.stages = [
+            self.__walk,
+            Stage('read', self.__read, io_threads, self.__queues[0], self.__queues[1]),
+            Stage('parse', self.__parse, parse_threads, self.__queues[1], self.__queues[2]),
+            Stage('metrics', self.__compute_metrics, max(metrics_processes, 1), self.__queues[2], self.__queues[3]),
+            self.__write
+        ]
+        # Tasks between the walk and the write stages: the writer may hold finished tasks until their turn
+        self.__in_flight = threading.BoundedSemaphore(queue_size * 4 + io_threads + parse_threads + max(metrics_processes, 1))
+        self.__cache_lock = threading.Lock()
+        self.__pool = None
+
+    def run(self, dataset_path: str, data_lists: dict):
+        """
+        Extracts a dataset directory.
+
+        Parameters:
+            dataset_path (str): Path to the dataset directory.
+            data_lists (dict): The writer (or row list) of each dataset, by dataset code.
+        """
+        start_time = time.perf_counter()
+        if self.metrics_processes > 0:
+            self.__pool = util.process_pool(self.metrics_processes)
+            # Start the worker processes before the pipeline threads, so they are not forked from a busy process
+            self.__pool.submit(int).result()
+        try:
+            threading.Thread(target=self.__run_walk, args=(dataset_path,), name='walk', daemon=True).start()
+            for stage in self.stages[1:-1]:
+                stage.start()
+            self.__run_write(data_lists)
+        finally:
+            if self.__pool is not None:
+                self.__pool.shutdown(wait=True, cancel_futures=True)
+            elapsed = time.perf_counter() - start_time
+            for stage in self.stages:
+                util.Logger.info(stage.report(elapsed))
+
+    def __run_walk(self, dataset_path):
+        start = time.perf_counter()
+        wait = 0.0
+        seq = 0
+        try:
+            for task in walk_dataset(dataset_path, self.options, self.filter):
+                wait_start = time.perf_counter()
+                self.__in_flight.acquire()
+                self.__queues[0].put(task)
+                wait += time.perf_counter() - wait_start
+                seq = task.seq + 1
+        except Exception as err:
+            # The error reaches the writer after the tasks already created
+            task = Task(seq, None)
+            task.error = err
+            self.__in_flight.acquire()
+            self.__queues[0].put(task)
+        self.__walk.record(0, time.perf_counter() - start - wait)
+        self.__walk.tasks = seq
+        self.__queues[0].put(STOP)
+
+    def __read(self, task):
+        with open(task.source, mode='rb') as f:
+            task.content = f.read()
+
+    def __parse(self, task):
+        task.codes = []
+        task.objects = PARSERS[task.key](task, io.BytesIO(task.content), lambda obj, code: task.codes.append((obj, code)))
+        task.content = None
+
+    def __compute_metrics(self, task):
+        if task.codes:
+            with self.__cache_lock:
+                metrics = {code: util.MetricsCache.lookup(code) for obj, code in task.codes}
+            missing = [code for code, code_metrics in metrics.items() if code_metrics is None]
+            if missing:
+                if self.__pool is not None:
+                    computed = list(self.__pool.map(util.compute_code_metrics, missing))
+                else:
+                    computed = [util.compute_code_metrics(code) for code in missing]
+                with self.__cache_lock:
+                    for code, code_metrics in zip(missing, computed):
+                        metrics[code] = code_metrics
+                        util.MetricsCache.store(code, code_metrics)
+            # The errors of a computed code were logged by compute_code_metrics, those of its other records are logged again
+            logged = set(missing)
+            for obj, code in task.codes:
+                if code in logged:
+                    logged.discard(code)
+                else:
+                    util.Logger.replay_metrics_errors(metrics[code].get(util.METRICS_ERRORS_KEY, ()))
+                util.apply_code_metrics(obj, metrics[code])
+        task.rows = [obj.as_list() for obj in task.objects]
+        task.objects = task.codes = None
+
+    def __run_write(self, data_lists):
+        finished = {} # Tasks done ahead of their turn, by sequence number
+        next_seq = 0
+        while True:
+            depth = self.__queues[3].qsize()
+            task = self.__queues[3].get()
+            if task is STOP:
+                break
+            finished[task.seq] = task
+            start = time.perf_counter()
+            while next_seq in finished:
+                task = finished.pop(next_seq)
+                next_seq += 1
+                self.__in_flight.release()
+                if task.error is not None:
+                    raise task.error
+                data_lists[task.key].extend(task.rows)
+            self.__write.record(depth, time.perf_counter() - start)
+
+
+def scan_entries(path: str):
+    """Lists a directory like util.scan_directory, with the size of each file."""
+    return [
+        Entry(entry.name, entry.path, 0 if entry.is_dir() else entry.stat().st_size, entry.is_dir())
+        for entry in util.scan_directory(path)
+    ]
+
+def walk_dataset(dataset_path: str, options, dataset_filter, scan=None):
+    """
+    Visits a dataset directory and creates the tasks that extract it, in the order of the sequential extraction.
+
+    Semesters, courses and assignments are read on the way and handed over as rows; the counters of the
+    semester and course objects are updated as their user files are found, so their rows (created after
+    their users) are complete. Every user file to extract becomes a task whose cost is the file size.
+
+    Parameters:
+        dataset_path (str): Path to the dataset directory.
+        options (Namespace): The extraction options (extract_executions, extract_solutions, ...).
+        dataset_filter (DatasetFilter): Selects the semesters, courses, users and assignments to extract.
+        scan (function, optional): Lists a directory as Entry tuples sorted by name, e.g. from an inventory
+            taken beforehand so the directories are not read twice. Defaults to scan_entries.
+
+    Yields:
+        Task: The tasks, numbered in walk order.
+    """
+    seq = 0
+    for task in _walk_tasks(dataset_path, options, dataset_filter, scan or scan_entries):
+        task.seq = seq
+        seq += 1
+        yield task
+
+def _walk_tasks(dataset_path, options, dataset_filter, scan):
+    for semester_entry in scan(dataset_path):
+        if not dataset_filter.select_semester(semester_entry.name):
+            continue
+        util.Logger.info(f'New semester found: {semester_entry.path}')
+        semester_obj = util.extract_semester(semester_entry.path)
+        for course_entry in scan(semester_entry.path):
+            if not dataset_filter.select_course(semester_obj.desc, course_entry.name):
+                continue
+            util.Logger.info(f'New course found: {course_entry.path}')
+            semester_obj.n_courses += 1
+            course_obj = util.extract_course(semester_obj.desc, course_entry.name, course_entry.path)
+            yield Task(None, util.CODE_ASSIGNMENT, rows=_walk_assignments(course_entry, semester_obj, course_obj, dataset_filter, scan))
+            skipped_assignments = dataset_filter.skipped_assignments[(semester_obj.desc, course_obj.code)]
+            for user_entry in scan(os.path.join(course_entry.path, 'users')):
+                if dataset_filter.select_user(semester_obj.desc, course_obj.code, user_entry.name):
+                    yield from _walk_user(user_entry, semester_obj, course_obj, skipped_assignments, options, scan)
+            yield Task(None, util.CODE_COURSE, rows=[course_obj.as_list()])
+        yield Task(None, util.CODE_SEMESTER, rows=[semester_obj.as_list()])
+
+def _walk_assignments(course_entry, semester_obj, course_obj, dataset_filter, scan):
+    rows = []
+    for assignment_entry in scan(os.path.join(course_entry.path, 'assessments')):
+        new_assignment = util.extract_assignment(semester_obj.desc, course_obj.code, assignment_entry.path)
+        if not dataset_filter.select_assignment(new_assignment):
+            continue
+        util.Logger.detail(f'New assignment found: {assignment_entry.path}')
+        semester_obj.n_assignments += 1
+        course_obj.n_assignments += 1
+        rows.append(new_assignment.as_list())
+    return rows
+
+def _walk_user(user_entry, semester_obj, course_obj, skipped_assignments, options, scan):
+    # Same files, order and counters as main.process_user
+    semester, course, user = semester_obj.desc, course_obj.code, user_entry.name
+    util.Logger.detail(f'New user found: {user_entry.path}')
+    semester_obj.n_users += 1
+    course_obj.n_users += 1
+    # A missing file costs nothing here; reading it fails later, as in the sequential extraction
+    sizes = {entry.name: entry.size for entry in scan(user_entry.path)}
+    user_data_path = os.path.join(user_entry.path, util.USER_DATA_FILENAME)
+    yield Task(None, util.CODE_USER, user_entry.path, user_data_path, (semester, course), cost=sizes.get(util.USER_DATA_FILENAME, 0))
+
+    def user_files(directory):
+        for entry in scan(os.path.join(user_entry.path, directory)):
+            if util.DatasetFilter.file_assignment(entry.name) not in skipped_assignments:
+                yield entry, entry.size
+
+    if options.extract_executions:
+        for entry, size in user_files('executions'):
+            semester_obj.n_executions += 1
+            assignment, problem = os.path.splitext(entry.name)[0].split('_')
+            yield Task(None, util.CODE_EXECUTION, entry.path, entry.path, (semester, course, assignment, user, problem), cost=size)
+    if options.extract_solutions:
+        for entry, size in user_files('codes'):
+            semester_obj.n_codes += 1
+            assignment, problem = os.path.splitext(entry.name)[0].split('_')
+            yield Task(None, util.CODE_SOLUTION, entry.path, entry.path, (semester, course, assignment, user, problem), cost=size)
+    if options.extract_logins:
+        logins_path = os.path.join(user_entry.path, 'logins.log')
+        yield Task(None, util.CODE_LOGIN, logins_path, logins_path, (semester, course, user), cost=sizes.get('logins.log', 0))
+    if options.extract_grades:
+        for entry, size in user_files('grades'):
+            if not entry.name.startswith('final_grade'):
+                semester_obj.n_grades += 1
+                yield Task(None, util.CODE_GRADE, entry.path, entry.path, (semester, course, entry.name[:-4], user), cost=size)
+    if options.extract_codemirror:
+        for entry, size in user_files('codemirror'):
+            semester_obj.n_mirrors += 1
+            assignment, problem = entry.name[:-4].split('_')[:2]
+            yield Task(None, util.CODE_CODEMIRROR, entry.path, entry.path, (semester, course, assignment, user, problem), cost=size)
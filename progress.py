@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+### Codebench Dataset Extractor by Marcos Lima (marcos.lima@icomp.ufam.edu.br)
+### Universidade Federal do Amazonas - UFAM
+### Instituto de Computação - IComp
+
+import inventory
+import json
+import os
+import sys
+import threading
+import time
+import util
+
+from datetime import datetime
+
+# Seconds between two progress reports
+PROGRESS_INTERVAL = 2.0
+
+# Inventory kind of each kind of file counted by the progress report (assignments are not inventoried)
+INVENTORY_KINDS = {
+    'users': 'user',
+    'executions': 'executions',
+    'solutions': 'codes',
+    'logins': 'logins',
+    'grades': 'grades',
+    'codemirror': 'codemirror'
+}
+
+
+def planned_work(dataset_inventory, options):
+    """
+    Returns the files a run is going to read, from the inventory of the dataset.
+
+    Parameters:
+        dataset_inventory (Inventory): The inventory of the dataset.
+        options (Namespace): The extraction options; only the kinds of files they enable are planned.
+
+    Returns:
+        dict: The number of 'files' and 'bytes' of each kind, by the names of util.PROGRESS_KINDS.
+    """
+    users, files, sizes = dataset_inventory.totals()
+    planned = {}
+    for name, kind in INVENTORY_KINDS.items():
+        option = inventory.FILE_KINDS[kind][1]
+        if option is None or getattr(options, option):
+            planned[name] = {'files': files[kind], 'bytes': sizes[kind]}
+    return planned
+
+
+class ProgressReporter:
+    """
+    Reports the progress of a run every few seconds, from the counts of util.Progress: as a line refreshed
+    on the console and as a JSON status file that other programs can poll.
+
+    The report holds the files and bytes read of each kind with their rates over the last interval, the
+    codes whose metrics were computed, the metrics cache hit rate and, when the planned work is known,
+    the fraction of the planned bytes already read and the estimated time left.
+
+    Attributes:
+        planned (dict): The planned files and bytes of each kind, as returned by planned_work, or None.
+        console (bool): Whether the progress line is shown on the console.
+        status_file (str): The path of the JSON status file, or None.
+        interval (float): The seconds between two reports.
+    """
+
+    def __init__(self, planned=None, console: bool = True, status_file: str = None, interval: float = PROGRESS_INTERVAL):
+        self.planned = planned
+        self.console = console
+        self.status_file = status_file
+        self.interval = interval
+        self.__started = None
+        self.__start = None
+        self.__last = None # Counts and time of the previous report, to compute the rates
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    def start(self):
+        """Starts counting and reporting. Must be called before the worker processes are started."""
+        util.Progress.enable()
+        self.__started = datetime.now().isoformat(timespec='seconds')
+        self.__start = time.perf_counter()
+        self.__last = (util.Progress.snapshot(), self.__start)
+        self.__thread = threading.Thread(target=self.__run, name='progress', daemon=True)
+        self.__thread.start()
+
+    def stop(self, state: str = 'finished'):
+        """Stops reporting, after a last report with the final state of the run ('finished' or 'failed')."""
+        self.__stop.set()
+        self.__thread.join()
+        self.report(state)
+        if self.console and sys.stderr.isatty():
+            sys.stderr.write('\n')
+
+    def status(self, state: str = 'running'):
+        """Returns the current progress as a JSON-serializable dict."""
+        now = time.perf_counter()
+        snapshot = util.Progress.snapshot()
+        last, last_time = self.__last
+        self.__last = (snapshot, now)
+        interval = max(now - last_time, 1e-9)
+        elapsed = now - self.__start
+
+        kinds = {}
+        for name in util.PROGRESS_KINDS.values():
+            counts = snapshot[name]
+            kinds[name] = {
+                'files': counts['files'],
+                'bytes': counts['bytes'],
+                'files_per_second': (counts['files'] - last[name]['files']) / interval,
+                'bytes_per_second': (counts['bytes'] - last[name]['bytes']) / interval
+            }
+            if self.planned is not None and name in self.planned:
+                kinds[name]['planned_files'] = self.planned[name]['files']
+                kinds[name]['planned_bytes'] = self.planned[name]['bytes']
+        lookups = snapshot['cache_hits'] + snapshot['cache_misses']
+
+        done = None
+        if self.planned is not None:
+            # Files of the assignments filtered by date are planned but never read, so the fraction may stop short of 1
+            planned_bytes = sum(planned['bytes'] for planned in self.planned.values())
+            done_bytes = sum(min(snapshot[name]['bytes'], planned['bytes']) for name, planned in self.planned.items())
+            planned_files = sum(planned['files'] for planned in self.planned.values())
+            done_files = sum(min(snapshot[name]['files'], planned['files']) for name, planned in self.planned.items())
+            done = 1.0 if state == 'finished' else done_bytes / planned_bytes if planned_bytes else done_files / planned_files if planned_files else None
+        return {
+            'state': state,
+            'started': self.__started,
+            'updated': datetime.now().isoformat(timespec='seconds'),
+            'elapsed': elapsed,
+            'kinds': kinds,
+            'codes': snapshot['codes'],
+            'codes_per_second': (snapshot['codes'] - last['codes']) / interval,
+            'cache_hits': snapshot['cache_hits'],
+            'cache_misses': snapshot['cache_misses'],
+            'cache_hit_rate': snapshot['cache_hits'] / lookups if lookups else None,
+            'done': done,
+            'eta': elapsed * (1 - done) / done if done else None
+        }
+
+    def report(self, state: str = 'running'):
+        """Shows the progress line and writes the status file."""
+        status = self.status(state)
+        if self.console:
+            if sys.stderr.isatty():
+                sys.stderr.write('\r' + self.line(status) + '\033[K')
+            else:
+                sys.stderr.write(self.line(status) + '\n')
+            sys.stderr.flush()
+        if self.status_file:
+            try:
+                temp_path = self.status_file + '.tmp'
+                with open(temp_path, mode='w', encoding=util.DEFAULT_FILE_ENCODING) as f:
+                    json.dump(status, f, indent=2)
+                os.replace(temp_path, self.status_file)
+            except OSError as err:
+                util.Logger.warn(f'Could not write the status file {self.status_file}: {err}')
+
+    @staticmethod
+    def line(status: dict):
+        """Returns the progress as a compact line of text."""
+        parts = []
+        if status['done'] is not None:
+            parts.append(f'{100 * status["done"]:.1f}%')
+        for name, kind in status['kinds'].items():
+            if kind['files']:
+                parts.append(f'{name} {kind["files"]} ({kind["files_per_second"]:.0f}/s, {inventory.format_size(kind["bytes_per_second"])}/s)')
+        if status['codes']:
+            parts.append(f'codes {status["codes"]} ({status["codes_per_second"]:.0f}/s)')
+        if status['cache_hit_rate'] is not None:
+            parts.append(f'cache {100 * status["cache_hit_rate"]:.0f}%')
+        if status['state'] == 'running':
+            parts.append(f'ETA {inventory.format_duration(status["eta"])}')
+        else:
+            parts.append(f'{status["state"]} in {inventory.format_duration(status["elapsed"])}')
+        return 'Progress: ' + ' | '.join(parts)
+
+    def __run(self):
+        while not self.__stop.wait(self.interval):
+            self.report()
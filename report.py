@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+### Codebench Dataset Extractor by Marcos Lima (marcos.lima@icomp.ufam.edu.br)
+### Universidade Federal do Amazonas - UFAM
+### Instituto de Computação - IComp
+
+import hashlib
+import json
+import manifest
+import os
+import platform
+import sys
+import time
+import util
+
+from datetime import datetime
+
+try:
+    import resource
+except ImportError: # Not available on Windows
+    resource = None
+
+# Version of the run report layout, bumped whenever a field is removed or changes meaning
+REPORT_FILE_VERSION = 1
+
+# Bytes read from each end of a tarball for its fingerprint
+FINGERPRINT_SAMPLE_SIZE = 1024 * 1024
+
+
+def dataset_fingerprint(path: str):
+    """
+    Returns a fingerprint that tells whether two runs read the same dataset.
+
+    For a directory it is a hash of the relative path and size of every file, so a copy of the dataset
+    has the same fingerprint. For a tarball, hashing the whole archive would cost a pass over it, so it
+    is a hash of its size and of its first and last megabytes.
+
+    Parameters:
+        path (str): The dataset directory or tarball.
+
+    Returns:
+        dict: The 'type' of dataset ('directory' or 'archive'), its number of 'files' (directories only),
+            its size in 'bytes' and the 'sha256' fingerprint.
+    """
+    digest = hashlib.sha256()
+    if os.path.isdir(path):
+        files = manifest.scan_files(path)
+        for relative_path, size, mtime in files:
+            digest.update(f'{relative_path}\0{size}\n'.encode(util.DEFAULT_FILE_ENCODING))
+        return {'type': 'directory', 'files': len(files), 'bytes': sum(size for relative_path, size, mtime in files), 'sha256': digest.hexdigest()}
+    size = os.path.getsize(path)
+    digest.update(f'{size}\n'.encode(util.DEFAULT_FILE_ENCODING))
+    with open(path, mode='rb') as f:
+        digest.update(f.read(FINGERPRINT_SAMPLE_SIZE))
+        f.seek(max(size - FINGERPRINT_SAMPLE_SIZE, 0))
+        digest.update(f.read(FINGERPRINT_SAMPLE_SIZE))
+    return {'type': 'archive', 'bytes': size, 'sha256': digest.hexdigest()}
+
+
+def semester_counts(writers):
+    """
+    Returns the Semester counters summed over the semesters written, or None when the semester writer did
+    not keep its rows (see util.BatchWriter.keep_rows).
+    """
+    rows = writers[util.CODE_SEMESTER].kept_rows
+    if rows is None:
+        return None
+    header = util.CSV_HEADERS[util.CODE_SEMESTER]()
+    counts = {name: 0 for name in header[1:]}
+    for row in rows:
+        for name, value in zip(header[1:], row[1:]):
+            counts[name] += value
+    counts['semesters'] = len(rows)
+    return counts
+
+
+def output_size(path: str):
+    """Returns the size in bytes of an output file, or of every file under an output directory."""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    size = 0
+    for directory, dirnames, filenames in os.walk(path):
+        size += sum(os.path.getsize(os.path.join(directory, filename)) for filename in filenames)
+    return size
+
+
+def peak_memory():
+    """
+    Returns the peak resident memory of the main process and of the largest worker process, in bytes,
+    or None where the platform does not report it.
+    """
+    if resource is None:
+        return {'main': None, 'workers': None}
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return {
+        'main': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+        'workers': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    }
+
+
+class RunReport:
+    """
+    A machine-readable report of an extraction run, saved as a JSON file when the run ends, whether it
+    finished or failed, so that runs can be compared and regressions spotted.
+
+    The report holds the run parameters, the dataset fingerprint, the entity counts (the Semester
+    counters and the rows of each dataset), the files and bytes read, the stage timings, the peak memory,
+    the code metrics errors by metric group and exception type, and the size of each output file.
+
+    Attributes:
+        path (str): The path of the JSON report.
+        parameters (dict): The command-line options of the run.
+        timings (dict): The seconds spent in each phase of the run, filled by the caller.
+    """
+
+    def __init__(self, path: str, parameters: dict):
+        self.path = path
+        self.parameters = parameters
+        self.timings = {}
+        self.__started = datetime.now().isoformat(timespec='seconds')
+        self.__start = time.perf_counter()
+
+    def content(self, state: str, dataset_path: str, writers, stages=None, metrics_cache_stats=None):
+        """
+        Returns the report as a JSON-serializable dict.
+
+        Parameters:
+            state (str): How the run ended ('finished' or 'failed').
+            dataset_path (str): The dataset directory or tarball given to the run.
+            writers (dict): The closed writers of the run, by dataset code.
+            stages (dict): The profile of each stage, as returned by util.Profiler.report, when profiled.
+            metrics_cache_stats (Counter): The metrics cache 'hits' and 'misses'.
+        """
+        try:
+            dataset = dataset_fingerprint(dataset_path)
+        except OSError as err:
+            util.Logger.warn(f'Could not fingerprint the dataset {dataset_path}: {err}')
+            dataset = None
+        if dataset is not None:
+            dataset['path'] = os.path.abspath(dataset_path)
+
+        snapshot = util.Progress.snapshot() if util.Progress.enabled() else None
+        timings = dict(self.timings, total=time.perf_counter() - self.__start)
+        timings['writing'] = {util.CSV_FILENAMES[key]: writer.write_time for key, writer in writers.items()}
+        if stages is not None:
+            timings['stages'] = {stage: {'calls': profile['calls'], 'wall': profile['wall'], 'cpu': profile['cpu']} for stage, profile in stages.items()}
+
+        return {
+            'version': REPORT_FILE_VERSION,
+            'state': state,
+            'started': self.__started,
+            'finished': datetime.now().isoformat(timespec='seconds'),
+            'machine': {'node': platform.node(), 'cpu_count': os.cpu_count() or 1, 'python': platform.python_version()},
+            'parameters': self.parameters,
+            'dataset': dataset,
+            'counts': {
+                'semesters': semester_counts(writers),
+                'rows': {util.CSV_FILENAMES[key]: writer.n_rows for key, writer in writers.items()}
+            },
+            'read': None if snapshot is None else {name: snapshot[name] for name in util.PROGRESS_KINDS.values()},
+            'codes': None if snapshot is None else snapshot['codes'],
+            'metrics_cache': None if not metrics_cache_stats else dict(metrics_cache_stats),
+            'metrics_failures': util.Logger.failures(),
+            'timings': timings,
+            'peak_memory': peak_memory(),
+            'outputs': {writer.path: output_size(writer.path) for writer in writers.values() if os.path.exists(writer.path)}
+        }
+
+    def save(self, state: str, dataset_path: str, writers, stages=None, metrics_cache_stats=None):
+        """
+        Writes the report, taking the same parameters as content. The file is written to a temporary file
+        first and then renamed, so an interrupted run never leaves a truncated report behind.
+        """
+        content = self.content(state, dataset_path, writers, stages, metrics_cache_stats)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, mode='w', encoding=util.DEFAULT_FILE_ENCODING) as f:
+            json.dump(content, f, indent=2, default=str) # Dates of the filter options are saved as ISO strings
+        os.replace(temp_path, self.path)
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+### Codebench Dataset Extractor by Marcos Lima (marcos.lima@icomp.ufam.edu.br)
+### Universidade Federal do Amazonas - UFAM
+### Instituto de Computação - IComp
+
+import concurrent.futures
+import io
+import pipeline
+import time
+import util
+
+from collections import Counter
+
+# Scheduling strategies: 'static' deals the tasks round-robin in walk order and never moves them, like a
+# static split of the work; 'size' runs the largest tasks of the window first and lets idle workers steal tasks
+SCHEDULES = ['static', 'size']
+
+# Number of tasks taken from the walk ahead of the first task whose rows are not written yet
+SCHEDULE_WINDOW = 256
+
+# Number of rows waiting in the reorder buffer from which only the task in turn is run
+SCHEDULE_BUFFER_ROWS = 10000
+
+
+def run_task(task):
+    """
+    Extracts the file of a task. Runs in the worker processes.
+
+    Parameters:
+        task (Task): The task, as created by pipeline.walk_dataset.
+
+    Returns:
+        tuple: The extracted rows, the time spent in seconds and the metrics cache hits and misses.
+    """
+    start = time.perf_counter()
+    with open(task.source, mode='rb') as f:
+        objects = pipeline.PARSERS[task.key](task, io.BytesIO(f.read()), None)
+    rows = [obj.as_list() for obj in objects]
+    util.MetricsCache.flush()
+    return rows, time.perf_counter() - start, util.MetricsCache.pop_stats()
+
+
+class Scheduler:
+    """
+    Runs the file tasks of a dataset in worker processes, balancing the workers by the estimated task costs.
+
+    Tasks are taken from the walk as they are needed, up to window tasks ahead of the first task whose rows
+    are not written yet, and each one is put in the pending list of a worker. With the 'size' strategy a task
+    goes to the worker with the least pending cost, every worker runs its largest pending task first and a
+    worker left without tasks steals the smallest pending task of the worker with the most pending cost. With
+    the 'static' strategy the tasks are dealt round-robin, run in walk order and never stolen.
+
+    Rows are written in walk order, like the pipeline does: the rows of the tasks finished ahead of their
+    turn wait in a reorder buffer, so the output is the same as the sequential extraction whatever the
+    number of workers and the strategy. Once the buffer holds buffer_rows rows, only the task in turn is
+    run until its rows are written, so the window and the buffer bound the memory in use.
+
+    Attributes:
+        workers (int): The number of worker processes.
+        strategy (str): The scheduling strategy, one of SCHEDULES.
+        window (int): The number of tasks taken from the walk ahead of the first task not written yet.
+        buffer_rows (int): The number of buffered rows from which only the task in turn is run.
+        tasks (int): The number of file tasks run.
+        steals (int): The number of tasks run by a worker other than the one they were assigned to.
+        stalls (int): The number of times a worker was left waiting for the task in turn while tasks remained.
+        buffered_max (int): The largest number of rows held in the reorder buffer.
+        elapsed (float): The time from the first dispatch to the end of the run, in seconds.
+        first_idle (float): The time from the first dispatch until a worker found no task left, in seconds.
+        slowest (tuple): The time spent by the slowest task and its path.
+        cache_stats (Counter): The metrics cache hits and misses reported by the workers.
+    """
+
+    def __init__(self, workers: int, strategy: str = 'size', window: int = SCHEDULE_WINDOW, buffer_rows: int = SCHEDULE_BUFFER_ROWS):
+        self.workers = max(workers, 1)
+        self.strategy = strategy
+        self.window = max(window, 1)
+        self.buffer_rows = buffer_rows
+        self.tasks = 0
+        self.steals = 0
+        self.stalls = 0
+        self.buffered_max = 0
+        self.elapsed = 0.0
+        self.first_idle = None
+        self.slowest = (0.0, None)
+        self.cache_stats = Counter()
+        self.__queues = [[] for i in range(self.workers)] # Pending tasks of each worker
+        self.__loads = [0] * self.workers # Pending cost of each worker
+        self.__walk = None # The tasks not taken from the walk yet, or None once they are all taken
+        self.__last_seq = -1 # Sequence number of the last task taken from the walk
+        self.__next_seq = 0 # Sequence number of the first task whose rows are not written yet
+        self.__finished = {} # Dataset code and rows of the tasks done ahead of their turn, by sequence number
+        self.__buffered = 0 # Rows held in the reorder buffer
+
+    def run(self, tasks, data_lists: dict):
+        """
+        Runs the tasks and saves their rows.
+
+        Parameters:
+            tasks (iterable): The tasks of the dataset, as created by pipeline.walk_dataset.
+            data_lists (dict): The writer (or row list) of each dataset, by dataset code.
+        """
+        self.__walk = iter(tasks)
+        pool = util.process_pool(self.workers)
+        running = {} # Worker and task of each running future
+        idle = list(range(self.workers))
+        start = time.perf_counter()
+        try:
+            while True:
+                self.__advance(data_lists)
+                idle = [worker for worker in idle if not self.__dispatch(pool, running, worker, start)]
+                if not running:
+                    break
+                done, pending = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    worker, task = running.pop(future)
+                    rows, duration, cache_stats = future.result()
+                    self.__buffer(task.seq, task.key, rows)
+                    self.cache_stats.update(cache_stats)
+                    self.slowest = max(self.slowest, (duration, task.source))
+                    idle.append(worker)
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            self.elapsed = time.perf_counter() - start
+        util.Logger.info(self.report())
+
+    def __advance(self, data_lists):
+        # Writes the rows in turn and takes the tasks the window moved over, until neither moves
+        taken = True
+        while taken:
+            self.__write(data_lists)
+            taken = self.__take()
+
+    def __take(self):
+        # Takes the tasks of the window from the walk, handing the file tasks to the workers; returns whether any was taken
+        taken = False
+        while self.__walk is not None and self.__last_seq < self.__next_seq + self.window:
+            task = next(self.__walk, None)
+            if task is None:
+                self.__walk = None
+                break
+            self.__last_seq = task.seq
+            taken = True
+            if task.source is None:
+                self.__buffer(task.seq, task.key, task.rows)
+                continue
+            self.tasks += 1
+            if self.strategy == 'size':
+                worker = min(range(self.workers), key=lambda other: self.__loads[other])
+            else:
+                worker = (self.tasks - 1) % self.workers
+            self.__queues[worker].append(task)
+            self.__loads[worker] += task.cost
+        return taken
+
+    def __buffer(self, seq, key, rows):
+        self.__finished[seq] = (key, rows)
+        self.__buffered += len(rows)
+        self.buffered_max = max(self.buffered_max, self.__buffered)
+
+    def __write(self, data_lists):
+        # Saves the rows of the finished tasks up to the first one not finished yet
+        while self.__next_seq in self.__finished:
+            key, rows = self.__finished.pop(self.__next_seq)
+            self.__buffered -= len(rows)
+            data_lists[key].extend(rows)
+            self.__next_seq += 1
+
+    def __pop(self, worker, task):
+        self.__queues[worker].remove(task)
+        self.__loads[worker] -= task.cost
+        return task
+
+    def __next_task(self, worker):
+        if self.__buffered >= self.buffer_rows:
+            # The buffer is full: only the task in turn is run, by whichever worker is free
+            for other, tasks in enumerate(self.__queues):
+                for task in tasks:
+                    if task.seq == self.__next_seq:
+                        self.steals += other != worker
+                        return self.__pop(other, task)
+            return None
+        tasks = self.__queues[worker]
+        if tasks:
+            if self.strategy == 'size':
+                return self.__pop(worker, max(tasks, key=lambda task: (task.cost, -task.seq)))
+            return self.__pop(worker, tasks[0])
+        if self.strategy == 'size':
+            victim = max(range(self.workers), key=lambda other: self.__loads[other])
+            if self.__queues[victim]:
+                self.steals += 1
+                return self.__pop(victim, min(self.__queues[victim], key=lambda task: (task.cost, -task.seq)))
+        return None
+
+    def __dispatch(self, pool, running, worker, start):
+        # Starts the next task of a worker, returning whether there was one
+        task = self.__next_task(worker)
+        if task is None:
+            if self.__walk is None and not any(self.__queues):
+                if self.first_idle is None:
+                    self.first_idle = time.perf_counter() - start
+            else:
+                self.stalls += 1
+            return False
+        running[pool.submit(run_task, task)] = (worker, task)
+        return True
+
+    def report(self):
+        """Returns the run statistics as text, including the tail latency (from the first idle worker to the end)."""
+        first_idle = self.elapsed if self.first_idle is None else self.first_idle
+        tail = self.elapsed - first_idle
+        share = 100 * tail / self.elapsed if self.elapsed > 0 else 0
+        return (f'Scheduler ({self.strategy}): {self.tasks} tasks on {self.workers} workers in {self.elapsed:.2f}s, {self.steals} steals, '
+                f'{self.stalls} stalls, at most {self.buffered_max} rows buffered, '
+                f'first idle worker at {first_idle:.2f}s, tail latency {tail:.2f}s ({share:.0f}%), '
+                f'slowest task {self.slowest[0]:.2f}s ({self.slowest[1]})')
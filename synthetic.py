@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic Codebench Dataset Generator
+
+Writes a dataset with the layout of the Codebench dataset (semesters, courses, assessments, users and
+their executions, codes, logins, grades and CodeMirror logs), as a directory or a tarball, to benchmark
+the extractor at any scale without sharing the real dataset. The content is chosen at random from a
+seed, so the same options always write the same dataset.
+
+Example: python3 synthetic.py synthetic.tar.gz --scale 10 --seed 42
+"""
+import argparse
+import gzip
+import io
+import os
+import random
+import tarfile
+import time
+import util
+
+from datetime import datetime, timedelta
+
+# Volume of the generated dataset, roughly that of a real semester of the Codebench dataset
+SYNTHETIC_SEMESTERS = 1
+SYNTHETIC_COURSES = 20
+SYNTHETIC_USERS = 50
+SYNTHETIC_ASSIGNMENTS = 7
+SYNTHETIC_PROBLEMS = 5
+SYNTHETIC_ATTEMPTS = 4
+SYNTHETIC_CODE_LINES = 20
+SYNTHETIC_TEST_CASES = 3
+SYNTHETIC_EVENTS = 100
+SYNTHETIC_LOGINS = 30
+SYNTHETIC_ERROR_RATE = 0.1
+
+# First semester and first ids of the generated dataset
+SYNTHETIC_FIRST_YEAR = 2017
+SYNTHETIC_FIRST_COURSE = 10
+SYNTHETIC_FIRST_ASSIGNMENT = 1000
+SYNTHETIC_FIRST_PROBLEM = 10000
+SYNTHETIC_FIRST_USER = 100000
+
+# Modification time of the tarball members, fixed so the same options always write the same tarball
+SYNTHETIC_MTIME = 1500000000
+
+# Errors of the failed executions; a SyntaxError comes with a truncated code
+SYNTHETIC_ERRORS = [
+    ('SyntaxError', 'invalid syntax'),
+    ('NameError', "name 'resultado' is not defined"),
+    ('ValueError', "invalid literal for int() with base 10: ''"),
+    ('ZeroDivisionError', 'division by zero'),
+    ('IndexError', 'list index out of range')
+]
+
+# Answers of the user.data files, by question
+SYNTHETIC_USER_ANSWERS = [
+    ('course id', ['5', '12', '31']),
+    ('course name', ['ciencia da computacao', 'engenharia da computacao', 'matematica']),
+    ('institution id', ['1']),
+    ('institution name', ['universidade federal do amazonas']),
+    ('high school name', ['escola estadual', 'colegio particular', 'instituto federal']),
+    ('school type', ['publica', 'particular']),
+    ('shift', ['manha', 'tarde', 'noite']),
+    ('graduation year', ['2012', '2014', '2015', '2016']),
+    ('has a pc', ['sim', 'nao']),
+    ('share this pc', ['sim', 'nao']),
+    ('this pc has', ['internet', 'sem internet']),
+    ('previous experience of', ['nenhuma', 'python', 'c']),
+    ('worked or interned', ['sim', 'nao']),
+    ('company name', ['', 'empresa']),
+    ('year started working', ['', '2015']),
+    ('year stopped working', ['', '2016']),
+    ('started other degree', ['sim', 'nao']),
+    ('degree course', ['', 'fisica']),
+    ('institution name', ['', 'universidade do estado do amazonas']),
+    ('year started this', ['', '2014']),
+    ('year stopped this', ['', '2015']),
+    ('sex', ['m', 'f']),
+    ('year of birth', ['1996', '1998', '1999', '2000']),
+    ('civil status', ['solteiro', 'casado']),
+    ('have kids', ['sim', 'nao'])
+]
+
+# Names and events used in the generated codes and CodeMirror logs
+SYNTHETIC_NAMES = ['a', 'b', 'n', 'x', 'y', 'total', 'soma', 'media', 'valor', 'nota', 'idade', 'lista', 'contador', 'maior', 'menor']
+SYNTHETIC_EVENTS_NAMES = ['change', 'change', 'change', 'cursorActivity', 'keydown', 'focus', 'blur', 'paste']
+
+
+def generate_code(rng: random.Random, n_lines: int):
+    """
+    Generates a Python program of about n_lines lines, mixing the constructs found in student codes:
+    input reading, arithmetic, conditionals, loops, functions, list comprehensions, comments and prints.
+
+    Parameters:
+        rng (Random): The random generator.
+        n_lines (int): The approximate number of lines.
+
+    Returns:
+        str: The source code.
+    """
+    names = rng.sample(SYNTHETIC_NAMES, 4)
+    lines = [f'{names[0]} = int(input())', f'{names[1]} = float(input())', f'{names[2]} = {names[3]} = 0']
+    while len(lines) < n_lines:
+        a, b, c = rng.sample(names, 3)
+        k = rng.randint(1, 100)
+        block = rng.randrange(7)
+        if block == 0:
+            lines += [f'if {a} > {k}:', f'    {c} = {a} * {b}', f'elif {a} == {k}:', f'    {c} = {a} - {k}', 'else:', f'    {c} = {b} / {k}']
+        elif block == 1:
+            lines += [f'for i in range({k}):', f'    {c} = {c} + i if i % 2 == 0 else {c} - i', f'    print(i, {c})']
+        elif block == 2:
+            lines += [f'def calcula_{c}_{k}(p, q={k}):', '    """Calcula o valor pedido."""', '    if p < q:', '        return p ** 2', '    return q * 2.5', '', f'{c} = calcula_{c}_{k}({a})']
+        elif block == 3:
+            lines += [f'lista = [v * {k} for v in range({a}) if v % 3 != 0]', f'print(len(lista), sum(lista), max(lista or [0]))']
+        elif block == 4:
+            lines += [f'while {a} > 0:', f'    {a} = {a} // 2', f"    print('{c}:', {a})"]
+        elif block == 5:
+            lines += [f'# atualiza {c} com {a} e {b}', f'{c} = ({a} + {b}) / 2']
+        else:
+            lines += [f"print('%.2f' % {b}, {a} % {k}, sep=', ')"]
+    return '\n'.join(lines) + '\n'
+
+
+class SyntheticDataset:
+    """
+    A synthetic dataset with the layout and the file formats of the Codebench dataset.
+
+    Each semester has its courses; each course its assessments and users; each user the executions, the
+    final code and the CodeMirror log of every problem, the grade of every assessment and a logins log.
+    Every user is generated from its own random generator, seeded from the dataset seed and its path, so
+    the content of a user does not depend on how many users are generated.
+
+    Attributes:
+        seed (int): The seed of the random content.
+        semesters (int): The number of semesters.
+        courses (int): The number of courses per semester.
+        users (int): The number of users per course.
+        assignments (int): The number of assessments per course.
+        problems (int): The number of problems per assessment.
+        attempts (int): The number of executions per problem.
+        code_lines (int): The approximate number of lines of each code.
+        test_cases (int): The number of test cases of each execution.
+        events (int): The number of CodeMirror events per problem.
+        logins (int): The number of logins per user.
+        error_rate (float): The fraction of the executions that fail.
+    """
+
+    def __init__(self, seed: int = 0, semesters: int = SYNTHETIC_SEMESTERS, courses: int = SYNTHETIC_COURSES,
+                 users: int = SYNTHETIC_USERS, assignments: int = SYNTHETIC_ASSIGNMENTS, problems: int = SYNTHETIC_PROBLEMS,
+                 attempts: int = SYNTHETIC_ATTEMPTS, code_lines: int = SYNTHETIC_CODE_LINES, test_cases: int = SYNTHETIC_TEST_CASES,
+                 events: int = SYNTHETIC_EVENTS, logins: int = SYNTHETIC_LOGINS, error_rate: float = SYNTHETIC_ERROR_RATE):
+        self.seed = seed
+        self.semesters = semesters
+        self.courses = courses
+        self.users = users
+        self.assignments = assignments
+        self.problems = problems
+        self.attempts = attempts
+        self.code_lines = code_lines
+        self.test_cases = test_cases
+        self.events = events
+        self.logins = logins
+        self.error_rate = error_rate
+
+    def files(self):
+        """
+        Generates the files of the dataset, in the order of a tarball of the dataset.
+
+        Yields:
+            tuple: The path of each file relative to the dataset root, with '/' separators, and its content as bytes.
+        """
+        for s in range(self.semesters):
+            semester = f'{SYNTHETIC_FIRST_YEAR + s // 2}-{s % 2 + 1}'
+            start = datetime(SYNTHETIC_FIRST_YEAR + s // 2, 3 if s % 2 == 0 else 8, 1, 8, 0)
+            for c in range(self.courses):
+                course = str(SYNTHETIC_FIRST_COURSE + c)
+                course_index = s * self.courses + c
+                assignments = []
+                for a in range(self.assignments):
+                    assignment = str(SYNTHETIC_FIRST_ASSIGNMENT + course_index * self.assignments + a)
+                    problems = [str(SYNTHETIC_FIRST_PROBLEM + (course_index * self.assignments + a) * self.problems + p) for p in range(self.problems)]
+                    open_date = start + timedelta(days=14 * a)
+                    assignments.append((assignment, problems, open_date, open_date + timedelta(days=7)))
+                for assignment, problems, open_date, close_date in assignments:
+                    yield f'{semester}/{course}/assessments/{assignment}{util.DATA_FILE_EXTENSION}', self.assignment_data(course, assignment, problems, open_date, close_date)
+                for u in range(self.users):
+                    user = str(SYNTHETIC_FIRST_USER + course_index * self.users + u)
+                    yield from self.user_files(semester, course, user, assignments)
+
+    def assignment_data(self, course, assignment, problems, open_date, close_date):
+        """Returns the content of an assessment '.data' file."""
+        lines = [
+            f'---- class name: Introducao a Programacao de Computadores {course}',
+            f'---- assessment title: Lista de Exercicios {assignment}',
+            f'---- class id: {course}',
+            '---- professor: professor',
+            f'---- start: {open_date:%Y-%m-%d %H:%M}',
+            f'---- end: {close_date:%Y-%m-%d %H:%M}',
+            '---- language: python',
+            '---- number of problems: ' + str(len(problems)),
+            '---- type: homework',
+            '---- weight: 1.0',
+            f'---- total of blocks: {len(problems)}',
+            '---- problems per block: 1'
+        ]
+        lines += [f'---- block {b + 1} ids: {problem}' for b, problem in enumerate(problems)]
+        return ('\n'.join(lines) + '\n').encode(util.DEFAULT_FILE_ENCODING)
+
+    def user_files(self, semester, course, user, assignments):
+        """Generates the files of a user, as (relative path, content) pairs."""
+        rng = random.Random(f'{self.seed}/{semester}/{course}/{user}')
+        path = f'{semester}/{course}/users/{user}'
+        yield f'{path}/{util.USER_DATA_FILENAME}', ''.join(f'---- {question}: {rng.choice(answers)}\n' for question, answers in SYNTHETIC_USER_ANSWERS).encode(util.DEFAULT_FILE_ENCODING)
+
+        first_login = assignments[0][2] if assignments else datetime(SYNTHETIC_FIRST_YEAR, 3, 1)
+        logins = sorted(first_login + timedelta(seconds=rng.randrange(120 * 24 * 3600)) for i in range(self.logins))
+        yield f'{path}/logins.log', ''.join(f'{moment:%Y-%m-%d %H:%M:%S}#{"login" if i % 2 == 0 else "logout"}\n' for i, moment in enumerate(logins)).encode(util.DEFAULT_FILE_ENCODING)
+
+        for assignment, problems, open_date, close_date in assignments:
+            correct = 0
+            for problem in problems:
+                moment = open_date + timedelta(seconds=rng.randrange(6 * 24 * 3600))
+                sections, code, solved = self.executions(rng, moment)
+                correct += solved
+                yield f'{path}/executions/{assignment}_{problem}.log', ('\n' + util.EXECUTION_DELIMITER + '\n').join(sections).encode(util.DEFAULT_FILE_ENCODING)
+                yield f'{path}/codes/{assignment}_{problem}.py', code.encode(util.DEFAULT_FILE_ENCODING)
+                yield f'{path}/codemirror/{assignment}_{problem}.log', self.codemirror_events(rng, moment).encode(util.DEFAULT_FILE_ENCODING)
+            grade = 10 * correct / len(problems) if problems else 0
+            yield f'{path}/grades/{assignment}.log', (f'---- grade (0-10): {grade:.1f}\n---- number of exercises: {len(problems)}\n'
+                                                     f'---- correct: {correct}\n---- incorrect: {len(problems) - correct}\n---- blank: 0\n').encode(util.DEFAULT_FILE_ENCODING)
+        yield f'{path}/grades/final_grade.log', f'---- final grade (0-10): {rng.uniform(0, 10):.1f}\n'.encode(util.DEFAULT_FILE_ENCODING)
+
+    def executions(self, rng, moment):
+        """
+        Generates the executions of a problem.
+
+        Returns:
+            tuple: The text of each execution section, the code of the last execution and whether it passed every test case.
+        """
+        sections = []
+        code, solved = '', False
+        for attempt in range(self.attempts):
+            moment += timedelta(seconds=rng.randrange(30, 900))
+            code = generate_code(rng, self.code_lines)
+            error = rng.choice(SYNTHETIC_ERRORS) if rng.random() < self.error_rate else None
+            if error is not None and error[0] == 'SyntaxError':
+                code = code[:rng.randrange(len(code))] + ' = (\n'
+            exec_type = 'SUBMITION' if attempt == self.attempts - 1 else 'TEST'
+            parts = [f'== {exec_type} ({moment:%Y-%m-%d %H:%M:%S})', f'-- CODE:\n{code}', f'-- EXECUTION TIME:\n{rng.uniform(0.001, 2):.4f}']
+            passed = 0
+            for t in range(self.test_cases):
+                value = rng.randint(-1000, 1000)
+                output = value if error is None and rng.random() < 0.8 else rng.randint(-1000, 1000)
+                passed += output == value
+                parts.append(f'-- TEST CASE {t + 1}:\n---- input:\n{value}\n{t}\n---- correct output:\n{value}\n---- user output:\n{output}')
+            parts.append(f'-- GRADE:\n{100 * passed // self.test_cases if self.test_cases else 0}%')
+            if error is not None:
+                parts.append(f'-- ERROR:\nTraceback (most recent call last):\n  File "main.py", line {rng.randint(1, self.code_lines)}\n{error[0]}: {error[1]}')
+            sections.append('\n'.join(parts) + '\n')
+            solved = error is None and passed == self.test_cases
+        return sections, code, solved
+
+    def codemirror_events(self, rng, moment):
+        """Returns the content of a CodeMirror log with the events of a problem."""
+        lines = []
+        for i in range(self.events):
+            moment += timedelta(microseconds=rng.randrange(50000, 5000000))
+            event = rng.choice(SYNTHETIC_EVENTS_NAMES)
+            if event == 'change':
+                line, ch = rng.randrange(self.code_lines), rng.randrange(40)
+                text = rng.choice(SYNTHETIC_NAMES + ['(', ')', ':', ' ', '+', '1'])
+                msg = f'{{"from":{{"line":{line},"ch":{ch}}},"to":{{"line":{line},"ch":{ch}}},"text":["{text}"],"origin":"+input"}}'
+            elif event == 'paste':
+                msg = f'{{"text":["{rng.choice(SYNTHETIC_NAMES)} = int(input())"]}}'
+            else:
+                msg = f'{{"line":{rng.randrange(self.code_lines)},"ch":{rng.randrange(40)}}}'
+            lines.append(f'{moment:%Y-%m-%d %H:%M:%S.%f}#{event}#{msg}\n')
+        return ''.join(lines)
+
+    def write_directory(self, path: str):
+        """
+        Writes the dataset to a directory.
+
+        Returns:
+            tuple: The number of files and bytes written.
+        """
+        n_files, n_bytes = 0, 0
+        for name, content in self.files():
+            file_path = os.path.join(path, *name.split('/'))
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, mode='wb') as f:
+                f.write(content)
+            n_files += 1
+            n_bytes += len(content)
+        return n_files, n_bytes
+
+    def write_archive(self, path: str):
+        """
+        Writes the dataset to a tarball, compressed with gzip when the path ends with '.gz' or '.tgz'.
+        The members and the gzip header carry a fixed time, so the same options always write the same bytes.
+
+        Returns:
+            tuple: The number of files and bytes written (uncompressed).
+        """
+        n_files, n_bytes = 0, 0
+        with open(path, mode='wb') as raw:
+            compressed = path.endswith(('.gz', '.tgz'))
+            fileobj = gzip.GzipFile(fileobj=raw, mode='wb', mtime=SYNTHETIC_MTIME) if compressed else raw
+            try:
+                with tarfile.open(fileobj=fileobj, mode='w', format=tarfile.GNU_FORMAT) as tar:
+                    for name, content in self.files():
+                        member = tarfile.TarInfo(name)
+                        member.size = len(content)
+                        member.mtime = SYNTHETIC_MTIME
+                        member.mode = 0o644
+                        tar.addfile(member, io.BytesIO(content))
+                        n_files += 1
+                        n_bytes += len(content)
+            finally:
+                if compressed:
+                    fileobj.close()
+        return n_files, n_bytes
+
+
+def is_archive_path(path: str):
+    """Returns whether the output path names a tarball rather than a directory."""
+    return path.endswith(('.tar', '.tar.gz', '.tgz'))
+
+
+# Main execution starts here
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Writes a synthetic dataset with the layout of the Codebench dataset, to benchmark the extractor")
+    parser.add_argument('output', help="Output directory, or tarball when it ends with '.tar', '.tar.gz' or '.tgz'", type=str)
+    parser.add_argument('--seed', help="Seed of the random content: the same seed and options always write the same dataset", type=int, default=0)
+    parser.add_argument('--scale', help="Multiplies the number of users per course (e.g. 10 for 10x a semester)", type=float, default=1.0)
+    parser.add_argument('--semesters', help="Number of semesters", type=int, default=SYNTHETIC_SEMESTERS)
+    parser.add_argument('--courses', help="Number of courses per semester", type=int, default=SYNTHETIC_COURSES)
+    parser.add_argument('--users', help="Number of users per course, before --scale", type=int, default=SYNTHETIC_USERS)
+    parser.add_argument('--assignments', help="Number of assessments per course", type=int, default=SYNTHETIC_ASSIGNMENTS)
+    parser.add_argument('--problems', help="Number of problems per assessment", type=int, default=SYNTHETIC_PROBLEMS)
+    parser.add_argument('--attempts', help="Number of executions per problem", type=int, default=SYNTHETIC_ATTEMPTS)
+    parser.add_argument('--code-lines', help="Approximate number of lines of each code", type=int, default=SYNTHETIC_CODE_LINES)
+    parser.add_argument('--test-cases', help="Number of test cases of each execution", type=int, default=SYNTHETIC_TEST_CASES)
+    parser.add_argument('--events', help="Number of CodeMirror events per problem", type=int, default=SYNTHETIC_EVENTS)
+    parser.add_argument('--logins', help="Number of logins per user", type=int, default=SYNTHETIC_LOGINS)
+    parser.add_argument('--error-rate', help="Fraction of the executions that fail", type=float, default=SYNTHETIC_ERROR_RATE)
+    args = parser.parse_args()
+
+    util.Logger.configure()
+    if os.path.exists(args.output) and (not os.path.isdir(args.output) or os.listdir(args.output)):
+        util.Logger.error(f'The output {args.output} already exists. Exiting...')
+        exit(1)
+    dataset = SyntheticDataset(args.seed, args.semesters, args.courses, max(round(args.users * args.scale), 1), args.assignments, args.problems,
+                               args.attempts, args.code_lines, args.test_cases, args.events, args.logins, args.error_rate)
+    util.Logger.info(f'Generating a synthetic dataset: {args.semesters} semesters, {args.courses} courses, {dataset.users} users per course, seed {args.seed}')
+    start_time = time.time()
+    if is_archive_path(args.output):
+        n_files, n_bytes = dataset.write_archive(args.output)
+    else:
+        n_files, n_bytes = dataset.write_directory(args.output)
+    util.Logger.info(f'Synthetic dataset saved to {args.output}: {n_files} files, {n_bytes} bytes in {time.time() - start_time:.2f}s')
@@ -3,20 +3,42 @@
 ### Universidade Federal do Amazonas - UFAM
 ### Instituto de Computação - IComp
 
+import ast
+import atexit
+import concurrent.futures
+import cProfile
+import csv
+import functools
+import hashlib
+import heapq
+import inspect
+import io
+import json
 import keyword
 import logging
+import logging.handlers
 import model
+import multiprocessing
+import multiprocessing.util
 import os
 import pandas as pd
+import pickle
+import pstats
 import re
+import shutil
+import sqlite3
 import statistics
+import threading
+import time
 import token
 import tokenize
+import types
 
-from collections import Counter, defaultdict
+from array import array
+from collections import Counter, OrderedDict, defaultdict
 from datetime import datetime
 
-from radon.metrics import h_visit
+from radon.metrics import h_visit_ast
 from radon.raw import analyze
 from radon.visitors import ComplexityVisitor
 from typing import Any
@@ -25,6 +47,9 @@ from typing import Any
 # Directory for the output '.csv' files (datasets)
 CSV_FILE_OUTPUT_DIR = os.path.join(os.getcwd(), 'csv')
 
+# Directory for the output Parquet datasets
+PARQUET_FILE_OUTPUT_DIR = os.path.join(os.getcwd(), 'parquet')
+
 # Regular expression pattern for identifying errors
 ERROR_PATTERN = re.compile('[a-zA-Z]*Error')
 
@@ -34,6 +59,9 @@ CODEMIRROR_PATTERN = re.compile(r'^\d{4}-\d{1,2}-\d{1,2}')
 # Default file encoding for data files
 DEFAULT_FILE_ENCODING = 'utf-8'
 
+# Delimiter that separates the executions in an execution log
+EXECUTION_DELIMITER = '*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*'
+
 CODE_SEMESTER = 0
 CODE_COURSE = 1
 CODE_ASSIGNMENT = 2
@@ -70,6 +98,44 @@ CSV_HEADERS = {
     CODE_CODEMIRROR: model.CodeMirror.get_attr_names
 }
 
+# Columns used to split each dataset into partition directories; datasets not listed are written as a single file
+PARQUET_PARTITION_COLUMNS = {
+    CODE_ASSIGNMENT: ['semester', 'course'],
+    CODE_USER: ['semester', 'course'],
+    CODE_EXECUTION: ['semester', 'course'],
+    CODE_SOLUTION: ['semester', 'course'],
+    CODE_LOGIN: ['semester', 'course'],
+    CODE_GRADE: ['semester', 'course'],
+    CODE_CODEMIRROR: ['semester', 'course']
+}
+
+# Repeated key columns, stored with dictionary encoding
+PARQUET_KEY_COLUMNS = ['semester', 'course', 'assignment', 'user', 'problem', 'code', 'ex_type', 'err_type', 'event']
+
+# Types of the columns that are neither text nor code metrics; code metric columns of executions and solutions are float64
+PARQUET_COLUMN_TYPES = {
+    'n_courses': lambda pa: pa.int64(),
+    'n_assignments': lambda pa: pa.int64(),
+    'n_users': lambda pa: pa.int64(),
+    'n_codes': lambda pa: pa.int64(),
+    'n_executions': lambda pa: pa.int64(),
+    'n_mirrors': lambda pa: pa.int64(),
+    'n_grades': lambda pa: pa.int64(),
+    'weight': lambda pa: pa.float64(),
+    'n_blocks': lambda pa: pa.int64(),
+    'blocks': lambda pa: pa.list_(pa.list_(pa.int64())),
+    'seq_attempt': lambda pa: pa.int64(),
+    'has_err': lambda pa: pa.bool_(),
+    'tcases_results': lambda pa: pa.list_(pa.bool_()),
+    'n_tcases': lambda pa: pa.int64(),
+    'timestamp': lambda pa: pa.float64()
+}
+
+# Columns kept as text in spite of their name (the radon result lists of solutions)
+PARQUET_TEXT_COLUMNS = {
+    CODE_SOLUTION: ['classes', 'functions', 'blocks']
+}
+
 # File extension for data files
 DATA_FILE_EXTENSION = '.data'
 
@@ -238,18 +304,89 @@ TOKEN_NAMES = {value: name.lower() for name, value in globals().items() if isins
 # Dictionary to map token codes to their corresponding names
 TOKEN_CODES = {value: key for key, value in TOKEN_NAMES.items()}
 
+# Line separators that 'str.splitlines' honours but the tokenizer does not; size metrics of code
+# containing any of them are computed by 'radon.raw.analyze' itself
+RAW_METRICS_FALLBACK_CHARS = '\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029'
+
+# Default number of code metrics entries kept in memory by the metrics cache
+METRICS_CACHE_SIZE = 4096
+
+# Version of the code metrics, part of every metrics cache key. Bump it whenever the metrics
+# change, so values stored by older versions are not reused.
+METRICS_CACHE_VERSION = 2
+
+# Key of the code metrics errors among the metric values returned by compute_code_metrics and cached
+METRICS_ERRORS_KEY = 'metrics_errors'
+
+# Number of new metrics cache entries written to disk per transaction
+METRICS_CACHE_COMMIT_INTERVAL = 500
+
+# Number of rows buffered for each dataset before they are written to its '.csv' file
+CSV_BATCH_SIZE = 1000
+
+# Maximum number of Parquet partition files kept open at the same time for each dataset
+PARQUET_MAX_OPEN_FILES = 64
+
+# Verbosity of the per-file messages (new assignment, user, execution file, ... found): all of them,
+# at most a given number per second, or none
+LOG_FILE_MESSAGES = ['all', 'rate', 'none']
+
+# Default number of per-file messages logged per second with the 'rate' verbosity
+LOG_FILE_MESSAGES_RATE = 10
+
+# Number of slowest calls of each stage kept by the profiler
+PROFILE_TOP = 20
+
+# Number of characters of a code shown in the slowest calls of the profiler
+PROFILE_SNIPPET_LENGTH = 80
+
+# Upper bounds of the profiler histogram buckets of wall times, in seconds
+PROFILE_HISTOGRAM_BOUNDS = [0.0001, 0.001, 0.01, 0.1, 1, 10]
+
+# Files counted by the progress report, by dataset code, with the name they are reported under
+PROGRESS_KINDS = {
+    CODE_ASSIGNMENT: 'assignments',
+    CODE_USER: 'users',
+    CODE_EXECUTION: 'executions',
+    CODE_SOLUTION: 'solutions',
+    CODE_LOGIN: 'logins',
+    CODE_GRADE: 'grades',
+    CODE_CODEMIRROR: 'codemirror'
+}
+
 class Logger:
     """
     A simple logger class for logging information, warnings, and errors to files and console.
+
+    Messages are put in a queue and written to the files and the console by a background thread of the
+    main process, so the extraction does not wait for them. The worker processes put their messages in the
+    same queue, handed to them by configure_worker, and they are written by the same thread. Per-file messages are
+    logged with detail, which can turn them off or limit how many are logged per second. The errors of the
+    code metrics are logged with metrics_error and tallied by the same thread, for the run report.
     """
 
     LOGS_DIR = os.path.join(os.getcwd(), 'logs') # Directory path for storing logs
     __cblogger = None # Private class variable for holding the logger instance
+    __listener = None # Background thread writing the queued messages
+    __listener_pid = None # Process running the background thread
+    __queue = None # Queue of the messages written by the background thread
+    __handlers = [] # Handlers the background thread writes to
+    __file_messages = 'all'
+    __file_messages_rate = LOG_FILE_MESSAGES_RATE
+    # Rate limit of the per-file messages, kept by each process; without a lock the counts are approximate
+    __window = 0 # Second of the current rate limit window
+    __window_count = 0 # Per-file messages logged in the current window
+    __suppressed = 0 # Per-file messages not logged
+    __failures = Counter() # Code metrics errors by (metric group, exception type), tallied by the main process
 
     @staticmethod
-    def configure():
+    def configure(file_messages: str = 'all', file_messages_rate: int = LOG_FILE_MESSAGES_RATE):
         """
         Configures the logger by setting up log file handlers and console handlers.
+
+        Parameters:
+            file_messages (str): The verbosity of the per-file messages, one of LOG_FILE_MESSAGES.
+            file_messages_rate (int): The number of per-file messages logged per second with the 'rate' verbosity.
         """
         logging.basicConfig(level=logging.INFO) # Set the logging level to INFO
 
@@ -258,6 +395,8 @@ class Logger:
 
         formatter = logging.Formatter('%(asctime)s %(name)s [%(levelname)s]: %(message)s') # Define log message format
         data_hoje = datetime.now().strftime("%Y-%m-%d_%H-%M-%S") # Get current date and time
+        Logger.__file_messages = file_messages
+        Logger.__file_messages_rate = file_messages_rate
 
         if not Logger.__cblogger: # If logger instance doesn't exist, create one
             Logger.__cblogger = logging.getLogger('cblogger') # Create logger instance with name 'cblogger'
@@ -266,23 +405,92 @@ class Logger:
             ifh = logging.FileHandler(os.path.join(Logger.LOGS_DIR, f'{data_hoje}_info.log'))
             ifh.setLevel(level=logging.INFO)
             ifh.setFormatter(formatter)
-            Logger.__cblogger.addHandler(ifh)
 
             wfh = logging.FileHandler(os.path.join(Logger.LOGS_DIR, f'{data_hoje}_warn.log'))
             wfh.setLevel(level=logging.WARNING)
             wfh.setFormatter(formatter)
-            Logger.__cblogger.addHandler(wfh)
 
             efh = logging.FileHandler(os.path.join(Logger.LOGS_DIR, f'{data_hoje}_error.log'))
             efh.setLevel(level=logging.ERROR)
             efh.setFormatter(formatter)
-            Logger.__cblogger.addHandler(efh)
 
             # Create console handler to output logs to console
             console_handler = logging.StreamHandler()
             console_handler.setLevel(level=logging.INFO)
             console_handler.setFormatter(formatter)
-            Logger.__cblogger.addHandler(console_handler)
+
+            # Tallies the code metrics errors of every process, as they reach the background thread
+            failures_handler = logging.Handler(level=logging.ERROR)
+            failures_handler.emit = Logger.__tally
+
+            # The console handler set up by basicConfig is written by the background thread too
+            Logger.__handlers = [ifh, wfh, efh, console_handler, failures_handler] + logging.getLogger().handlers
+            Logger.__queue = multiprocessing.Queue()
+            Logger.__cblogger.addHandler(logging.handlers.QueueHandler(Logger.__queue))
+            Logger.__cblogger.propagate = False
+            Logger.__listener = logging.handlers.QueueListener(Logger.__queue, *Logger.__handlers, respect_handler_level=True)
+            Logger.__listener.start()
+            Logger.__listener_pid = os.getpid()
+            atexit.register(Logger.close)
+
+    @staticmethod
+    def worker_settings():
+        """Returns the arguments of configure_worker that send the messages of a worker process to this process, or None if not configured."""
+        if Logger.__queue is None:
+            return None
+        return Logger.__queue, Logger.__file_messages, Logger.__file_messages_rate
+
+    @staticmethod
+    def configure_worker(message_queue, file_messages: str = 'all', file_messages_rate: int = LOG_FILE_MESSAGES_RATE):
+        """
+        Configures the logger of a worker process to put its messages in the queue of the main process,
+        where they are written by its background thread. Called by init_worker.
+
+        Parameters:
+            message_queue (Queue): The message queue of the main process.
+            file_messages (str): The verbosity of the per-file messages, one of LOG_FILE_MESSAGES.
+            file_messages_rate (int): The number of per-file messages logged per second with the 'rate' verbosity.
+        """
+        Logger.__file_messages = file_messages
+        Logger.__file_messages_rate = file_messages_rate
+        Logger.__window = Logger.__window_count = Logger.__suppressed = 0
+        Logger.__cblogger = logging.getLogger('cblogger')
+        for handler in list(Logger.__cblogger.handlers):
+            Logger.__cblogger.removeHandler(handler)
+        Logger.__cblogger.addHandler(logging.handlers.QueueHandler(message_queue))
+        Logger.__cblogger.setLevel(logging.INFO) # The level set by basicConfig in the main process is not inherited by a spawned worker
+        Logger.__cblogger.propagate = False
+
+    @staticmethod
+    def close():
+        """
+        Writes the pending messages and stops the background thread; later messages are written right away.
+        Called at exit by the main process.
+        """
+        if Logger.__listener is None or Logger.__listener_pid != os.getpid():
+            return
+        if Logger.__suppressed:
+            Logger.info(f'{Logger.__suppressed} per-file messages were not logged (file messages: {Logger.__file_messages})')
+            Logger.__suppressed = 0
+        Logger.__listener.stop()
+        Logger.__listener = None
+        for handler in list(Logger.__cblogger.handlers):
+            Logger.__cblogger.removeHandler(handler)
+        for handler in Logger.__handlers[:5]:
+            Logger.__cblogger.addHandler(handler)
+        Logger.__cblogger.propagate = True
+
+    @staticmethod
+    def drain():
+        """
+        Waits until the messages queued so far, by this process and the worker processes, are written and
+        tallied. The logger can still be used afterwards.
+        """
+        if Logger.__listener is None or Logger.__listener_pid != os.getpid():
+            return
+        # Stopping the background thread writes every queued message; a new thread takes the next ones
+        Logger.__listener.stop()
+        Logger.__listener.start()
 
     @staticmethod
     def info(msg: str):
@@ -294,6 +502,30 @@ class Logger:
         """
         Logger.__cblogger.info(msg)
 
+    @staticmethod
+    def detail(msg: str):
+        """
+        Logs a per-file information message (a new assignment, user or user file found), according to
+        the verbosity given to configure.
+
+        Parameters:
+            msg (str): The message to be logged.
+        """
+        if Logger.__file_messages == 'all':
+            Logger.__cblogger.info(msg)
+        elif Logger.__file_messages == 'rate':
+            window = int(time.monotonic())
+            if window != Logger.__window:
+                Logger.__window = window
+                Logger.__window_count = 0
+            if Logger.__window_count < Logger.__file_messages_rate:
+                Logger.__window_count += 1
+                Logger.__cblogger.info(msg)
+            else:
+                Logger.__suppressed += 1
+        else:
+            Logger.__suppressed += 1
+
     @staticmethod
     def warn(msg: str):
         """
@@ -314,6 +546,674 @@ class Logger:
         """
         Logger.__cblogger.error(msg, exc_info=True)
 
+    @staticmethod
+    def metrics_error(group: str, msg: str, err: BaseException, errors: list = None):
+        """
+        Logs an error raised while computing a group of code metrics, tallied by group and exception type.
+
+        Parameters:
+            group (str): The metric group ('complexity', 'size', 'halstead' or 'token').
+            msg (str): The message to be logged.
+            err (BaseException): The error raised.
+            errors (list, optional): Collects the (group, message, exception type) of the error, so that it can
+                be logged again by replay_metrics_errors when the metrics are taken from the MetricsCache.
+        """
+        Logger.__cblogger.error(msg, exc_info=True, extra={'metrics_group': group, 'error_type': type(err).__name__})
+        if errors is not None:
+            errors.append((group, msg, type(err).__name__))
+
+    @staticmethod
+    def replay_metrics_errors(errors: list):
+        """
+        Logs again the code metrics errors collected by metrics_error, tallied as the first time, without the
+        traceback that is not kept.
+
+        Parameters:
+            errors (list): The (group, message, exception type) of each error.
+        """
+        for group, msg, error_type in errors:
+            Logger.__cblogger.error(msg, extra={'metrics_group': group, 'error_type': error_type})
+
+    @staticmethod
+    def failures():
+        """
+        Returns the code metrics errors logged so far by every process. The errors still queued are only
+        counted once drain or close is called.
+
+        Returns:
+            dict: The number of errors of each exception type, in a dict by metric group.
+        """
+        failures = defaultdict(dict)
+        for (group, error_type), count in sorted(Logger.__failures.items()):
+            failures[group][error_type] = count
+        return dict(failures)
+
+    @staticmethod
+    def __tally(record):
+        group = getattr(record, 'metrics_group', None)
+        if group is not None:
+            Logger.__failures[(group, record.error_type)] += 1
+
+
+class Profiler:
+    """
+    Wall and CPU time of the extraction stages: each util.extract_* call, each metric group of the code
+    metrics, the parsing and tokenizing of the codes and the writing of the output batches.
+
+    The stages are the functions decorated with profiled; they are only timed while the profiler is
+    enabled. Each process keeps its own samples: the worker processes, set up by configure_worker, save theirs
+    to the profile directory when they exit, and the main process merges them in report. Optionally each outermost stage of a
+    thread also runs under cProfile, saved as one '<stage>.prof' file per stage.
+    """
+
+    CODE_STAGES = set() # Stages that handle a single code, filled by profiled
+
+    __enabled = False
+    __dir = None # Directory of the report, the cProfile dumps and the samples of the worker processes
+    __top = PROFILE_TOP
+    __cprofile = False
+    __lock = threading.Lock()
+    __local = threading.local() # Nesting depth and current file of each thread
+    __times = {} # Wall and CPU times of each call, in a pair of arrays by stage
+    __slowest = {} # Heap of the slowest (wall, cpu, key, file) calls by stage
+    __profiles = {} # cProfile profiles by (stage, thread)
+
+    @staticmethod
+    def enable(path: str, top: int = PROFILE_TOP, use_cprofile: bool = False):
+        """
+        Starts timing the stages. Must be called before the worker processes are started.
+
+        Parameters:
+            path (str): The directory where the report and the cProfile dumps are written.
+            top (int): The number of slowest calls kept for each stage.
+            use_cprofile (bool): Whether to run the stages under cProfile.
+        """
+        os.makedirs(path, exist_ok=True)
+        Profiler.__dir = path
+        Profiler.__top = top
+        Profiler.__cprofile = use_cprofile
+        Profiler.__enabled = True
+
+    @staticmethod
+    def enabled():
+        """Returns whether the stages are timed."""
+        return Profiler.__enabled
+
+    @staticmethod
+    def worker_settings():
+        """Returns the arguments of configure_worker that time the stages of a worker process like this one, or None if not enabled."""
+        if not Profiler.__enabled:
+            return None
+        return Profiler.__dir, Profiler.__top, Profiler.__cprofile
+
+    @staticmethod
+    def configure_worker(path: str, top: int = PROFILE_TOP, use_cprofile: bool = False):
+        """
+        Starts timing the stages of a worker process, which saves its samples to the profile directory when
+        it exits. Called by init_worker, with the parameters of enable.
+        """
+        # The samples of the parent process are not repeated by a forked worker, which saves its own
+        Profiler.__lock = threading.Lock()
+        Profiler.__local = threading.local()
+        Profiler.__times, Profiler.__slowest, Profiler.__profiles = {}, {}, {}
+        Profiler.__dir = path
+        Profiler.__top = top
+        Profiler.__cprofile = use_cprofile
+        Profiler.__enabled = True
+        multiprocessing.util.Finalize(Profiler, Profiler.flush, exitpriority=10)
+
+    @staticmethod
+    def call(stage: str, key: str, is_file: bool, function, args, kwargs):
+        """Calls a function, timing it under a stage. Used by profiled."""
+        local = Profiler.__local
+        depth, current_file = getattr(local, 'depth', 0), getattr(local, 'file', None)
+        profile = Profiler.__profile(stage) if depth == 0 and Profiler.__cprofile else None
+        local.depth = depth + 1
+        if is_file:
+            local.file = key
+        wall, cpu = time.perf_counter(), time.thread_time()
+        if profile is not None:
+            profile.enable()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            if profile is not None:
+                profile.disable()
+            wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+            local.depth, local.file = depth, current_file
+            Profiler.__record(stage, wall, cpu, key, None if is_file else current_file)
+
+    @staticmethod
+    def iterate(stage: str, key: str, is_file: bool, iterator):
+        """Iterates over a generator, timing each step under a stage. Used by profiled."""
+        local = Profiler.__local
+        wall = cpu = 0.0
+        current_file = None
+        try:
+            while True:
+                depth, current_file = getattr(local, 'depth', 0), getattr(local, 'file', None)
+                profile = Profiler.__profile(stage) if depth == 0 and Profiler.__cprofile else None
+                local.depth = depth + 1
+                if is_file:
+                    local.file = key
+                start_wall, start_cpu = time.perf_counter(), time.thread_time()
+                if profile is not None:
+                    profile.enable()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    if profile is not None:
+                        profile.disable()
+                    wall += time.perf_counter() - start_wall
+                    cpu += time.thread_time() - start_cpu
+                    local.depth, local.file = depth, current_file
+                yield item
+        finally:
+            iterator.close()
+            Profiler.__record(stage, wall, cpu, key, None if is_file else current_file)
+
+    @staticmethod
+    def flush():
+        """Saves the samples and the cProfile profiles of this process to the profile directory, and clears them."""
+        with Profiler.__lock:
+            times, slowest, profiles = Profiler.__times, Profiler.__slowest, Profiler.__profiles
+            Profiler.__times, Profiler.__slowest, Profiler.__profiles = {}, {}, {}
+        if times:
+            with open(os.path.join(Profiler.__dir, f'samples-{os.getpid()}.pickle'), mode='wb') as f:
+                pickle.dump((times, slowest), f, pickle.HIGHEST_PROTOCOL)
+        for (stage, thread), profile in profiles.items():
+            profile.dump_stats(os.path.join(Profiler.__dir, f'{stage}-{os.getpid()}-{thread}.prof.part'))
+
+    @staticmethod
+    def report():
+        """
+        Merges the samples of every process, writes them to 'profile.json' in the profile directory and
+        merges the cProfile dumps of each stage into '<stage>.prof'.
+
+        Returns:
+            dict: For each stage, whether it handles codes, the number of calls, the total, percentile (p50, p95,
+                p99) and maximum wall times, the total CPU time, a histogram of the wall times and the slowest calls.
+        """
+        Profiler.flush()
+        times, slowest = {}, {}
+        for name in sorted(os.listdir(Profiler.__dir)):
+            path = os.path.join(Profiler.__dir, name)
+            if name.startswith('samples-') and name.endswith('.pickle'):
+                with open(path, mode='rb') as f:
+                    process_times, process_slowest = pickle.load(f)
+                os.remove(path)
+                for stage, (walls, cpus) in process_times.items():
+                    stage_walls, stage_cpus = times.setdefault(stage, (array('d'), array('d')))
+                    stage_walls.extend(walls)
+                    stage_cpus.extend(cpus)
+                for stage, calls in process_slowest.items():
+                    slowest[stage] = heapq.nlargest(Profiler.__top, slowest.get(stage, []) + calls)
+
+        stages = {}
+        for stage, (walls, cpus) in sorted(times.items()):
+            ordered = sorted(walls)
+            histogram = Counter(next((f'<{bound}s' for bound in PROFILE_HISTOGRAM_BOUNDS if wall < bound), f'>={PROFILE_HISTOGRAM_BOUNDS[-1]}s') for wall in ordered)
+            stages[stage] = {
+                'code': stage in Profiler.CODE_STAGES,
+                'calls': len(ordered),
+                'wall': sum(ordered),
+                'cpu': sum(cpus),
+                'p50': ordered[int(0.50 * (len(ordered) - 1))],
+                'p95': ordered[int(0.95 * (len(ordered) - 1))],
+                'p99': ordered[int(0.99 * (len(ordered) - 1))],
+                'max': ordered[-1],
+                'histogram': {bucket: histogram[bucket] for bucket in [f'<{bound}s' for bound in PROFILE_HISTOGRAM_BOUNDS] + [f'>={PROFILE_HISTOGRAM_BOUNDS[-1]}s']},
+                'slowest': [{'wall': wall, 'cpu': cpu, 'key': key, 'file': file} for wall, cpu, key, file in sorted(slowest.get(stage, []), reverse=True)]
+            }
+        with open(os.path.join(Profiler.__dir, 'profile.json'), mode='w', encoding=DEFAULT_FILE_ENCODING) as f:
+            json.dump(stages, f, indent=2)
+
+        parts = defaultdict(list)
+        for name in os.listdir(Profiler.__dir):
+            if name.endswith('.prof.part'):
+                parts[name.rsplit('-', 2)[0]].append(os.path.join(Profiler.__dir, name))
+        for stage, paths in parts.items():
+            stats = pstats.Stats(*paths)
+            stats.dump_stats(os.path.join(Profiler.__dir, f'{stage}.prof'))
+            for path in paths:
+                os.remove(path)
+        return stages
+
+    @staticmethod
+    def __profile(stage):
+        key = (stage, threading.get_ident())
+        profile = Profiler.__profiles.get(key)
+        if profile is None:
+            with Profiler.__lock:
+                profile = Profiler.__profiles.setdefault(key, cProfile.Profile())
+        return profile
+
+    @staticmethod
+    def __record(stage, wall, cpu, key, file):
+        with Profiler.__lock:
+            times = Profiler.__times.get(stage)
+            if times is None:
+                times = Profiler.__times[stage] = (array('d'), array('d'))
+                Profiler.__slowest[stage] = []
+            times[0].append(wall)
+            times[1].append(cpu)
+            slowest = Profiler.__slowest[stage]
+            if len(slowest) < Profiler.__top:
+                heapq.heappush(slowest, (wall, cpu, key, file))
+            elif wall > slowest[0][0]:
+                heapq.heapreplace(slowest, (wall, cpu, key, file))
+
+
+def profiled(stage: str, code: bool = False):
+    """
+    Decorates a function so its calls are timed by the Profiler under the given stage, when it is enabled.
+
+    Calls are identified in the slowest calls report by the 'path' argument of the function (or the
+    'path' attribute of the object of a method) or, for the stages that handle a single code, by the
+    start of the 'code' argument along with the file being extracted.
+
+    Parameters:
+        stage (str): The stage name.
+        code (bool): Whether the function handles a code instead of a file.
+    """
+    if code:
+        Profiler.CODE_STAGES.add(stage)
+
+    def decorator(function):
+        parameters = list(inspect.signature(function).parameters)
+        position = parameters.index('code' if code else 'path' if 'path' in parameters else 'self')
+        generator = inspect.isgeneratorfunction(function)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not Profiler.enabled():
+                return function(*args, **kwargs)
+            key = args[position] if position < len(args) else kwargs.get(parameters[position])
+            if code:
+                key = key[:PROFILE_SNIPPET_LENGTH]
+            elif parameters[position] == 'self':
+                key = key.path
+            if generator:
+                return Profiler.iterate(stage, key, not code, function(*args, **kwargs))
+            return Profiler.call(stage, key, not code, function, args, kwargs)
+
+        return wrapper
+    return decorator
+
+
+class Progress:
+    """
+    Counters of the files read and the code metrics computed by the extraction, read by the progress report.
+
+    The counters live in shared memory, handed to the worker processes by configure_worker, so they update
+    the same counters as the main process. Nothing is counted until enable is called.
+    """
+
+    __counters = None # Files and bytes of each kind, then codes, cache hits and cache misses
+    __lock = None
+    __slots = {code: i for i, code in enumerate(PROGRESS_KINDS)}
+
+    @staticmethod
+    def enable():
+        """Starts counting. Must be called before the worker processes are started."""
+        if Progress.__counters is None:
+            Progress.__lock = multiprocessing.Lock()
+            Progress.__counters = multiprocessing.RawArray('q', 2 * len(PROGRESS_KINDS) + 3)
+
+    @staticmethod
+    def enabled():
+        """Returns whether the progress is counted."""
+        return Progress.__counters is not None
+
+    @staticmethod
+    def worker_settings():
+        """Returns the arguments of configure_worker that share the counters of this process, or None if not counting."""
+        if Progress.__counters is None:
+            return None
+        return Progress.__counters, Progress.__lock
+
+    @staticmethod
+    def configure_worker(counters, lock):
+        """
+        Counts the progress of a worker process in the shared counters of the main process. Called by init_worker.
+
+        Parameters:
+            counters (RawArray): The shared counters of the main process.
+            lock (Lock): The lock guarding the counters.
+        """
+        Progress.__counters = counters
+        Progress.__lock = lock
+
+    @staticmethod
+    def count_file(key: int, size: int):
+        """Counts a file read, given its dataset code and its size in bytes."""
+        slot = 2 * Progress.__slots[key]
+        with Progress.__lock:
+            Progress.__counters[slot] += 1
+            Progress.__counters[slot + 1] += size
+
+    @staticmethod
+    def count_code(cached=None):
+        """Counts a code whose metrics were computed, or a metrics cache hit (cached=True) or miss (cached=False)."""
+        slot = 2 * len(PROGRESS_KINDS) + (0 if cached is None else 1 if cached else 2)
+        with Progress.__lock:
+            Progress.__counters[slot] += 1
+
+    @staticmethod
+    def snapshot():
+        """
+        Returns the current counts.
+
+        Returns:
+            dict: The 'files' and 'bytes' read of each kind, in a dict by the names of PROGRESS_KINDS,
+                and the number of 'codes' whose metrics were computed, 'cache_hits' and 'cache_misses'.
+        """
+        with Progress.__lock:
+            counters = list(Progress.__counters)
+        snapshot = {name: {'files': counters[2 * i], 'bytes': counters[2 * i + 1]} for i, name in enumerate(PROGRESS_KINDS.values())}
+        snapshot.update(zip(['codes', 'cache_hits', 'cache_misses'], counters[2 * len(PROGRESS_KINDS):]))
+        return snapshot
+
+
+class MetricsCache:
+    """
+    A cache of code metrics keyed by a hash of the source code.
+
+    Students submit the very same code many times (tests, submissions and the final solution), so the
+    metrics computed for a code are kept and reused. The most recently used entries live in memory with
+    LRU eviction, and every entry is also stored in a SQLite file, when one is configured, so the cache
+    survives between runs. Each process opens its own connection to the SQLite file.
+    """
+
+    __entries = OrderedDict() # In-memory entries, from the least to the most recently used
+    __max_entries = METRICS_CACHE_SIZE
+    __path = None # Path of the SQLite file, or None to keep the cache in memory only
+    __connection = None
+    __connection_pid = None # Process that opened the SQLite connection
+    __pending = 0 # Entries written since the last commit
+    __hits = 0
+    __misses = 0
+
+    @staticmethod
+    def configure(path: str = None, max_entries: int = METRICS_CACHE_SIZE):
+        """
+        Configures the cache.
+
+        Parameters:
+            path (str): Path of the SQLite file backing the cache, or None to keep it in memory only.
+            max_entries (int): Number of entries kept in memory. Zero disables the in-memory cache.
+        """
+        MetricsCache.__path = path
+        MetricsCache.__max_entries = max_entries
+        MetricsCache.__entries.clear()
+
+    @staticmethod
+    def enabled():
+        """Returns whether metrics are cached at all."""
+        return MetricsCache.__max_entries > 0 or MetricsCache.__path is not None
+
+    @staticmethod
+    def settings():
+        """Returns the arguments of configure that set up the cache as it is in this process."""
+        return MetricsCache.__path, MetricsCache.__max_entries
+
+    @staticmethod
+    def key(code: str):
+        """Returns the cache key of a source code."""
+        data = f'{METRICS_CACHE_VERSION}\0{code}'.encode(DEFAULT_FILE_ENCODING, 'surrogatepass')
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def __db():
+        if MetricsCache.__path is None:
+            return None
+        if MetricsCache.__connection_pid != os.getpid():
+            # A connection inherited from the parent process must not be used by a forked worker
+            # The connection may be shared by the threads of a process, which serialize their calls
+            MetricsCache.__connection = sqlite3.connect(MetricsCache.__path, timeout=60, check_same_thread=False)
+            MetricsCache.__connection.execute('PRAGMA journal_mode=WAL')
+            MetricsCache.__connection.execute('CREATE TABLE IF NOT EXISTS metrics (key TEXT PRIMARY KEY, value BLOB)')
+            MetricsCache.__connection_pid = os.getpid()
+            MetricsCache.__pending = 0
+        return MetricsCache.__connection
+
+    @staticmethod
+    def lookup(code: str):
+        """
+        Returns the cached metrics of a source code.
+
+        Parameters:
+            code (str): The source code.
+
+        Returns:
+            dict: The metric values by attribute name, or None if the code is not cached.
+        """
+        if not MetricsCache.enabled():
+            return None
+        key = MetricsCache.key(code)
+        metrics = MetricsCache.__entries.get(key)
+        if metrics is not None:
+            MetricsCache.__entries.move_to_end(key)
+        elif MetricsCache.__db() is not None:
+            row = MetricsCache.__db().execute('SELECT value FROM metrics WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                metrics = pickle.loads(row[0])
+                MetricsCache.__remember(key, metrics)
+        if metrics is None:
+            MetricsCache.__misses += 1
+        else:
+            MetricsCache.__hits += 1
+        if Progress.enabled():
+            Progress.count_code(metrics is not None)
+        return metrics
+
+    @staticmethod
+    def store(code: str, metrics: dict):
+        """
+        Stores the metrics of a source code.
+
+        Parameters:
+            code (str): The source code.
+            metrics (dict): The metric values by attribute name.
+        """
+        if not MetricsCache.enabled():
+            return
+        key = MetricsCache.key(code)
+        MetricsCache.__remember(key, metrics)
+        if MetricsCache.__db() is not None:
+            MetricsCache.__db().execute('INSERT OR REPLACE INTO metrics VALUES (?, ?)', (key, pickle.dumps(metrics, pickle.HIGHEST_PROTOCOL)))
+            MetricsCache.__pending += 1
+            if MetricsCache.__pending >= METRICS_CACHE_COMMIT_INTERVAL:
+                MetricsCache.flush()
+
+    @staticmethod
+    def __remember(key, metrics):
+        if MetricsCache.__max_entries > 0:
+            MetricsCache.__entries[key] = metrics
+            if len(MetricsCache.__entries) > MetricsCache.__max_entries:
+                MetricsCache.__entries.popitem(last=False)
+
+    @staticmethod
+    def flush():
+        """Commits the entries not yet written to the SQLite file."""
+        if MetricsCache.__pending and MetricsCache.__connection_pid == os.getpid():
+            MetricsCache.__connection.commit()
+            MetricsCache.__pending = 0
+
+    @staticmethod
+    def pop_stats():
+        """
+        Returns the cache hits and misses counted by this process since the last call, and resets them.
+
+        Returns:
+            Counter: The 'hits' and 'misses' counts.
+        """
+        stats = Counter(hits=MetricsCache.__hits, misses=MetricsCache.__misses)
+        MetricsCache.__hits = MetricsCache.__misses = 0
+        return stats
+
+
+def worker_settings():
+    """
+    Returns the settings of this process that the worker processes are set up with by init_worker.
+
+    Returns:
+        dict: The settings of each part of the extraction state, by name.
+    """
+    return {
+        'metrics_cache': MetricsCache.settings(),
+        'logger': Logger.worker_settings(),
+        'progress': Progress.worker_settings(),
+        'profiler': Profiler.worker_settings()
+    }
+
+def init_worker(settings: dict):
+    """
+    Sets up a worker process as the main process is set up, from the settings returned by worker_settings.
+
+    Runs in each worker process of a process_pool as it starts, so the workers do not rely on inheriting
+    the state of the main process by fork: they work the same with the spawn and forkserver start methods.
+
+    Parameters:
+        settings (dict): The settings returned by worker_settings in the main process.
+    """
+    MetricsCache.configure(*settings['metrics_cache'])
+    if settings['logger'] is not None:
+        Logger.configure_worker(*settings['logger'])
+    if settings['progress'] is not None:
+        Progress.configure_worker(*settings['progress'])
+    if settings['profiler'] is not None:
+        Profiler.configure_worker(*settings['profiler'])
+
+def process_pool(workers: int):
+    """
+    Returns a pool of worker processes set up by init_worker with the settings of this process. Must be
+    called once this process is set up.
+
+    Parameters:
+        workers (int): The number of worker processes.
+    """
+    return concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(worker_settings(),))
+
+
+class DatasetFilter:
+    """
+    Selects the semesters, courses, users and assignments to extract.
+
+    The checks only need names and are made before anything is read, so filtered-out subtrees are never
+    opened or parsed. Assignments are selected by their open and close dates, so the files of a user that
+    belong to a rejected assignment are skipped as well. Every decision is recorded to report how many
+    entities were processed and skipped.
+
+    Users can also be sampled: each user directory is kept or dropped as a whole depending on a hash of
+    the seed and its semester, course and user id, so the same users are picked on every run and in every
+    release of the dataset, and about the requested fraction of the users of each course is kept.
+
+    Attributes:
+        semesters (set): The semester descriptions to extract, or None for all.
+        courses (set): The course codes to extract, or None for all.
+        users (set): The user ids to extract, or None for all.
+        assignments_from (str): Only assignments opened on or after this ISO date are extracted.
+        assignments_until (str): Only assignments closed on or before this ISO date are extracted.
+        sample_fraction (float): The fraction of the users of each course to extract, or None for all.
+        sample_seed (int): The seed that picks the sampled users.
+        skipped_assignments (defaultdict): The rejected assignment codes of each (semester, course).
+    """
+
+    def __init__(self, semesters=None, courses=None, users=None, assignments_from=None, assignments_until=None,
+                 sample_fraction=None, sample_seed=0):
+        self.semesters = set(semesters) if semesters is not None else None
+        self.courses = set(courses) if courses is not None else None
+        self.users = set(users) if users is not None else None
+        self.assignments_from = assignments_from
+        self.assignments_until = assignments_until
+        self.sample_fraction = sample_fraction
+        self.sample_seed = sample_seed
+        self.skipped_assignments = defaultdict(set)
+        self.__decisions = defaultdict(dict) # Whether each entity was selected, by entity kind and key
+
+    def has_date_window(self):
+        """Returns whether assignments are filtered by date."""
+        return self.assignments_from is not None or self.assignments_until is not None
+
+    def __decide(self, kind, key, selected):
+        self.__decisions[kind][key] = selected
+        return selected
+
+    def select_semester(self, semester: str):
+        """Returns whether a semester is extracted."""
+        return self.__decide('semesters', semester, self.semesters is None or semester in self.semesters)
+
+    def select_course(self, semester: str, course: str):
+        """Returns whether a course is extracted."""
+        return self.__decide('courses', (semester, course), self.courses is None or course in self.courses)
+
+    def select_user(self, semester: str, course: str, user: str):
+        """Returns whether a user directory is extracted."""
+        selected = (self.users is None or user in self.users) and self.sampled(semester, course, user)
+        return self.__decide('users', (semester, course, user), selected)
+
+    def sampled(self, semester: str, course: str, user: str):
+        """Returns whether a user is part of the sample (always True when not sampling)."""
+        if self.sample_fraction is None:
+            return True
+        digest = hashlib.sha256(f'{self.sample_seed}/{semester}/{course}/{user}'.encode(DEFAULT_FILE_ENCODING)).digest()
+        return int.from_bytes(digest[:8], 'big') < self.sample_fraction * 2 ** 64
+
+    def select_assignment(self, assignment: model.Assignment):
+        """Returns whether an assignment is extracted, given its open and close dates."""
+        selected = ((self.assignments_from is None or (assignment.open_date or '')[:10] >= self.assignments_from) and
+                    (self.assignments_until is None or (assignment.close_date or '')[:10] <= self.assignments_until))
+        if not selected:
+            self.skipped_assignments[(assignment.semester, assignment.course)].add(assignment.code)
+        return self.__decide('assignments', (assignment.semester, assignment.course, assignment.code), selected)
+
+    @staticmethod
+    def file_assignment(name: str):
+        """Returns the assignment code of a user file name ('<assignment>_<problem>.log', '<assignment>.log', ...)."""
+        return os.path.splitext(name)[0].split('_')[0]
+
+    def summary(self):
+        """Returns the number of processed and skipped entities of each kind, as text."""
+        counts = []
+        for kind in ['semesters', 'courses', 'users', 'assignments']:
+            decisions = self.__decisions[kind].values()
+            processed = sum(decisions)
+            counts.append(f'{kind} {processed} processed, {len(decisions) - processed} skipped')
+        return '; '.join(counts)
+
+
+def scan_directory(path: str):
+    """Returns the entries of a directory sorted by name, so every run visits them in the same order."""
+    return sorted(os.scandir(path), key=lambda entry: entry.name)
+
+def open_data_file(path: str, file=None, key: int = None):
+    """
+    Opens a dataset file for reading as text.
+
+    Parameters:
+        path (str): The path to the data file.
+        file (file object, optional): A binary stream with the file content (e.g. an in-memory tar member).
+            When provided, it is read instead of opening 'path'.
+        key (int, optional): The dataset code the file is extracted to, under which the file is counted
+            by the progress report.
+
+    Returns:
+        TextIO: A text stream decoded with the default file encoding.
+    """
+    if file is None:
+        f = open(path, mode='r', encoding=DEFAULT_FILE_ENCODING)
+        if key is not None and Progress.enabled():
+            Progress.count_file(key, os.fstat(f.fileno()).st_size)
+        return f
+    if key is not None and Progress.enabled():
+        position = file.tell()
+        Progress.count_file(key, file.seek(0, io.SEEK_END) - position)
+        file.seek(position)
+    return io.TextIOWrapper(file, encoding=DEFAULT_FILE_ENCODING)
+
 
 def extract_semester(path: str):
     """
@@ -344,17 +1244,31 @@ def extract_course(semester: str, code: str, path: str):
     for entry in os.scandir(os.path.join(path, 'assessments')):
         # If the 'entry' is a file with the '.data' extension, it corresponds to an activity
         if entry.is_file() and entry.path.endswith(DATA_FILE_EXTENSION):
-            with open(entry.path, 'rb') as f:
-                line = f.readline().decode(DEFAULT_FILE_ENCODING)
-                while line:
-                    # Title example: ---- class name: Introduction to Computer Programming
-                    if line.startswith('---- class name:'):
-                        desc = line.strip()[17:]
-                        break
-                    line = f.readline().decode(DEFAULT_FILE_ENCODING)
+            desc = extract_class_name(entry.path) or desc
     return model.Course(semester, code, desc)
 
-def extract_assignment(semester: str, course: str, path: str):
+def extract_class_name(path: str, file=None):
+    """
+    Extracts the course (class) name from an assignment file.
+
+    Parameters:
+        path (str): The path to the assignment file.
+        file (file object, optional): A binary stream with the file content, read instead of 'path'.
+
+    Returns:
+        str: The class name, or None if the file has no class name line.
+    """
+    with open(path, 'rb') if file is None else file as f:
+        line = f.readline().decode(DEFAULT_FILE_ENCODING)
+        while line:
+            # Title example: ---- class name: Introduction to Computer Programming
+            if line.startswith('---- class name:'):
+                return line.strip()[17:]
+            line = f.readline().decode(DEFAULT_FILE_ENCODING)
+    return None
+
+@profiled('extract_assignment')
+def extract_assignment(semester: str, course: str, path: str, file=None):
     """
     Extracts assignment information from a file and creates an Assignment object.
 
@@ -362,13 +1276,14 @@ def extract_assignment(semester: str, course: str, path: str):
         semester (str): The semester of the assignment.
         course (str): The course of the assignment.
         path (str): The path to the assignment file.
+        file (file object, optional): A binary stream with the file content, read instead of 'path'.
 
     Returns:
         Assignment: An Assignment object containing the extracted information.
     """
     new_assignment = model.Assignment(semester, course, os.path.splitext(os.path.basename(path))[0])
     
-    with open(path, mode='r', encoding=DEFAULT_FILE_ENCODING) as f:
+    with open_data_file(path, file, CODE_ASSIGNMENT) as f:
         lines = f.readlines()
         # Extract assignment details from specific lines in the file
         new_assignment.title = lines[1][23:].strip()
@@ -388,7 +1303,8 @@ def extract_assignment(semester: str, course: str, path: str):
 
     return new_assignment
 
-def extract_user(semester: str, course: str, path: str):
+@profiled('extract_user')
+def extract_user(semester: str, course: str, path: str, file=None):
     """
     Extracts user information from a file and creates a User object.
 
@@ -396,6 +1312,7 @@ def extract_user(semester: str, course: str, path: str):
         semester (str): The semester of the user.
         course (str): The course of the user.
         path (str): The path to the user data directory.
+        file (file object, optional): A binary stream with the 'user.data' content, read instead of the file in 'path'.
 
     Returns:
         User: A User object containing the extracted information.
@@ -403,7 +1320,7 @@ def extract_user(semester: str, course: str, path: str):
     new_user = model.User(semester, course, os.path.basename(path))
     
     dict_obj = {}
-    with open(os.path.join(path, USER_DATA_FILENAME), mode='r', encoding=DEFAULT_FILE_ENCODING) as f:
+    with open_data_file(os.path.join(path, USER_DATA_FILENAME), file, CODE_USER) as f:
         # Parse user data into a dictionary
         for line in f.readlines():
             if line.startswith('----'):
@@ -419,9 +1336,13 @@ def extract_user(semester: str, course: str, path: str):
 
     return new_user
 
-def extract_executions(semester: str, course: str, assignment: str, user: str, problem: str, path: str):
+@profiled('extract_executions')
+def extract_executions(semester: str, course: str, assignment: str, user: str, problem: str, path: str, file=None, extract_metrics=None):
     """
-    Extracts execution details from a given file and returns a list of Execution objects.
+    Extracts execution details from a given file, yielding one Execution object per execution.
+
+    The file is read incrementally and each execution is yielded as soon as its section is complete,
+    so only one section of the log is kept in memory at a time.
 
     Parameters:
         semester (str): The current semester.
@@ -430,20 +1351,47 @@ def extract_executions(semester: str, course: str, assignment: str, user: str, p
         user (str): The user's identifier.
         problem (str): The specific problem.
         path (str): Path to the file containing execution data.
+        file (file object, optional): A binary stream with the file content, read instead of 'path'.
+        extract_metrics (function, optional): Called with each Execution object and its code in place of
+            extract_code_metrics, e.g. to compute the metrics later in another process.
 
-    Returns:
-        list: A list of Execution objects with extracted information.
+    Yields:
+        Execution: The Execution objects with extracted information, in file order.
     """
-    seq_attempt = 0  # Initialize the sequence attempt counter
-    executions = []  # Initialize the list to hold Execution objects
+    # Open the file with the specified encoding and read it section by section
+    with open_data_file(path, file, CODE_EXECUTION) as arquivo:
+        sections = iter_execution_sections(arquivo)
+        yield from _parse_executions(semester, course, assignment, user, problem, sections, extract_metrics or extract_code_metrics)
+
+def iter_execution_sections(f):
+    """
+    Splits an execution log into its sections, reading it line by line.
 
-    # Open the file with the specified encoding and read its content
-    with open(path, mode='r', encoding=DEFAULT_FILE_ENCODING) as arquivo:
-        content = arquivo.read()
+    Sections are separated by the EXECUTION_DELIMITER. The result is the same as splitting the whole
+    file content on the delimiter, but only the current section is held in memory.
 
-    # Split the content into sections by the delimiter that separates each execution
-    sections = content.split('*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*-*')
+    Parameters:
+        f (TextIO): The open execution log.
 
+    Yields:
+        str: The text of each section, in file order.
+    """
+    section = []
+    for line in f:
+        if EXECUTION_DELIMITER in line:
+            first, *others = line.split(EXECUTION_DELIMITER)
+            section.append(first)
+            yield ''.join(section)
+            # Any text between two delimiters on the same line is a section on its own
+            yield from others[:-1]
+            section = [others[-1]]
+        else:
+            section.append(line)
+    yield ''.join(section)
+
+def _parse_executions(semester, course, assignment, user, problem, sections, extract_metrics):
+    """Builds an Execution object from each execution log section."""
+    seq_attempt = 0  # Initialize the sequence attempt counter
     for section in sections:
         section = section.strip()  # Remove leading/trailing whitespace
         if not section:
@@ -489,17 +1437,16 @@ def extract_executions(semester: str, course: str, assignment: str, user: str, p
 
         # If there was no error, call a function to extract metrics from the student's code
         if not execution.has_err:
-            extract_code_metrics(execution, student_code_str)
+            extract_metrics(execution, student_code_str)
 
-        # Add the Execution object to the list of executions
-        executions.append(execution)
+        # Hand the Execution object over as soon as it is complete
+        yield execution
         # Increment the attempt sequence number for the next execution
         seq_attempt += 1
 
-    return executions  # Return the list of Execution objects
 
-
-def extract_solution(semester: str, course: str, assignment: str, user: str, problem: str, path: str):
+@profiled('extract_solution')
+def extract_solution(semester: str, course: str, assignment: str, user: str, problem: str, path: str, file=None, extract_metrics=None):
     """
     Extracts solution metrics for a given problem based on the code stored in a file.
 
@@ -514,6 +1461,9 @@ def extract_solution(semester: str, course: str, assignment: str, user: str, pro
         user (str): The user who submitted the solution.
         problem (str): The specific problem the solution is for.
         path (str): The file path where the solution code is stored.
+        file (file object, optional): A binary stream with the file content, read instead of 'path'.
+        extract_metrics (function, optional): Called with the SolutionMetrics object and the code in place of
+            extract_code_metrics, e.g. to compute the metrics later in another process.
 
     Returns:
         A SolutionMetrics object populated with the extracted metrics.
@@ -522,55 +1472,273 @@ def extract_solution(semester: str, course: str, assignment: str, user: str, pro
     solution = model.SolutionMetrics(semester, course, assignment, user, problem)
 
     # Open the file containing the solution code and extract metrics
-    with open(path, mode='r', encoding=DEFAULT_FILE_ENCODING) as f:
+    with open_data_file(path, file, CODE_SOLUTION) as f:
         # Directly pass the file content to extract_code_metrics
-        extract_code_metrics(solution, f.read())
+        (extract_metrics or extract_code_metrics)(solution, f.read())
 
     # Return the populated SolutionMetrics object
     return solution
 
+class ParsedCode:
+    """
+    Source code lexed and parsed once, shared by the metric groups of extract_code_metrics.
+
+    The token list and the AST are built on first use. When building one of them fails, the type
+    and arguments of the error are kept and a new error is raised to every metric group that needs
+    it, so each group reports the same error it would report when parsing the code on its own. The
+    error itself is not kept, as its traceback would hold the frames of the failed call alive.
+
+    Attributes:
+        code (str): The source code.
+    """
+
+    def __init__(self, code: str):
+        self.code = code
+        self.__tree = self.__tree_error = None
+        self.__tokens = self.__tokens_error = None
+
+    @property
+    def tree(self):
+        """The AST of the code, as built by 'ast.parse'."""
+        if self.__tree is None and self.__tree_error is None:
+            try:
+                self.__tree = parse_code(self.code)
+            except BaseException as err:
+                self.__tree_error = (type(err), err.args)
+        if self.__tree_error is not None:
+            error_type, error_args = self.__tree_error
+            raise error_type(*error_args)
+        return self.__tree
+
+    @property
+    def tokens(self):
+        """The tokens of the code, as generated by 'tokenize.generate_tokens'."""
+        if self.__tokens is None:
+            self.__tokens = []
+            try:
+                tokenize_code(self.code, self.__tokens)
+            except BaseException as err:
+                self.__tokens_error = (type(err), err.args)
+        if self.__tokens_error is not None:
+            error_type, error_args = self.__tokens_error
+            raise error_type(*error_args)
+        return self.__tokens
+
+    def iter_tokens(self):
+        """
+        Yields the tokens of the code like 'tokenize.generate_tokens' does.
+
+        When tokenizing fails, the tokens found before the error are yielded and then the error is raised.
+        """
+        try:
+            yield from self.tokens
+        except BaseException:
+            yield from self.__tokens
+            raise
+
+
+@profiled('parse', code=True)
+def parse_code(code: str):
+    """Returns the AST of a code, as built by 'ast.parse'."""
+    return ast.parse(code)
+
+@profiled('tokenize', code=True)
+def tokenize_code(code: str, tokens: list):
+    """Adds the tokens of a code, as generated by 'tokenize.generate_tokens', to a list; the tokens found before an error are kept."""
+    for tk in tokenize.generate_tokens(io.StringIO(code).readline):
+        tokens.append(tk)
+
 def extract_code_metrics(obj, code: str):
     """
     Extracts various metrics from the provided source code and sets them as attributes of the given object.
 
-    The metrics include complexity metrics, size metrics, Halstead metrics, and token counts. Each metric is extracted
-    in a separate try-except block to handle potential errors independently.
+    The metrics include complexity metrics, size metrics, Halstead metrics, and token counts. Metrics already
+    computed for the very same code are taken from the MetricsCache, and the errors raised while computing
+    them are logged again, so the logs and the error counts do not depend on the cache.
 
     Args:
         obj: The object to which the extracted metrics will be set as attributes.
         code: The source code from which metrics are extracted.
     """
-    extract_complexity_metrics(obj, code)
-    extract_size_metrics(obj, code)
-    extract_halstead_metrics(obj, code)
-    extract_token_metrics(obj, code)
+    metrics = MetricsCache.lookup(code)
+    if metrics is None:
+        metrics = compute_code_metrics(code)
+        MetricsCache.store(code, metrics)
+    else:
+        Logger.replay_metrics_errors(metrics.get(METRICS_ERRORS_KEY, ()))
+    apply_code_metrics(obj, metrics)
+
+def apply_code_metrics(obj, metrics: dict):
+    """
+    Sets the computed metrics of a code as attributes of the given object.
 
-def extract_complexity_metrics(obj: Any, code: str) -> None:
+    Args:
+        obj: The object to which the metrics will be set as attributes.
+        metrics: The metric values by attribute name, as returned by compute_code_metrics.
+    """
+    if Progress.enabled():
+        Progress.count_code()
+    for attr, value in metrics.items():
+        # Metrics without a column in the object (e.g. the radon names of an Execution) are not kept
+        if attr != METRICS_ERRORS_KEY and hasattr(obj, attr):
+            setattr(obj, attr, value)
+
+def compute_code_metrics(code: str):
+    """
+    Computes the metrics of the provided source code.
+
+    Each metric is extracted in a separate try-except block to handle potential errors independently. The code
+    is parsed into an AST and tokenized only once, and both are shared by the metric groups.
+
+    Args:
+        code: The source code from which metrics are extracted.
+
+    Returns:
+        dict: The metric values by attribute name, and the errors logged by metrics_error, if any, under
+            METRICS_ERRORS_KEY.
+    """
+    metrics = types.SimpleNamespace()
+    parsed = ParsedCode(code)
+    errors = []
+    extract_complexity_metrics(metrics, code, parsed, errors)
+    extract_size_metrics(metrics, code, parsed, errors)
+    extract_halstead_metrics(metrics, code, parsed, errors)
+    extract_token_metrics(metrics, code, parsed, errors)
+    if errors:
+        setattr(metrics, METRICS_ERRORS_KEY, errors)
+    return vars(metrics)
+
+@profiled('complexity_metrics', code=True)
+def extract_complexity_metrics(obj: Any, code: str, parsed: ParsedCode = None, errors: list = None) -> None:
     """Extracts and sets complexity-related metrics as attributes of the object."""
     try:
-        v = ComplexityVisitor.from_code(code)
+        v = ComplexityVisitor.from_ast((parsed or ParsedCode(code)).tree)
         for attr in ['complexity', 'classes', 'functions', 'functions_complexity', 'classes_complexity', 'total_complexity', 'blocks']:
             setattr(obj, attr, getattr(v, attr))
     except BaseException as err:
-        Logger.error(f'\t\tError while extracting code complexity metrics: {err}')
+        Logger.metrics_error('complexity', f'\t\tError while extracting code complexity metrics: {err}', err, errors)
 
-def extract_size_metrics(obj: Any, code: str) -> None:
+@profiled('size_metrics', code=True)
+def extract_size_metrics(obj: Any, code: str, parsed: ParsedCode = None, errors: list = None) -> None:
     """Extracts and sets size-related metrics as attributes of the object."""
     try:
-        a = analyze(code)
+        a = analyze_raw_metrics(parsed or ParsedCode(code))
         for attr in ['loc', 'lloc', 'sloc', 'blank', 'comments', 'single_comments', 'multi']:
             setattr(obj, attr, getattr(a, attr))
     except BaseException as err:
-        Logger.error(f'\t\tError while extracting code size based metrics: {err}')
+        Logger.metrics_error('size', f'\t\tError while extracting code size based metrics: {err}', err, errors)
 
-def extract_halstead_metrics(obj: Any, code: str) -> None:
+@profiled('halstead_metrics', code=True)
+def extract_halstead_metrics(obj: Any, code: str, parsed: ParsedCode = None, errors: list = None) -> None:
     """Extracts and sets Halstead complexity metrics as attributes of the object."""
     try:
-        h = h_visit(code)
+        h = h_visit_ast((parsed or ParsedCode(code)).tree)
         for attr in ['h1', 'h2', 'N1', 'N2', 'vocabulary', 'length', 'calculated_length', 'volume', 'difficulty', 'effort', 'bugs', 'time']:
             setattr(obj, attr, getattr(h.total, attr))
     except BaseException as err:
-        Logger.error(f'\t\tError while extracting halsted code metrics: {err}')
+        Logger.metrics_error('halstead', f'\t\tError while extracting halsted code metrics: {err}', err, errors)
+
+def analyze_raw_metrics(parsed: ParsedCode):
+    """
+    Computes the same raw size metrics as 'radon.raw.analyze' from the tokens of the whole code.
+
+    'radon.raw.analyze' tokenizes the code again for every line, retrying with one more line each time a
+    statement spans several lines. Here each logical line is taken from the shared token list instead, and
+    the radon counting rules are applied to it. Code whose lines cannot be mapped one-to-one to the radon
+    ones (tokenizing errors, unusual line separators, unbalanced brackets) falls back to radon.
+
+    Parameters:
+        parsed (ParsedCode): The parsed source code.
+
+    Returns:
+        SimpleNamespace: The loc, lloc, sloc, comments, multi, blank and single_comments of the code.
+    """
+    code = parsed.code
+    if any(separator in code for separator in RAW_METRICS_FALLBACK_CHARS):
+        return analyze(code)
+    try:
+        tokens = parsed.tokens
+    except BaseException:
+        return analyze(code)
+
+    lines = [line.strip() for line in code.splitlines()]
+    lloc = comments = single_comments = multi = blank = sloc = 0
+    next_row, depth, chunk = 1, 0, []
+    for tk in tokens:
+        if tk.type == tokenize.ERRORTOKEN or depth < 0:
+            return analyze(code)
+        if tk.type in (tokenize.INDENT, tokenize.DEDENT, tokenize.ENDMARKER):
+            continue
+        chunk.append(tk)
+        if tk.type == tokenize.OP and tk.string in ('(', '[', '{'):
+            depth += 1
+        elif tk.type == tokenize.OP and tk.string in (')', ']', '}'):
+            depth -= 1
+        if tk.type == tokenize.NEWLINE or (tk.type == tokenize.NL and depth == 0):
+            # A logical line is complete: it spans the rows up to the one holding its end token
+            parsed_lines = lines[next_row - 1:tk.start[0]]
+            next_row = tk.start[0] + 1
+            # Radon does not continue a line ending with a backslash on a blank line, the tokenizer does
+            if any(line.endswith('\\') and not next_line for line, next_line in zip(parsed_lines, parsed_lines[1:])):
+                return analyze(code)
+            # Only line ends may follow the first token of a lone comment or string
+            single = all(t.type in (tokenize.NL, tokenize.NEWLINE) for t in chunk[1:])
+
+            comments += sum(1 for t in chunk if t.type == tokenize.COMMENT)
+            if single and chunk[0].type == tokenize.COMMENT:
+                single_comments += 1
+            elif single and chunk[0].type == tokenize.STRING:
+                if chunk[0].start[0] == chunk[0].end[0]:
+                    single_comments += 1
+                else:
+                    multi += sum(1 for l in parsed_lines if l)
+                    blank += sum(1 for l in parsed_lines if not l)
+            else:
+                for parsed_line in parsed_lines:
+                    if parsed_line:
+                        sloc += 1
+                    else:
+                        blank += 1
+            lloc += count_logical_lines(chunk)
+            chunk = []
+
+    if chunk or depth != 0 or next_row != len(lines) + 1:
+        return analyze(code)
+
+    loc = sloc + blank + multi + single_comments
+    return types.SimpleNamespace(loc=loc, lloc=lloc, sloc=sloc, comments=comments, multi=multi, blank=blank, single_comments=single_comments)
+
+def count_logical_lines(chunk: list):
+    """
+    Counts the logical lines of the tokens of a line like 'radon.raw.analyze' does.
+
+    Each statement separated by ';' counts as one logical line, or as two when a ':' is followed by
+    more code (e.g. 'if x: y'); statements made only of comments and line ends do not count. As radon
+    tokenizes each line on its own, its last statement also ends with an ENDMARKER token, which is
+    taken into account when telling whether the ':' is the last token.
+
+    Parameters:
+        chunk (list): The tokens of the line, without INDENT, DEDENT and ENDMARKER tokens.
+
+    Returns:
+        int: The number of logical lines.
+    """
+    lloc = 0
+    statements = [[]]
+    for tk in chunk:
+        if tk.type == tokenize.OP and tk.string == ';':
+            statements.append([])
+        elif tk.type not in (tokenize.COMMENT, tokenize.NL, tokenize.NEWLINE):
+            statements[-1].append(tk)
+    for i, statement in enumerate(statements):
+        # The ENDMARKER of the last statement counts as one more token after the colon
+        n_tokens = len(statement) + (i == len(statements) - 1)
+        colons = [j for j, tk in enumerate(statement) if tk.type == tokenize.OP and tk.string == ':']
+        if colons:
+            lloc += 2 - (colons[-1] == n_tokens - 2)
+        elif statement:
+            lloc += 1
+    return lloc
 
 def __analyze_tokens(tokens, token_count, unique_identifiers, unique_strings, unique_btype, unique_bfunc):
     for tk in tokens:
@@ -610,33 +1778,38 @@ def __set_token_attributes(obj, unique_identifiers, unique_btype, unique_bfunc):
     setattr(obj, 'identifiers_min_len', min([len(x) for x in unique_identifiers]) if unique_identifiers else 0)
     setattr(obj, 'identifiers_mean_len', statistics.mean([len(x) for x in unique_identifiers]) if unique_identifiers else 0)
 
-def extract_token_metrics(obj: Any, code: str) -> None:
+@profiled('token_metrics', code=True)
+def extract_token_metrics(obj: Any, code: str, parsed: ParsedCode = None, errors: list = None) -> None:
     """Extracts and sets token count metrics as attributes of the object."""
     try:
         # Token analysis initialization
         token_count = defaultdict(int)
         unique_identifiers, unique_strings, unique_btype, unique_bfunc = set(), set(), set(), set()
-        
-        # Temporary code file writing and token extraction
-        temp_file_path = os.path.join(os.getcwd(), 'temp_code.py')
-        with open(temp_file_path, mode='w', encoding=DEFAULT_FILE_ENCODING) as temp_code:
-            temp_code.write(code)
-        with tokenize.open(temp_file_path) as f:
-            try:
-                tokens = tokenize.generate_tokens(f.readline)
-                __analyze_tokens(tokens, token_count, unique_identifiers, unique_strings, unique_btype, unique_bfunc)
-            except BaseException as err:
-                pass
+
+        # The code is decoded like 'tokenize.open' decodes a source file: honouring a BOM or an encoding cookie
+        # and translating line endings. Plain UTF-8 code decodes back to the very same text, so its tokens can
+        # be shared with the other metric groups.
+        data = code.encode(DEFAULT_FILE_ENCODING)
+        encoding, _ = tokenize.detect_encoding(io.BytesIO(data).readline)
+        try:
+            if encoding == DEFAULT_FILE_ENCODING and '\r' not in code:
+                tokens = (parsed or ParsedCode(code)).iter_tokens()
+            else:
+                tokens = tokenize.generate_tokens(io.TextIOWrapper(io.BytesIO(data), encoding, line_buffering=True).readline)
+            __analyze_tokens(tokens, token_count, unique_identifiers, unique_strings, unique_btype, unique_bfunc)
+        except BaseException as err:
+            pass
 
         # Setting token count attributes
         for k, v in Counter(token_count).items():
             setattr(obj, TOKEN_NAMES[k], v)
         __set_token_attributes(obj, unique_identifiers, unique_btype, unique_bfunc)
     except BaseException as err:
-        Logger.error(f'\t\tError while extracting code token based metrics: {err}')
+        Logger.metrics_error('token', f'\t\tError while extracting code token based metrics: {err}', err, errors)
         
 
-def extract_user_logins(semester, course, user, path: str):
+@profiled('extract_user_logins')
+def extract_user_logins(semester, course, user, path: str, file=None):
     """
     Extracts user login information from a specified file.
     
@@ -645,20 +1818,22 @@ def extract_user_logins(semester, course, user, path: str):
         course (str): The course of the user.
         user (str): The user identifier.
         path (str): The path to the file containing login data.
+        file (file object, optional): A binary stream with the file content, read instead of 'path'.
     
     Returns:
         list: A list of Login objects created from the file data.
     """
     user_logins = []
-    with open(path, mode='r', encoding=DEFAULT_FILE_ENCODING) as file:
-        for line in file: # Direct iteration to save memory
+    with open_data_file(path, file, CODE_LOGIN) as f:
+        for line in f: # Direct iteration to save memory
             parts = line.split('#') # Strip to remove newline and split on '#'
             login_date, login_time = parts[0][:10], parts[0][11:]
             event = parts[1][:-1]  # Assume removing the last character is to remove newline, strip is used earlier
             user_logins.append(model.Login(semester, course, user, login_date, login_time, event))
     return user_logins
 
-def extract_grade(semester, course, assignment, user, path: str):
+@profiled('extract_grade')
+def extract_grade(semester, course, assignment, user, path: str, file=None):
     """
     Extracts a grade from a specified file.
     
@@ -668,16 +1843,17 @@ def extract_grade(semester, course, assignment, user, path: str):
         assignment (str): The assignment associated with the grade.
         user (str): The user identifier.
         path (str): The path to the file containing the grade data.
+        file (file object, optional): A binary stream with the file content, read instead of 'path'.
     
     Returns:
         Grade: A Grade object created from the file data.
     """
-    with open(path, mode='r', encoding=DEFAULT_FILE_ENCODING) as file:
-        grade_line = file.readline().strip()
-        np_line = file.readline()  # Skip line not needed
-        correct_line = file.readline().strip()
-        wrong_line = file.readline().strip()
-        blank_line = file.readline().strip()
+    with open_data_file(path, file, CODE_GRADE) as f:
+        grade_line = f.readline().strip()
+        np_line = f.readline()  # Skip line not needed
+        correct_line = f.readline().strip()
+        wrong_line = f.readline().strip()
+        blank_line = f.readline().strip()
     
     # Extract the actual data after known prefixes
     grade = grade_line[19:]
@@ -688,7 +1864,8 @@ def extract_grade(semester, course, assignment, user, path: str):
     return model.Grade(semester, course, assignment, user, grade, n_problems, correct, wrong, blank)
  
 
-def extract_codemirror_events(semester, course, assignment, user, problem, path: str):
+@profiled('extract_codemirror_events')
+def extract_codemirror_events(semester, course, assignment, user, problem, path: str, file=None):
     """
     Extracts CodeMirror events from a given file.
 
@@ -703,13 +1880,14 @@ def extract_codemirror_events(semester, course, assignment, user, problem, path:
         user (str): The user identifier.
         problem (str): The problem identifier.
         path (str): Path to the file containing the events.
+        file (file object, optional): A binary stream with the file content, read instead of 'path'.
 
     Returns:
         list: A list of CodeMirror event objects.
     """
     codemirror_events = []
-    with open(path, mode='r', encoding=DEFAULT_FILE_ENCODING) as file:
-        for line in file: # Iterate through each line in the file
+    with open_data_file(path, file, CODE_CODEMIRROR) as f:
+        for line in f: # Iterate through each line in the file
             if CODEMIRROR_PATTERN.match(line): # Filter lines matching the pattern
                 datetime_str, action_str = line.strip().split('#', 1) # Split the line by '#' and strip whitespace
                 date_str, time_str = datetime_str.split(' ')
@@ -757,3 +1935,224 @@ def save_to_csv(data_dict):
             # - encoding='utf-8': Encode the file using UTF-8.
             # - quoting=2: Quote all text fields to handle commas within text correctly.
             df.to_csv(f'{CSV_FILE_OUTPUT_DIR}/{CSV_FILENAMES[key]}', sep=',', index=False, encoding='utf-8', quoting=2)
+
+
+class BatchWriter:
+    """
+    Base class of the writers that save the rows of one dataset to disk in fixed-size batches.
+
+    It takes rows through 'append' and 'extend', like the row lists it replaces, and hands them to
+    'write_batch' every 'batch_size' rows, so memory use does not grow with the dataset size.
+
+    Attributes:
+        key (int): The dataset code (CODE_SEMESTER, CODE_COURSE, ...).
+        batch_size (int): Number of rows buffered before they are written.
+        n_rows (int): Number of rows received so far.
+        write_time (float): Seconds spent writing the batches.
+        kept_rows (list): Every row received, when keep_rows was called (used for the few semester rows); None otherwise.
+    """
+
+    def __init__(self, key: int, batch_size: int = CSV_BATCH_SIZE):
+        self.key = key
+        self.batch_size = batch_size
+        self.n_rows = 0
+        self.write_time = 0.0
+        self.kept_rows = None
+        self.__rows = []
+
+    def keep_rows(self):
+        """Keeps every row received from now on in kept_rows, besides writing them."""
+        self.kept_rows = []
+
+    def append(self, row):
+        """Adds a row, writing the buffered batch out once it is full."""
+        self.__rows.append(row)
+        self.n_rows += 1
+        if self.kept_rows is not None:
+            self.kept_rows.append(row)
+        if len(self.__rows) >= self.batch_size:
+            self.flush()
+
+    def extend(self, rows):
+        """Adds several rows, writing each batch out once it is full."""
+        for row in rows:
+            self.append(row)
+
+    def flush(self):
+        """Writes the buffered rows to disk."""
+        if self.__rows:
+            start = time.perf_counter()
+            self.write_batch(self.__rows)
+            self.write_time += time.perf_counter() - start
+            self.__rows = []
+
+    def write_batch(self, rows):
+        """Writes a batch of rows to disk."""
+        pass
+
+    def close(self):
+        """Writes the remaining rows and closes the output files."""
+        self.flush()
+
+
+class CsvWriter(BatchWriter):
+    """
+    Writes the rows of one dataset to its '.csv' file in fixed-size batches.
+
+    The file is opened and the header written when the first batch is flushed; datasets without rows
+    produce no file, as in save_to_csv. Rows are written like save_to_csv writes them: comma separated,
+    in UTF-8 and with text fields quoted.
+
+    Attributes:
+        path (str): The path of the '.csv' file.
+    """
+
+    def __init__(self, key: int, batch_size: int = CSV_BATCH_SIZE):
+        super().__init__(key, batch_size)
+        self.path = os.path.join(CSV_FILE_OUTPUT_DIR, CSV_FILENAMES[key])
+        self.__file = None
+        self.__writer = None
+
+    @profiled('write_csv')
+    def write_batch(self, rows):
+        if self.__file is None:
+            os.makedirs(CSV_FILE_OUTPUT_DIR, exist_ok=True)
+            self.__file = open(self.path, mode='w', encoding=DEFAULT_FILE_ENCODING, newline='')
+            self.__writer = csv.writer(self.__file, quoting=csv.QUOTE_NONNUMERIC, lineterminator=os.linesep)
+            self.__writer.writerow(CSV_HEADERS[self.key]())
+        self.__writer.writerows(rows)
+        self.__file.flush()
+
+    def close(self):
+        super().close()
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+
+class ParquetWriter(BatchWriter):
+    """
+    Writes the rows of one dataset to a Parquet dataset in fixed-size batches.
+
+    Every column gets a fixed type (see parquet_type), so metric columns are read back as numbers.
+    Datasets listed in PARQUET_PARTITION_COLUMNS are split into 'semester=<desc>/course=<code>'
+    directories (hive partitioning), so readers can skip whole semesters or courses. The partition
+    columns are only kept in the directory names, and the remaining key columns are dictionary encoded.
+    Requires the optional 'pyarrow' package.
+
+    Attributes:
+        path (str): The directory of the Parquet dataset.
+        columns (list): The dataset column names.
+        partition_columns (list): The columns used to partition the dataset.
+    """
+
+    def __init__(self, key: int, batch_size: int = CSV_BATCH_SIZE):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as err:
+            raise ImportError("The parquet output format requires the 'pyarrow' package (pip install pyarrow)") from err
+        super().__init__(key, batch_size)
+        self.__pa, self.__pq = pyarrow, pyarrow.parquet
+        self.path = os.path.join(PARQUET_FILE_OUTPUT_DIR, os.path.splitext(CSV_FILENAMES[key])[0])
+        self.columns = CSV_HEADERS[key]()
+        self.partition_columns = PARQUET_PARTITION_COLUMNS.get(key, [])
+        self.__data_columns = [i for i, column in enumerate(self.columns) if column not in self.partition_columns]
+        self.__partition_indexes = [self.columns.index(column) for column in self.partition_columns]
+        self.__schema = pyarrow.schema([(self.columns[i], parquet_type(key, self.columns[i], pyarrow)) for i in self.__data_columns])
+        self.__dictionary_columns = [self.columns[i] for i in self.__data_columns if self.columns[i] in PARQUET_KEY_COLUMNS]
+        self.__writers = OrderedDict() # Open file writers by partition, from the least to the most recently used
+        self.__files = Counter() # Number of files written to each partition
+
+    @profiled('write_parquet')
+    def write_batch(self, rows):
+        if not self.__files:
+            # Part files left by an earlier (possibly interrupted) run would be read as part of the dataset
+            shutil.rmtree(self.path, ignore_errors=True)
+        partitions = OrderedDict()
+        for row in rows:
+            partitions.setdefault(tuple(row[i] for i in self.__partition_indexes), []).append(row)
+        for partition, partition_rows in partitions.items():
+            arrays = [
+                self.__pa.array([parquet_value(row[i], field.type, self.__pa) for row in partition_rows], type=field.type)
+                for i, field in zip(self.__data_columns, self.__schema)
+            ]
+            self.__writer(partition).write_table(self.__pa.Table.from_arrays(arrays, schema=self.__schema))
+
+    def __writer(self, partition):
+        writer = self.__writers.get(partition)
+        if writer is not None:
+            self.__writers.move_to_end(partition)
+            return writer
+        if len(self.__writers) >= PARQUET_MAX_OPEN_FILES:
+            self.__writers.popitem(last=False)[1].close()
+        directory = os.path.join(self.path, *[f'{column}={value}' for column, value in zip(self.partition_columns, partition)])
+        os.makedirs(directory, exist_ok=True)
+        # A partition whose file was closed to spare file handles continues in a new file
+        file_path = os.path.join(directory, f'part-{self.__files[partition]}.parquet')
+        self.__files[partition] += 1
+        writer = self.__writers[partition] = self.__pq.ParquetWriter(file_path, self.__schema, use_dictionary=self.__dictionary_columns)
+        return writer
+
+    def close(self):
+        super().close()
+        for writer in self.__writers.values():
+            writer.close()
+        self.__writers.clear()
+
+
+def parquet_type(key: int, column: str, pa):
+    """
+    Returns the Parquet (pyarrow) type of a dataset column.
+
+    Parameters:
+        key (int): The dataset code.
+        column (str): The column name.
+        pa (module): The pyarrow module.
+
+    Returns:
+        DataType: The column type.
+    """
+    if column in PARQUET_TEXT_COLUMNS.get(key, ()):
+        return pa.string()
+    if column in PARQUET_COLUMN_TYPES:
+        return PARQUET_COLUMN_TYPES[column](pa)
+    headers = CSV_HEADERS[key]()
+    if key in (CODE_EXECUTION, CODE_SOLUTION) and headers.index(column) >= headers.index('complexity'):
+        return pa.float64()
+    return pa.string()
+
+def parquet_value(value, data_type, pa):
+    """Converts a model attribute value into a value of its Parquet column type."""
+    if value is None or not pa.types.is_string(data_type) or isinstance(value, str):
+        return value
+    return str(value)
+
+
+def open_writers(batch_size: int = CSV_BATCH_SIZE, output_format: str = 'csv'):
+    """
+    Creates the writer of every dataset.
+
+    Parameters:
+        batch_size (int): Number of rows buffered for each dataset before they are written.
+        output_format (str): The output file format, one of OUTPUT_FORMATS.
+
+    Returns:
+        dict: The writer of each dataset, by dataset code.
+    """
+    writer_class = OUTPUT_FORMATS[output_format]
+    Logger.info(f'Saving data into disk: {CSV_FILE_OUTPUT_DIR if writer_class is CsvWriter else PARQUET_FILE_OUTPUT_DIR}')
+    return {key: writer_class(key, batch_size) for key in CSV_FILENAMES}
+
+
+def close_writers(writers):
+    """Writes the remaining rows of every dataset and closes their files."""
+    for writer in writers.values():
+        writer.close()
+
+
+# Writer class of each output file format
+OUTPUT_FORMATS = {
+    'csv': CsvWriter,
+    'parquet': ParquetWriter
+}